@@ -0,0 +1,26 @@
+from rest_framework import authentication, exceptions
+
+from .tokens import TokenError, authenticate_access_token
+
+
+class AccessTokenAuthentication(authentication.BaseAuthentication):
+    """Authorization: Bearer <アクセストークン> による認証（DBを参照しない）"""
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = authentication.get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed('Authorization ヘッダーの形式が正しくありません')
+        try:
+            token = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed('トークンが正しくありません')
+        try:
+            return authenticate_access_token(token)
+        except TokenError as e:
+            raise exceptions.AuthenticationFailed(str(e))
+
+    def authenticate_header(self, request):
+        return self.keyword
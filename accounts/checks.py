@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, register
+
+
+# プロセスごとに別の内容を持つ（プロセス間で共有されない）キャッシュ
+LOCAL_CACHE_BACKENDS = (LocMemCache, DummyCache)
+
+
+def is_shared_cache(alias='default'):
+    """キャッシュがプロセス間で共有されるか"""
+    return not isinstance(caches[alias], LOCAL_CACHE_BACKENDS)
+
+
+@register(Tags.caches, Tags.security)
+def check_session_cache(app_configs, **kwargs):
+    if settings.SESSION_ENGINE != 'accounts.sessions.cached_db':
+        return []
+    alias = settings.SESSION_CACHE_ALIAS
+    if is_shared_cache(alias):
+        return []
+    return [
+        Error(
+            f'accounts.sessions.cached_db のセッションには、プロセス間で共有するキャッシュが必要です'
+            f'（CACHES[{alias!r}] がプロセスごとのキャッシュです）',
+            hint='Redis等の共有キャッシュを設定するか、SESSION_ENGINE を accounts.sessions.db にしてください。',
+            id='accounts.E001',
+        )
+    ]
+
+
+@register(Tags.caches, Tags.security)
+def check_shared_cache(app_configs, **kwargs):
+    # トークンの拒否リスト・リフレッシュトークンの使用済みの記録・ログイン試行の件数は
+    # 全プロセスで共有する
+    if not getattr(settings, 'ACCOUNTS_REQUIRE_SHARED_CACHE', True) or is_shared_cache():
+        return []
+    return [
+        Error(
+            'トークンの失効・リフレッシュトークンの使用済みの記録・ログイン試行の制限には、'
+            'プロセス間で共有するキャッシュが必要です（CACHES[\'default\'] がプロセスごとのキャッシュです）',
+            hint='Redis等の共有キャッシュを設定してください（開発環境では ACCOUNTS_REQUIRE_SHARED_CACHE = False）。',
+            id='accounts.E002',
+        )
+    ]
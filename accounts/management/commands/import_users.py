@@ -0,0 +1,51 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from accounts.onboarding import DEFAULT_CHUNK_SIZE, import_users
+
+
+class Command(BaseCommand):
+    help = (
+        'NDJSON形式のユーザーを一括で登録します（1行1ユーザー。username は必須、'
+        'password または password_hash でパスワードを指定）'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='入力ファイル（"-" で標準入力）'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+            help=f'1回のトランザクションで登録するユーザー数（デフォルト: {DEFAULT_CHUNK_SIZE}）'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='パスワードをハッシュ化するプロセス数（1でプロセスプールを使わない。デフォルト: CPU数）'
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--chunk-size と --workers は1以上を指定してください')
+
+        path = options['path']
+        stream = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        progress = {'processed': 0, 'imported': 0, 'failed': 0}
+        try:
+            for progress in import_users(stream, options['chunk_size'], options['workers']):
+                for error in progress['errors']:
+                    self.stderr.write(f'{error["line"]}行目: {error["errors"]}')
+                self.stdout.write(
+                    f'{progress["processed"]}件処理 / {progress["imported"]}件登録 / '
+                    f'{progress["failed"]}件失敗'
+                )
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{progress["imported"]}件のユーザーを登録しました（失敗: {progress["failed"]}件）'
+            )
+        )
@@ -0,0 +1,21 @@
+from django.contrib.sessions.middleware import SessionMiddleware
+
+
+class SessionRefreshMiddleware(SessionMiddleware):
+    """変更されたとき・有効期限の残りが少なくなったときだけセッションを保存するミドルウェア
+
+    SESSION_SAVE_EVERY_REQUEST = False で accounts.sessions.db（.cached_db）と組み合わせて使う。
+    保存のたびに有効期限とCookieの期限が延びるため、閾値以内の誤差でスライド式の有効期限を保つ。
+    """
+
+    def process_response(self, request, response):
+        session = getattr(request, 'session', None)
+        needs_refresh = getattr(session, 'needs_refresh', None)
+        if (needs_refresh is not None and response.status_code < 500
+                and not session.modified and session.session_key):
+            # 残りの確認のための読み込みでは Vary: Cookie を付けない
+            accessed = session.accessed
+            if needs_refresh() and not session.is_empty():
+                session.modified = True
+            session.accessed = accessed
+        return super().process_response(request, response)
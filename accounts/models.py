@@ -1,11 +1,64 @@
-from django.db import models
+import time
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 
+PROFILE_CACHE_PREFIX = 'accounts:profile:'
+PROFILE_VERSION_PREFIX = 'accounts:profile:version:'
+PROFILE_CACHE_TIMEOUT = 60 * 10
+
+
+def profile_cache_key(user_id):
+    return f'{PROFILE_CACHE_PREFIX}{user_id}'
+
+
+def profile_version_key(user_id):
+    return f'{PROFILE_VERSION_PREFIX}{user_id}'
+
+
+def _initial_version():
+    # 版がキャッシュから消えた後も、以前の版と重ならない値から始める
+    return time.time_ns() // 1000
+
+
+class UserProfileManager(models.Manager):
+    def get_cached(self, user):
+        """ユーザーのプロフィールをキャッシュから取得する（なければDBから読んでキャッシュする）
+
+        キャッシュには読み込み前の版と一緒に保存し、現在の版と一致するものだけを使う。
+        DBから読んでいる間に更新・破棄された場合、古い値は古い版で保存されるため使われない。
+        プロフィールがない場合は UserProfile.DoesNotExist を送出する。
+        """
+        key = profile_cache_key(user.pk)
+        version_key = profile_version_key(user.pk)
+        found = cache.get_many([key, version_key])
+        version = found.get(version_key)
+        if version is None:
+            cache.add(version_key, _initial_version(), PROFILE_CACHE_TIMEOUT)
+            version = cache.get(version_key)
+
+        cached = found.get(key)
+        if cached is not None and cached[0] == version:
+            values = cached[1]
+            profile = self.model.from_db(self.db, list(values), list(values.values()))
+        else:
+            profile = self.get(user=user)
+            cache.set(key, (version, profile.cache_values()), PROFILE_CACHE_TIMEOUT)
+        profile.user = user
+        return profile
+
+
 class UserProfile(models.Model):
-    """ユーザープロフィール拡張"""
+    """ユーザープロフィール拡張
+
+    DBから読み込んだ時点の値を保持し、save() では変更されたフィールドだけを更新する
+    （変更がなければ書き込まない）。
+    """
     user = models.OneToOneField(User, on_delete=models.CASCADE, verbose_name='ユーザー')
     bio = models.TextField('自己紹介', max_length=500, blank=True)
     avatar = models.ImageField('アバター', upload_to='avatars/', blank=True, null=True)
@@ -20,6 +73,8 @@ class UserProfile(models.Model):
     created_at = models.DateTimeField('作成日時', auto_now_add=True)
     updated_at = models.DateTimeField('更新日時', auto_now=True)
 
+    objects = UserProfileManager()
+
     class Meta:
         verbose_name = 'ユーザープロフィール'
         verbose_name_plural = 'ユーザープロフィール'
@@ -32,6 +87,72 @@ class UserProfile(models.Model):
         """フルネームを取得"""
         return f"{self.user.first_name} {self.user.last_name}".strip() or self.user.username
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = instance._tracked_values()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        # 読み直した値を読み込み時点の値とする（読み直していないフィールドの変更は残す）
+        current = self._tracked_values()
+        loaded = getattr(self, '_loaded_values', None)
+        if fields is None or loaded is None:
+            self._loaded_values = current
+        else:
+            refreshed = {self._meta.get_field(name).attname for name in fields}
+            self._loaded_values = {
+                **loaded, **{name: value for name, value in current.items() if name in refreshed}
+            }
+
+    def _tracked_values(self):
+        """変更を検出するフィールドの現在の値（未読み込みのフィールドと自動更新の日時は除く）"""
+        deferred = self.get_deferred_fields()
+        values = {}
+        for field in self._meta.concrete_fields:
+            if field.primary_key or field.attname in deferred or getattr(field, 'auto_now', False) \
+                    or getattr(field, 'auto_now_add', False):
+                continue
+            value = field.value_from_object(self)
+            if isinstance(field, models.FileField):
+                value = value.name or ''
+            else:
+                # 文字列で代入された日付なども、読み込んだ値と同じ型にして比べる
+                try:
+                    value = field.to_python(value)
+                except ValidationError:
+                    pass
+            values[field.attname] = value
+        return values
+
+    def get_changed_fields(self):
+        """読み込み後に変更されたフィールド名の一覧"""
+        loaded = getattr(self, '_loaded_values', None)
+        current = self._tracked_values()
+        if loaded is None:
+            return list(current)
+        missing = object()
+        return [name for name, value in current.items() if loaded.get(name, missing) != value]
+
+    def cache_values(self):
+        """キャッシュに保存する値（{attname: 値}、画像はファイル名）"""
+        values = {}
+        for field in self._meta.concrete_fields:
+            value = field.value_from_object(self)
+            values[field.attname] = value.name if isinstance(field, models.FileField) else value
+        return values
+
+    def save(self, *args, **kwargs):
+        if (not args and not self._state.adding and getattr(self, '_loaded_values', None) is not None
+                and not kwargs.get('force_insert') and kwargs.get('update_fields') is None):
+            changed = self.get_changed_fields()
+            if not changed:
+                return
+            kwargs['update_fields'] = [*changed, 'updated_at']
+        super().save(*args, **kwargs)
+        self._loaded_values = self._tracked_values()
+
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -41,6 +162,30 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    """ユーザー保存時にプロフィールも保存"""
-    instance.userprofile.save()
+def save_user_profile(sender, instance, created=False, raw=False, **kwargs):
+    """ユーザー保存時に、読み込み済みのプロフィールに変更があれば保存
+
+    プロフィールを参照していない保存（ログイン時の last_login の更新など）では
+    プロフィールを読み込まない。
+    """
+    if created or raw or not User.userprofile.is_cached(instance):
+        return
+    try:
+        profile = instance.userprofile
+    except UserProfile.DoesNotExist:
+        return
+    profile.save()
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_cached_profile(sender, instance, **kwargs):
+    """コミット後にキャッシュしたプロフィールの版を進めて破棄"""
+    version_key = profile_version_key(instance.user_id)
+
+    def invalidate():
+        try:
+            cache.incr(version_key)
+        except ValueError:
+            # 版がなければ、次の読み込みで以前と重ならない版から始まる
+            pass
+    transaction.on_commit(invalidate)
@@ -0,0 +1,235 @@
+"""会員の一括登録（既存の会員基盤からの移行用）
+
+NDJSON（1行1ユーザー）を全件をメモリに載せずに読み込み、User と UserProfile を
+チャンク単位の bulk_create でまとめて登録する。bulk_create は post_save を送らないため、
+プロフィールはシグナルを使わずに同じチャンクでまとめて作成し、登録後に users_imported を送る。
+
+チャンクの登録が一意制約などで失敗した場合は、そのチャンクだけ1件ずつ登録し直し、
+失敗した行のみをエラーとして報告する。重複の確認はチャンク内とDBに対して行うため、
+メモリに保持するのはチャンク分だけになる（先に登録したチャンクとの重複はDBで検出する）。
+
+平文のパスワード（password）のハッシュ化は1件あたり数百ミリ秒かかるため、プロセスプールで
+並列に行う。ハッシュ化済みのパスワード（password_hash、Django の形式）はそのまま使う。
+どちらもない場合はログインできないパスワードを設定する（パスワード再設定で利用開始する）。
+"""
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+
+from .models import UserProfile
+from .signals import users_imported
+
+
+USER_FIELDS = ['username', 'email', 'first_name', 'last_name', 'is_active', 'date_joined']
+PROFILE_FIELDS = [
+    'bio', 'birth_date', 'email_notifications', 'favorite_cuisine', 'dietary_restrictions',
+]
+
+DEFAULT_CHUNK_SIZE = 1000
+# 1回の進捗報告に含めるエラーの上限
+MAX_REPORTED_ERRORS = 20
+
+
+def _setup_worker():
+    # spawn で起動したワーカーでは設定・アプリが読み込まれていない
+    import django
+    django.setup()
+
+
+def hash_password(password):
+    return make_password(password)
+
+
+class UserImporter:
+    """NDJSONのユーザーをチャンク単位でまとめて登録する
+
+    不正な行・登録済みのユーザー名やメールアドレスの行はスキップし、行番号付きで
+    エラーとして報告する。workers が2以上の場合はパスワードをプロセスプールでハッシュ化する。
+    """
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, workers=None):
+        self.chunk_size = chunk_size
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.executor = None
+        # チャンク内のユーザー名・メールアドレス（ファイル全体ではなくチャンクごとに保持する）
+        self.usernames = set()
+        self.emails = set()
+        self.processed = 0
+        self.imported = 0
+        self.failed = 0
+
+    def run(self, lines):
+        """行のイテラブルを読み込み、チャンクごとに進捗（dict）を返す"""
+        if self.workers > 1:
+            self.executor = ProcessPoolExecutor(self.workers, initializer=_setup_worker)
+        try:
+            chunk = []
+            errors = []
+            for line_number, line in enumerate(lines, start=1):
+                if not line.strip():
+                    continue
+
+                self.processed += 1
+                validated, error = self.validate_line(line)
+                if error is not None:
+                    self.add_error(errors, line_number, error)
+                else:
+                    chunk.append((line_number, *validated))
+
+                if self.processed % self.chunk_size == 0:
+                    yield self.flush(chunk, errors)
+                    chunk = []
+                    errors = []
+
+            if chunk or errors:
+                yield self.flush(chunk, errors)
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+
+    def add_error(self, errors, line_number, error):
+        self.failed += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({'line': line_number, 'errors': error})
+
+    def validate_line(self, line):
+        """1行を検証し、((User, UserProfile, 平文のパスワード), エラー) を返す"""
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            return None, f'JSONの形式が正しくありません: {e}'
+        if not isinstance(record, dict):
+            return None, 'ユーザーはJSONオブジェクトで指定してください'
+
+        user = User(**{field: record[field] for field in USER_FIELDS if field in record})
+        profile = UserProfile(**{field: record[field] for field in PROFILE_FIELDS if field in record})
+        errors = {}
+        # 一意性はチャンク単位でまとめて確認する
+        for instance, exclude in ((user, ['password']), (profile, ['user'])):
+            try:
+                instance.full_clean(exclude=exclude, validate_unique=False)
+            except ValidationError as e:
+                errors.update(e.message_dict)
+
+        password = record.get('password')
+        password_hash = record.get('password_hash')
+        if password is not None and password_hash is not None:
+            errors['password'] = ['password と password_hash はどちらか一方を指定してください']
+        elif password is not None and (not isinstance(password, str) or not password):
+            errors['password'] = ['パスワードは空でない文字列で指定してください']
+        elif password_hash is not None:
+            try:
+                identify_hasher(password_hash)
+            except (TypeError, ValueError):
+                errors['password_hash'] = ['ハッシュ化済みのパスワードの形式が正しくありません']
+            else:
+                user.password = password_hash
+
+        if 'username' not in errors and user.username in self.usernames:
+            errors['username'] = ['ファイル内でユーザー名が重複しています']
+        if 'email' not in errors and user.email and user.email in self.emails:
+            errors['email'] = ['ファイル内でメールアドレスが重複しています']
+        if errors:
+            return None, errors
+
+        self.usernames.add(user.username)
+        if user.email:
+            self.emails.add(user.email)
+        return (user, profile, password), None
+
+    def exclude_registered(self, chunk, errors):
+        """既に登録されているユーザー名・メールアドレスの行を取り除く"""
+        usernames = set(
+            User.objects.filter(username__in=[user.username for _, user, _, _ in chunk])
+            .values_list('username', flat=True)
+        )
+        emails = set(
+            User.objects.filter(email__in=[user.email for _, user, _, _ in chunk if user.email])
+            .values_list('email', flat=True)
+        )
+        remaining = []
+        for item in chunk:
+            line_number, user = item[0], item[1]
+            if user.username in usernames:
+                self.add_error(errors, line_number, {'username': ['このユーザー名は既に使用されています']})
+            elif user.email and user.email in emails:
+                self.add_error(errors, line_number, {'email': ['このメールアドレスは既に使用されています']})
+            else:
+                remaining.append(item)
+        return remaining
+
+    def hash_passwords(self, chunk):
+        plain = [(user, password) for _, user, _, password in chunk if password is not None]
+        passwords = [password for _, password in plain]
+        if self.executor is not None and len(passwords) > 1:
+            chunksize = max(1, len(passwords) // (self.workers * 4))
+            hashed = self.executor.map(hash_password, passwords, chunksize=chunksize)
+        else:
+            hashed = map(hash_password, passwords)
+        for (user, _), password in zip(plain, hashed):
+            user.password = password
+        for _, user, _, password in chunk:
+            if password is None and not user.password:
+                user.set_unusable_password()
+
+    def flush(self, chunk, errors):
+        self.usernames.clear()
+        self.emails.clear()
+        if chunk:
+            chunk = self.exclude_registered(chunk, errors)
+        if chunk:
+            self.hash_passwords(chunk)
+            users = [user for _, user, _, _ in chunk]
+            try:
+                with transaction.atomic():
+                    self.insert(users, [profile for _, _, profile, _ in chunk])
+            except IntegrityError:
+                # 読み込み中に同じユーザー名で登録された場合など。失敗した行だけを報告する
+                self.insert_each(chunk, errors)
+            else:
+                self.imported += len(users)
+        return {
+            'processed': self.processed,
+            'imported': self.imported,
+            'failed': self.failed,
+            'errors': errors,
+        }
+
+    def insert_each(self, chunk, errors):
+        """チャンクを1件ずつ登録し直す（ロールバックで割り当てられた主キーは破棄する）"""
+        for line_number, user, profile, _ in chunk:
+            for instance in (user, profile):
+                instance.pk = None
+                instance._state.adding = True
+            try:
+                with transaction.atomic():
+                    self.insert([user], [profile])
+            except IntegrityError as e:
+                self.add_error(errors, line_number, f'登録に失敗しました: {e}')
+            else:
+                self.imported += 1
+
+    def insert(self, users, profiles):
+        users = User.objects.bulk_create(users, batch_size=self.chunk_size)
+        if not connection.features.can_return_rows_from_bulk_insert:
+            ids = dict(
+                User.objects.filter(username__in=[user.username for user in users])
+                .values_list('username', 'id')
+            )
+            for user in users:
+                user.pk = ids[user.username]
+        for user, profile in zip(users, profiles):
+            profile.user = user
+        UserProfile.objects.bulk_create(profiles, batch_size=self.chunk_size)
+        users_imported.send(sender=User, users=users)
+
+
+def import_users(lines, chunk_size=DEFAULT_CHUNK_SIZE, workers=None):
+    """NDJSONの行を読み込んでユーザーを登録し、チャンクごとの進捗を返す"""
+    return UserImporter(chunk_size, workers).run(lines)
@@ -0,0 +1,43 @@
+"""書き込みをまとめるセッションストア
+
+保存時に保存時刻をセッションに記録し、SessionRefreshMiddleware はこれをもとに
+残りの有効期限が SESSION_REFRESH_THRESHOLD を下回ったときだけ有効期限を延長する。
+リクエストごとにセッションを保存する（SESSION_SAVE_EVERY_REQUEST）代わりに使う。
+
+- accounts.sessions.db: DBから読み書きする（db と同じ）
+- accounts.sessions.cached_db: キャッシュを優先して読み、なければDBから読む（cached_db と同じ）。
+  ログアウトしたセッションが他のプロセスのキャッシュから読まれないよう、
+  プロセス間で共有するキャッシュ（Redis等）が必要（accounts.E001）
+"""
+import time
+from datetime import datetime
+
+from django.conf import settings
+
+
+SAVED_AT_KEY = '_session_saved_at'
+
+
+def get_refresh_threshold():
+    """有効期限を延長する残り秒数（未設定の場合は有効期限の半分）"""
+    threshold = getattr(settings, 'SESSION_REFRESH_THRESHOLD', None)
+    return settings.SESSION_COOKIE_AGE // 2 if threshold is None else threshold
+
+
+class RefreshingSessionMixin:
+    """保存時刻を記録し、有効期限の延長が必要か判定できるようにする"""
+
+    def save(self, must_create=False):
+        self._get_session(no_load=must_create)[SAVED_AT_KEY] = time.time()
+        super().save(must_create)
+
+    def needs_refresh(self):
+        """残りの有効期限が閾値を下回っているか（日時で期限を指定したセッションは延長しない）"""
+        session = self._get_session()
+        if isinstance(session.get('_session_expiry'), (datetime, str)):
+            return False
+        saved_at = session.get(SAVED_AT_KEY)
+        if saved_at is None:
+            return True
+        remaining = saved_at + self.get_expiry_age() - time.time()
+        return remaining < get_refresh_threshold()
@@ -0,0 +1,7 @@
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+from . import RefreshingSessionMixin
+
+
+class SessionStore(RefreshingSessionMixin, CachedDBStore):
+    pass
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+
+# bulk_create でユーザーをまとめて登録した後に送られる（post_save の代わり。引数: users）
+users_imported = Signal()
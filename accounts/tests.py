@@ -1,3 +1,406 @@
-from django.test import TestCase
+import json
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.db import IntegrityError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .checks import check_session_cache, check_shared_cache
+from .models import UserProfile, profile_cache_key
+from .onboarding import import_users
+from .signals import users_imported
+from .throttling import clear_local_blocks, metrics as throttle_metrics
+from .tokens import TokenError, authenticate_access_token, issue_tokens
+from .views import UserProfileAPIView
+
+
+class UserProfileSaveTests(TestCase):
+    """プロフィールの保存が変更されたフィールドだけを書き込むことを確認する"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='hanako', password='pass')
+
+    def test_user_save_without_profile_access_skips_profile(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.last_login = timezone.now()
+        with self.assertNumQueries(1):
+            user.save(update_fields=['last_login'])
+
+    def test_unchanged_profile_is_not_written(self):
+        profile = UserProfile.objects.get(user=self.user)
+        with self.assertNumQueries(0):
+            profile.save()
+
+    def test_only_changed_fields_are_written(self):
+        profile = UserProfile.objects.get(user=self.user)
+        profile.bio = 'よろしくお願いします'
+        profile.birth_date = '1990-04-01'
+        with CaptureQueriesContext(connection) as ctx:
+            profile.save()
+        self.assertEqual(len(ctx.captured_queries), 1)
+        sql = ctx.captured_queries[0]['sql']
+        self.assertIn('"bio"', sql)
+        self.assertIn('"birth_date"', sql)
+        self.assertNotIn('"favorite_cuisine"', sql)
+
+        profile.refresh_from_db()
+        self.assertEqual(profile.bio, 'よろしくお願いします')
+        with self.assertNumQueries(0):
+            profile.birth_date = '1990-04-01'
+            profile.save()
+
+    def test_user_save_persists_loaded_profile_changes(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.userprofile.favorite_cuisine = '和食'
+        user.save()
+        self.assertEqual(UserProfile.objects.get(user=self.user).favorite_cuisine, '和食')
+
+
+    def test_refresh_from_db_resets_loaded_values(self):
+        profile = UserProfile.objects.get(user=self.user)
+        UserProfile.objects.filter(pk=profile.pk).update(bio='別の画面で更新', favorite_cuisine='洋食')
+        profile.refresh_from_db()
+        # 読み直した値は変更として扱わない（古い値に戻さない）
+        with self.assertNumQueries(0):
+            profile.save()
+
+        profile.bio = '編集中'
+        UserProfile.objects.filter(pk=profile.pk).update(favorite_cuisine='中華')
+        profile.refresh_from_db(fields=['favorite_cuisine'])
+        self.assertEqual(profile.get_changed_fields(), ['bio'])
+
+
+class CachedProfileTests(TestCase):
+    """プロフィールの読み取りがキャッシュから返ることを確認する"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='taro', password='pass', first_name='太郎')
+        self.view = UserProfileAPIView.as_view()
+
+    def get_profile(self):
+        request = APIRequestFactory().get('/api/profile/')
+        force_authenticate(request, user=self.user)
+        return self.view(request)
+
+    def test_get_is_served_from_cache(self):
+        self.assertEqual(self.get_profile().status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.get_profile()
+        self.assertEqual(response.data['full_name'], '太郎')
+        self.assertEqual(response.data['avatar'], None)
+
+    def test_stale_fill_after_invalidation_is_ignored(self):
+        self.get_profile()
+        # 更新前にDBから読んだリクエストが、破棄の後でキャッシュに書き込んだ状態にする
+        stale = cache.get(profile_cache_key(self.user.pk))
+        profile = UserProfile.objects.get(user=self.user)
+        profile.bio = '最新の自己紹介'
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        cache.set(profile_cache_key(self.user.pk), stale)
+        self.assertEqual(self.get_profile().data['bio'], '最新の自己紹介')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_profile().data['bio'], '最新の自己紹介')
+
+    def test_cache_is_invalidated_on_save(self):
+        self.get_profile()
+        profile = UserProfile.objects.get(user=self.user)
+        profile.bio = '料理が好きです'
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        self.assertEqual(self.get_profile().data['bio'], '料理が好きです')
+
+
+class SessionRefreshTests(TestCase):
+    """セッションが毎リクエストではなく、有効期限の残りが少ないときだけ保存されることを確認する"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='jiro', password='pass')
+        self.client.force_login(self.user)
+        self.url = '/api/recipes/my/'
+
+    def session_writes(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        writes = [
+            q['sql'] for q in ctx.captured_queries
+            if 'django_session' in q['sql'] and not q['sql'].startswith('SELECT')
+        ]
+        return response, writes
+
+    def test_fresh_session_is_not_written(self):
+        response, writes = self.session_writes()
+        self.assertEqual(writes, [])
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+    @override_settings(SESSION_REFRESH_THRESHOLD=settings.SESSION_COOKIE_AGE * 2)
+    def test_expiring_session_is_extended(self):
+        session_key = self.client.session.session_key
+        expire_date = Session.objects.get(session_key=session_key).expire_date
+        response, writes = self.session_writes()
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(response.cookies[settings.SESSION_COOKIE_NAME]['max-age'], settings.SESSION_COOKIE_AGE)
+        self.assertGreater(Session.objects.get(session_key=session_key).expire_date, expire_date)
+
+
+class SessionCacheCheckTests(TestCase):
+    """キャッシュ優先のセッションが共有されないキャッシュで使われないことを確認する"""
+
+    @override_settings(SESSION_ENGINE='accounts.sessions.cached_db')
+    def test_cached_db_requires_shared_cache(self):
+        errors = check_session_cache(None)
+        self.assertEqual([error.id for error in errors], ['accounts.E001'])
+
+    @override_settings(SESSION_ENGINE='accounts.sessions.db')
+    def test_db_engine_does_not_require_shared_cache(self):
+        self.assertEqual(check_session_cache(None), [])
+
+    @override_settings(ACCOUNTS_REQUIRE_SHARED_CACHE=True)
+    def test_tokens_require_shared_cache(self):
+        errors = check_shared_cache(None)
+        self.assertEqual([error.id for error in errors], ['accounts.E002'])
+
+
+class AccessTokenTests(TestCase):
+    """アクセストークンによる認証がDBを参照せず、失効・更新が働くことを確認する"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='saburo', password='pass')
+        self.url = '/api/recipes/my/'
+
+    def get(self, access_token):
+        return self.client.get(self.url, HTTP_AUTHORIZATION=f'Bearer {access_token}')
+
+    def post_json(self, url, data, **extra):
+        return self.client.post(url, data, content_type='application/json', **extra)
+
+    def test_login_issues_tokens(self):
+        response = self.post_json('/api/login/', {'username': 'saburo', 'password': 'pass'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['token_type'], 'Bearer')
+        self.assertIn('refresh_token', data)
+        self.client.logout()
+        self.assertEqual(self.get(data['access_token']).status_code, 200)
+
+    def test_authentication_does_not_query_users_or_sessions(self):
+        tokens = issue_tokens(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.get(tokens['access_token'])
+        self.assertEqual(response.status_code, 200)
+        for query in ctx.captured_queries:
+            self.assertNotIn('FROM "auth_user"', query['sql'])
+            self.assertNotIn('django_session', query['sql'])
+
+    def test_token_user_cannot_write_back_token_fields(self):
+        user, _ = authenticate_access_token(issue_tokens(self.user)['access_token'])
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        with self.assertRaises(ValueError):
+            user.save()
+        with self.assertRaises(ValueError):
+            user.save(update_fields=['is_active'])
+        user.first_name = '三郎'
+        user.save(update_fields=['first_name'])
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_staff)
+        self.assertEqual(self.user.first_name, '三郎')
+
+    def test_token_for_inactive_user_is_rejected(self):
+        self.user.is_active = False
+        with self.assertRaises(TokenError):
+            authenticate_access_token(issue_tokens(self.user)['access_token'])
+
+    def test_invalid_token_is_rejected(self):
+        self.assertEqual(self.get('invalid').status_code, 401)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_refresh_rotates_tokens(self):
+        tokens = issue_tokens(self.user)
+        response = self.post_json('/api/token/refresh/', {'refresh_token': tokens['refresh_token']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get(response.json()['access_token']).status_code, 200)
+        # 使用済みのリフレッシュトークンは使えない
+        response = self.post_json('/api/token/refresh/', {'refresh_token': tokens['refresh_token']})
+        self.assertEqual(response.status_code, 401)
+
+    def test_password_change_invalidates_refresh_token(self):
+        tokens = issue_tokens(self.user)
+        self.user.set_password('new-pass')
+        self.user.save()
+        response = self.post_json('/api/token/refresh/', {'refresh_token': tokens['refresh_token']})
+        self.assertEqual(response.status_code, 401)
+
+    def test_logout_revokes_tokens(self):
+        tokens = issue_tokens(self.user)
+        response = self.post_json(
+            '/api/logout/', {'refresh_token': tokens['refresh_token']},
+            HTTP_AUTHORIZATION=f'Bearer {tokens["access_token"]}',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get(tokens['access_token']).status_code, 401)
+        response = self.post_json('/api/token/refresh/', {'refresh_token': tokens['refresh_token']})
+        self.assertEqual(response.status_code, 401)
+
+
+class UserImportTests(TestCase):
+    """会員の一括登録がユーザー・プロフィールをまとめて作成することを確認する"""
+
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(username='existing', email='existing@example.com')
+
+    def run_import(self, records, **kwargs):
+        lines = [
+            (record if isinstance(record, str) else json.dumps(record, ensure_ascii=False)).encode()
+            for record in records
+        ]
+        return list(import_users(lines, **kwargs))
+
+    def test_import_users_and_profiles(self):
+        password_hash = make_password('hashed-pass')
+        records = [
+            {'username': 'ichiro', 'email': 'ichiro@example.com', 'password': 'plain-pass',
+             'favorite_cuisine': '和食'},
+            {'username': 'jiro', 'password_hash': password_hash, 'birth_date': '1990-04-01'},
+            {'username': 'saburo'},
+        ]
+        # 登録済みの確認2件・User と UserProfile の挿入各1件（＋セーブポイント2件）
+        with self.assertNumQueries(6):
+            progress = self.run_import(records, workers=1)
+        self.assertEqual(progress[-1]['imported'], 3)
+
+        self.assertTrue(User.objects.get(username='ichiro').check_password('plain-pass'))
+        self.assertEqual(User.objects.get(username='jiro').password, password_hash)
+        self.assertFalse(User.objects.get(username='saburo').has_usable_password())
+        self.assertEqual(UserProfile.objects.get(user__username='ichiro').favorite_cuisine, '和食')
+        self.assertEqual(str(UserProfile.objects.get(user__username='jiro').birth_date), '1990-04-01')
+        self.assertEqual(UserProfile.objects.count(), User.objects.count())
+
+    def test_invalid_and_duplicate_rows_are_skipped(self):
+        records = [
+            '{broken',
+            {'username': 'existing'},
+            {'username': 'shiro', 'email': 'existing@example.com'},
+            {'username': 'goro', 'password_hash': 'not-a-hash'},
+            {'username': 'rokuro'},
+            {'username': 'rokuro'},
+            {'username': 'invalid name!'},
+        ]
+        progress = self.run_import(records, chunk_size=3, workers=1)
+        self.assertEqual(progress[-1]['imported'], 1)
+        self.assertEqual(progress[-1]['failed'], 6)
+        failed_lines = sorted(error['line'] for report in progress for error in report['errors'])
+        self.assertEqual(failed_lines, [1, 2, 3, 4, 6, 7])
+
+    def test_failed_chunk_is_inserted_row_by_row(self):
+        def reject(sender, users, **kwargs):
+            if any(user.username == 'conflict' for user in users):
+                raise IntegrityError('UNIQUE constraint failed')
+        users_imported.connect(reject)
+        self.addCleanup(users_imported.disconnect, reject)
+
+        records = [{'username': 'hachiro'}, {'username': 'conflict'}, {'username': 'kuro'}, {'username': 'hachiro'}]
+        progress = self.run_import(records, chunk_size=3, workers=1)
+        self.assertEqual(progress[-1]['imported'], 2)
+        # チャンク内の他の行は登録され、失敗した行と先のチャンクとの重複だけが報告される
+        self.assertEqual([error['line'] for error in progress[0]['errors']], [2])
+        self.assertEqual(progress[1]['errors'][0]['errors'], {'username': ['このユーザー名は既に使用されています']})
+        self.assertEqual(
+            sorted(User.objects.filter(username__in=['hachiro', 'conflict', 'kuro']).values_list('username', flat=True)),
+            ['hachiro', 'kuro'],
+        )
+        self.assertEqual(UserProfile.objects.count(), User.objects.count())
+
+    def test_passwords_are_hashed_in_process_pool(self):
+        records = [{'username': f'pool{i}', 'password': f'pass{i}'} for i in range(3)]
+        self.run_import(records, workers=2)
+        for i in range(3):
+            self.assertTrue(User.objects.get(username=f'pool{i}').check_password(f'pass{i}'))
+
+
+# テスト中にウィンドウの境界をまたがないよう、期間は1日にする
+@override_settings(LOGIN_THROTTLE_RATES={'ip': '4/day', 'username': '2/day'})
+class LoginThrottleTests(TestCase):
+    """上限を超えたログイン試行がパスワードの検証前に拒否されることを確認する"""
+
+    def setUp(self):
+        # 他のテストの未加算の判定件数を加算してから消す
+        throttle_metrics.snapshot()
+        cache.clear()
+        clear_local_blocks()
+        self.addCleanup(clear_local_blocks)
+        self.user = User.objects.create_user(username='shiro', password='pass')
+
+    def login(self, username, password, ip='192.0.2.1'):
+        return self.client.post(
+            '/api/login/', {'username': username, 'password': password},
+            content_type='application/json', REMOTE_ADDR=ip,
+        )
+
+    def test_failures_for_username_are_limited(self):
+        self.assertEqual(self.login('shiro', 'wrong').status_code, 401)
+        # ユーザー名は大文字・小文字を区別するため、別のユーザー名として数える
+        self.assertEqual(self.login('SHIRO', 'wrong', ip='192.0.2.2').status_code, 401)
+        self.assertEqual(self.login('shiro', 'wrong', ip='192.0.2.2').status_code, 401)
+        # パスワードが正しくても、上限を超えた後は検証せずに拒否する
+        with self.assertNumQueries(0):
+            response = self.login('shiro', 'pass', ip='192.0.2.3')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_attempts_per_ip_are_limited(self):
+        for i in range(4):
+            self.assertEqual(self.login(f'user{i}', 'wrong').status_code, 401)
+        self.assertEqual(self.login('shiro', 'pass').status_code, 429)
+        self.assertEqual(self.login('shiro', 'pass', ip='192.0.2.9').status_code, 200)
+
+    def test_forwarded_for_ignored_without_trusted_proxies(self):
+        # X-Forwarded-For を試行ごとに変えても、同じ接続元として数える
+        for i in range(4):
+            response = self.client.post(
+                '/api/login/', {'username': f'user{i}', 'password': 'wrong'},
+                content_type='application/json', REMOTE_ADDR='192.0.2.1',
+                HTTP_X_FORWARDED_FOR=f'198.51.100.{i}',
+            )
+            self.assertEqual(response.status_code, 401)
+        response = self.client.post(
+            '/api/login/', {'username': 'shiro', 'password': 'pass'},
+            content_type='application/json', REMOTE_ADDR='192.0.2.1', HTTP_X_FORWARDED_FOR='198.51.100.99',
+        )
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(LOGIN_THROTTLE_NUM_PROXIES=1)
+    def test_forwarded_for_used_behind_trusted_proxy(self):
+        def login(forwarded_for, username):
+            return self.client.post(
+                '/api/login/', {'username': username, 'password': 'wrong'},
+                content_type='application/json', REMOTE_ADDR='10.0.0.1',
+                HTTP_X_FORWARDED_FOR=forwarded_for,
+            )
+
+        # プロキシが付けた右端のアドレスで数え、クライアントが付けた左側の値は使わない
+        for i in range(4):
+            self.assertEqual(login(f'198.51.100.{i}, 203.0.113.5', f'user{i}').status_code, 401)
+        self.assertEqual(login('198.51.100.99, 203.0.113.5', 'user9').status_code, 429)
+        self.assertEqual(login('203.0.113.6', 'user9').status_code, 401)
+
+    def test_metrics(self):
+        for i in range(6):
+            self.login(f'user{i}', 'wrong')
+        snapshot = throttle_metrics.snapshot()
+        self.assertEqual(snapshot['attempts'], 6)
+        self.assertEqual(snapshot['rejected_ip'], 2)
+        # 2回目の拒否はプロセス内の記録で判定される
+        self.assertEqual(snapshot['local_hits'], 1)
+        self.assertEqual(snapshot['rejection_rate'], round(2 / 6, 4))
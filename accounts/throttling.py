@@ -0,0 +1,207 @@
+"""ログイン試行の制限（パスワードのハッシュ検証の前に拒否する）
+
+IPアドレスごとの試行回数と、ユーザー名ごとの失敗回数をスライディングウィンドウで数える。
+件数は固定ウィンドウごとにキャッシュ（プロセス間で共有）で数え、直前のウィンドウの件数を
+経過割合で按分して加えることで、直近 period 秒の件数を近似する。
+
+上限に達した IP・ユーザー名はプロセス内にも記録し、解除までの試行はキャッシュを
+参照せずに拒否する（大量の試行が続く間のキャッシュへの負荷を抑える）。
+判定・拒否の件数はプロセス内で数えて定期的にキャッシュへ加算し、metrics.snapshot() で参照できる。
+
+件数はキャッシュで全プロセスに共有する前提のため、プロセスごとのキャッシュ（LocMemCache）では
+上限が実質「上限×プロセス数」になり、metrics.snapshot() も1プロセス分しか数えない。
+本番ではRedis等の共有キャッシュを使う（accounts.E002）。
+
+IPアドレスは REMOTE_ADDR を使う。クライアントが任意に付けられる X-Forwarded-For は、
+信頼するリバースプロキシの段数（LOGIN_THROTTLE_NUM_PROXIES）を指定した場合にだけ参照する
+（試行ごとに値を変えて別のIPアドレスとして数えさせないため）。
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+
+CACHE_PREFIX = 'accounts:throttle:'
+# スコープごとの上限（回数/期間）。ip は全試行、username は失敗した試行を数える
+DEFAULT_RATES = {'ip': '20/min', 'username': '5/min'}
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+# プロセス内に記録する拒否中のIP・ユーザー名の上限
+LOCAL_MAX_ENTRIES = 10000
+# 判定件数をキャッシュへ加算する間隔（秒）
+METRICS_FLUSH_INTERVAL = 10
+METRIC_NAMES = ('attempts', 'rejected_ip', 'rejected_username', 'local_hits')
+
+
+def parse_rate(rate):
+    """'20/min' 形式の上限を (回数, 秒数) にする"""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+def get_client_ip(request):
+    """試行回数を数えるクライアントのIPアドレス
+
+    LOGIN_THROTTLE_NUM_PROXIES（既定は0）が1以上なら、X-Forwarded-For の右から
+    その段数目（信頼するプロキシが付けた最も外側のアドレス）を使う。
+    """
+    remote_addr = request.META.get('REMOTE_ADDR', '')
+    num_proxies = getattr(settings, 'LOGIN_THROTTLE_NUM_PROXIES', 0)
+    if num_proxies <= 0:
+        return remote_addr
+    addrs = [addr.strip() for addr in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if addr.strip()]
+    if not addrs:
+        return remote_addr
+    return addrs[-min(num_proxies, len(addrs))]
+
+
+def get_rates():
+    rates = {**DEFAULT_RATES, **getattr(settings, 'LOGIN_THROTTLE_RATES', {})}
+    return {scope: parse_rate(rate) for scope, rate in rates.items() if rate}
+
+
+class ThrottleMetrics:
+    """判定・拒否の件数（プロセス内で数え、METRICS_FLUSH_INTERVAL ごとにキャッシュへ加算する）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._flushed_at = time.monotonic()
+
+    def record(self, name):
+        with self._lock:
+            self._pending[name] += 1
+            if time.monotonic() - self._flushed_at >= METRICS_FLUSH_INTERVAL:
+                self._flush()
+
+    def _flush(self):
+        pending, self._pending = self._pending, Counter()
+        self._flushed_at = time.monotonic()
+        for name, count in pending.items():
+            key = f'{CACHE_PREFIX}metrics:{name}'
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                cache.set(key, count, None)
+
+    def snapshot(self):
+        """全プロセスの累計と拒否率（このプロセスの未加算分を加算してから返す）"""
+        with self._lock:
+            self._flush()
+        found = cache.get_many([f'{CACHE_PREFIX}metrics:{name}' for name in METRIC_NAMES])
+        counts = {name: found.get(f'{CACHE_PREFIX}metrics:{name}', 0) for name in METRIC_NAMES}
+        attempts = counts['attempts']
+        rejected = counts['rejected_ip'] + counts['rejected_username']
+        return {
+            **counts,
+            'rejected': rejected,
+            'rejection_rate': round(rejected / attempts, 4) if attempts else 0.0,
+            'local_hit_rate': round(counts['local_hits'] / rejected, 4) if rejected else 0.0,
+        }
+
+
+metrics = ThrottleMetrics()
+
+_local_lock = threading.Lock()
+_local_blocks = {}
+
+
+def _local_block_until(key, now):
+    with _local_lock:
+        until = _local_blocks.get(key)
+        if until is not None and until <= now:
+            del _local_blocks[key]
+            until = None
+        return until
+
+
+def _block_locally(key, until):
+    with _local_lock:
+        if len(_local_blocks) >= LOCAL_MAX_ENTRIES:
+            now = time.time()
+            for expired in [k for k, v in _local_blocks.items() if v <= now]:
+                del _local_blocks[expired]
+        if len(_local_blocks) >= LOCAL_MAX_ENTRIES:
+            # 解除前の記録で埋まっている場合は古い半分を捨てる（キャッシュ側の判定は残る）
+            for old in list(_local_blocks)[:LOCAL_MAX_ENTRIES // 2]:
+                del _local_blocks[old]
+        _local_blocks[key] = until
+
+
+def clear_local_blocks():
+    """プロセス内の拒否の記録を消す（テスト用）"""
+    with _local_lock:
+        _local_blocks.clear()
+
+
+class LoginThrottle:
+    """1回のログイン試行に対する制限の判定
+
+    check() で上限を確認し（拒否する場合は再試行までの秒数を返す）、許可した試行を
+    IPアドレスの件数に加える。認証に失敗したら failed() でユーザー名の件数に加える。
+    """
+
+    def __init__(self, request, username=None):
+        self.rates = get_rates()
+        self.idents = {'ip': get_client_ip(request)}
+        if username:
+            # ユーザー名は大文字・小文字を区別するため、登録時と同じ正規化（NFKC）だけを行い、
+            # キーに使える形にする
+            normalized = User.normalize_username(str(username)).encode('utf-8')
+            self.idents['username'] = hashlib.sha256(normalized).hexdigest()
+        self.scopes = [scope for scope in ('ip', 'username') if scope in self.rates and scope in self.idents]
+
+    def _window_keys(self, scope, now):
+        _, period = self.rates[scope]
+        index = int(now // period)
+        prefix = f'{CACHE_PREFIX}{scope}:{self.idents[scope]}:'
+        return f'{prefix}{index - 1}', f'{prefix}{index}', (now % period) / period
+
+    def check(self):
+        """上限に達していれば再試行までの秒数を、そうでなければ None を返す"""
+        now = time.time()
+        metrics.record('attempts')
+        for scope in self.scopes:
+            until = _local_block_until((scope, self.idents[scope]), now)
+            if until is not None:
+                metrics.record('local_hits')
+                metrics.record(f'rejected_{scope}')
+                return until - now
+
+        windows = {scope: self._window_keys(scope, now) for scope in self.scopes}
+        found = cache.get_many([key for previous, current, _ in windows.values() for key in (previous, current)])
+        for scope, (previous, current, elapsed) in windows.items():
+            limit, period = self.rates[scope]
+            count = found.get(previous, 0) * (1 - elapsed) + found.get(current, 0)
+            if count >= limit:
+                wait = period * (1 - elapsed)
+                _block_locally((scope, self.idents[scope]), now + wait)
+                metrics.record(f'rejected_{scope}')
+                return wait
+
+        if 'ip' in windows:
+            self._hit('ip', windows['ip'][1])
+        return None
+
+    def failed(self):
+        """認証に失敗した試行をユーザー名の件数に加える"""
+        if 'username' in self.scopes:
+            self._hit('username', self._window_keys('username', time.time())[1])
+
+    def _hit(self, scope, key):
+        timeout = self.rates[scope][1] * 2
+        try:
+            cache.incr(key)
+        except ValueError:
+            if not cache.add(key, 1, timeout):
+                cache.incr(key)
+
+
+def retry_after(seconds):
+    """Retry-After ヘッダーの値"""
+    return str(max(1, math.ceil(seconds)))
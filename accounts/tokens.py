@@ -0,0 +1,153 @@
+"""署名付きのアクセストークン・リフレッシュトークン（モバイルAPI向け）
+
+アクセストークンはユーザーID・ユーザー名・権限を含む短命のトークンで、
+SECRET_KEY による署名と有効期限の確認だけで認証する（DBを参照しない）。
+リフレッシュトークンで新しい組を発行するときはDBでユーザーの状態を確認し、
+パスワードが変更されていれば拒否する。
+
+失効はトークンごとのID（jti）をキャッシュの拒否リストに載せて行う。
+拒否リストの項目はトークンの有効期限が切れると消えるため、リストは小さく保たれる。
+拒否リストとリフレッシュトークンの使用済みの記録は全プロセスで共有する必要があるため、
+キャッシュにはRedis等の共有キャッシュを使う（accounts.E002）。
+"""
+import secrets
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import cache
+from django.db import router
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+from django.utils.crypto import constant_time_compare
+
+
+ACCESS_SALT = 'accounts.tokens.access'
+REFRESH_SALT = 'accounts.tokens.refresh'
+DENY_PREFIX = 'accounts:tokens:denied:'
+# アクセストークンから組み立てるユーザーのフィールド（発行時の値のため、保存には使わない）
+TOKEN_USER_FIELDS = {'id', 'username', 'is_staff', 'is_superuser', 'is_active'}
+
+
+class TokenError(Exception):
+    """トークンが不正・期限切れ・失効済みの場合に送出される"""
+
+
+def get_access_lifetime():
+    return getattr(settings, 'ACCESS_TOKEN_LIFETIME', 60 * 15)
+
+
+def get_refresh_lifetime():
+    return getattr(settings, 'REFRESH_TOKEN_LIFETIME', 60 * 60 * 24 * 14)
+
+
+def _deny_key(jti):
+    return f'{DENY_PREFIX}{jti}'
+
+
+def issue_tokens(user):
+    """アクセストークンとリフレッシュトークンの組を発行する"""
+    access = {
+        'uid': user.pk,
+        'name': user.username,
+        'staff': user.is_staff,
+        'super': user.is_superuser,
+        'active': user.is_active,
+        # スーパーユーザーは has_perm が常に True になるため権限を含めない
+        'perms': [] if user.is_superuser else sorted(user.get_all_permissions()),
+        'jti': secrets.token_urlsafe(12),
+    }
+    refresh = {
+        'uid': user.pk,
+        'auth': user.get_session_auth_hash(),
+        'jti': secrets.token_urlsafe(12),
+    }
+    return {
+        'access_token': signing.dumps(access, salt=ACCESS_SALT, compress=True),
+        'refresh_token': signing.dumps(refresh, salt=REFRESH_SALT, compress=True),
+        'token_type': 'Bearer',
+        'expires_in': get_access_lifetime(),
+    }
+
+
+def _load(token, salt, lifetime, check_denied=True):
+    try:
+        payload = signing.loads(token, salt=salt, max_age=lifetime)
+    except signing.SignatureExpired:
+        raise TokenError('トークンの有効期限が切れています')
+    except signing.BadSignature:
+        raise TokenError('トークンが正しくありません')
+    if not isinstance(payload, dict) or 'jti' not in payload:
+        raise TokenError('トークンが正しくありません')
+    if check_denied and cache.get(_deny_key(payload['jti'])):
+        raise TokenError('トークンは失効しています')
+    return payload
+
+
+def authenticate_access_token(token):
+    """アクセストークンを検証し、(ユーザー, ペイロード) を返す
+
+    ユーザーはトークンの内容から組み立てる（トークンに含まれないフィールドは
+    参照時にDBから読み込まれる）。権限は ModelBackend の権限キャッシュに設定するため、
+    has_perm もDBを参照しない。トークンの値は発行時のものなので、これらのフィールドを
+    書き込む保存はできない（guard_token_user を参照）。
+    """
+    payload = _load(token, ACCESS_SALT, get_access_lifetime())
+    if not payload.get('active', False):
+        raise TokenError('ユーザーが無効です')
+    values = {
+        'id': payload['uid'],
+        'is_superuser': payload['super'],
+        'username': payload['name'],
+        'is_staff': payload['staff'],
+        'is_active': payload['active'],
+    }
+    names = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+    user = User.from_db(router.db_for_read(User), names, [values[name] for name in names])
+    user._perm_cache = set(payload['perms'])
+    user._from_access_token = True
+    return user, payload
+
+
+@receiver(pre_save, sender=User)
+def guard_token_user(sender, instance, update_fields=None, **kwargs):
+    """アクセストークンから組み立てたユーザーが発行時の値を書き戻さないようにする
+
+    一部のフィールドだけを読み込んだインスタンスの save() は読み込んだフィールドを
+    書き込むため、そのままではトークン発行後の権限・状態の変更を古い値で上書きしてしまう。
+    """
+    if not getattr(instance, '_from_access_token', False):
+        return
+    if update_fields is None or TOKEN_USER_FIELDS & set(update_fields):
+        raise ValueError(
+            'アクセストークンのユーザーは、トークンに含まれるフィールドを保存できません'
+            '（update_fields で他のフィールドを指定するか、DBから読み込んでください）'
+        )
+
+
+def refresh_tokens(refresh_token):
+    """リフレッシュトークンから新しい組を発行する（使ったリフレッシュトークンは失効させる）"""
+    lifetime = get_refresh_lifetime()
+    payload = _load(refresh_token, REFRESH_SALT, lifetime)
+    user = User.objects.filter(pk=payload['uid'], is_active=True).first()
+    if user is None or not constant_time_compare(payload['auth'], user.get_session_auth_hash()):
+        raise TokenError('トークンは失効しています')
+    # 同じリフレッシュトークンでの同時の更新は1つだけ成功させる
+    if not cache.add(_deny_key(payload['jti']), True, lifetime):
+        raise TokenError('トークンは失効しています')
+    return issue_tokens(user)
+
+
+def revoke_tokens(access_token=None, refresh_token=None):
+    """トークンを拒否リストに載せて失効させる（不正・期限切れのトークンは無視する）"""
+    for token, salt, lifetime in (
+        (access_token, ACCESS_SALT, get_access_lifetime()),
+        (refresh_token, REFRESH_SALT, get_refresh_lifetime()),
+    ):
+        if not token:
+            continue
+        try:
+            payload = _load(token, salt, lifetime, check_denied=False)
+        except TokenError:
+            continue
+        cache.set(_deny_key(payload['jti']), True, lifetime)
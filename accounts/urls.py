@@ -7,4 +7,6 @@ urlpatterns = [
     # 簡易版API
     path('login/', views.login_api, name='login_api'),
     path('logout/', views.logout_api, name='logout_api'),
+    path('login/metrics/', views.login_throttle_metrics, name='login_throttle_metrics'),
+    path('token/refresh/', views.refresh_token_api, name='token_refresh_api'),
 ] 
\ No newline at end of file
@@ -12,6 +12,8 @@ from rest_framework.views import APIView
 from django.db import transaction
 import json
 from .models import UserProfile
+from .throttling import LoginThrottle, retry_after, metrics as throttle_metrics
+from .tokens import TokenError, issue_tokens, refresh_tokens, revoke_tokens
 
 
 class UserProfileAPIView(APIView):
@@ -21,7 +23,7 @@ class UserProfileAPIView(APIView):
     def get(self, request):
         """プロフィール情報を取得"""
         try:
-            profile = request.user.userprofile
+            profile = UserProfile.objects.get_cached(request.user)
             data = {
                 'user_id': request.user.id,
                 'username': request.user.username,
@@ -51,12 +53,13 @@ class UserProfileAPIView(APIView):
             profile = request.user.userprofile
             data = request.data
             
-            # ユーザー基本情報の更新
-            if 'first_name' in data:
-                request.user.first_name = data['first_name']
-            if 'last_name' in data:
-                request.user.last_name = data['last_name']
-            request.user.save()
+            # ユーザー基本情報の更新（トークン認証のユーザーは一部のフィールドしか持たないため、
+            # 変更したフィールドだけを保存する）
+            user_fields = [name for name in ('first_name', 'last_name') if name in data]
+            for name in user_fields:
+                setattr(request.user, name, data[name])
+            if user_fields:
+                request.user.save(update_fields=user_fields)
             
             # プロフィール情報の更新
             if 'bio' in data:
@@ -175,13 +178,28 @@ def login_api(request):
             username = data.get('username')
             password = data.get('password')
             
+            # 試行回数の上限を超えた場合は、パスワードの検証（ハッシュ計算）の前に拒否する
+            throttle = LoginThrottle(request, username)
+            wait = throttle.check()
+            if wait is not None:
+                response = JsonResponse(
+                    {'error': 'ログインの試行回数が多すぎます。しばらくしてから再度お試しください'},
+                    status=429
+                )
+                response['Retry-After'] = retry_after(wait)
+                return response
+            
             user = authenticate(request, username=username, password=password)
+            if user is None:
+                throttle.failed()
             if user is not None:
                 login(request, user)
+                # モバイルアプリ向けに、セッションの代わりに使えるトークンも発行する
                 return JsonResponse({
                     'message': 'ログインしました',
                     'user_id': user.id,
-                    'username': user.username
+                    'username': user.username,
+                    **issue_tokens(user),
                 })
             else:
                 return JsonResponse({'error': 'ユーザー名またはパスワードが正しくありません'}, status=401)
@@ -193,9 +211,48 @@ def login_api(request):
 
 @csrf_exempt
 def logout_api(request):
-    """ログアウトAPI（簡易版）"""
+    """ログアウトAPI（簡易版）
+
+    Authorization ヘッダーのアクセストークンと、本文の refresh_token も失効させる。
+    """
     if request.method == 'POST':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            data = {}
+        auth = request.headers.get('Authorization', '').split()
+        access_token = auth[1] if len(auth) == 2 and auth[0].lower() == 'bearer' else None
+        revoke_tokens(
+            access_token=access_token,
+            refresh_token=data.get('refresh_token') if isinstance(data, dict) else None,
+        )
         logout(request)
         return JsonResponse({'message': 'ログアウトしました'})
     
     return JsonResponse({'error': 'POSTメソッドが必要です'}, status=405)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def login_throttle_metrics(request):
+    """ログイン試行の制限の判定件数・拒否率（管理者のみ）"""
+    return Response(throttle_metrics.snapshot())
+
+
+@csrf_exempt
+def refresh_token_api(request):
+    """トークン更新API（リフレッシュトークンから新しいトークンの組を発行）"""
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'error': 'JSONの形式が正しくありません'}, status=400)
+        refresh_token = data.get('refresh_token') if isinstance(data, dict) else None
+        if not refresh_token:
+            return JsonResponse({'error': 'refresh_tokenは必須です'}, status=400)
+        try:
+            return JsonResponse(refresh_tokens(refresh_token))
+        except TokenError as e:
+            return JsonResponse({'error': str(e)}, status=401)
+    
+    return JsonResponse({'error': 'POSTメソッドが必要です'}, status=405)
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.3 on 2026-10-17 02:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Ingredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='材料の名前（例: 玉ねぎ、鶏胸肉）', max_length=100, unique=True, verbose_name='材料名')),
+                ('category', models.CharField(blank=True, help_text='材料のカテゴリ（例: 野菜、肉類、調味料）', max_length=50, verbose_name='カテゴリ')),
+                ('unit', models.CharField(default='個', help_text='材料の基本単位（例: 個、g、ml）', max_length=20, verbose_name='単位')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+            ],
+            options={
+                'verbose_name': '材料',
+                'verbose_name_plural': '材料',
+                'ordering': ['category', 'name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='UserInventory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='在庫数量')),
+                ('expiry_date', models.DateField(blank=True, null=True, verbose_name='賞味期限')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ingredients.ingredient', verbose_name='材料')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='ユーザー')),
+            ],
+            options={
+                'verbose_name': '在庫',
+                'verbose_name_plural': '在庫',
+                'unique_together': {('user', 'ingredient')},
+            },
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.3 on 2026-10-17 02:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('recipes', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyMenu',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='例: 2024年1月の献立', max_length=100, verbose_name='月献立名')),
+                ('year', models.PositiveIntegerField(verbose_name='年')),
+                ('month', models.PositiveIntegerField(verbose_name='月')),
+                ('description', models.TextField(blank=True, verbose_name='説明・メモ')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='ユーザー')),
+            ],
+            options={
+                'verbose_name': '月献立',
+                'verbose_name_plural': '月献立',
+                'ordering': ['-year', '-month'],
+                'unique_together': {('user', 'year', 'month')},
+            },
+        ),
+        migrations.CreateModel(
+            name='WeeklyMenu',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='例: 2024年1月第1週の献立', max_length=100, verbose_name='献立名')),
+                ('start_date', models.DateField(help_text='その週の月曜日の日付', verbose_name='開始日（月曜日）')),
+                ('description', models.TextField(blank=True, verbose_name='説明・メモ')),
+                ('is_template', models.BooleanField(default=False, help_text='再利用可能なテンプレートとして保存', verbose_name='テンプレート')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='ユーザー')),
+            ],
+            options={
+                'verbose_name': '週献立',
+                'verbose_name_plural': '週献立',
+                'ordering': ['-start_date'],
+                'unique_together': {('user', 'start_date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='MonthlyMenuWeek',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week_number', models.PositiveIntegerField(help_text='その月の第何週か（1-5）', verbose_name='週番号')),
+                ('monthly_menu', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='weekly_menus', to='menus.monthlymenu', verbose_name='月献立')),
+                ('weekly_menu', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='menus.weeklymenu', verbose_name='週献立')),
+            ],
+            options={
+                'verbose_name': '月献立週',
+                'verbose_name_plural': '月献立週',
+                'ordering': ['week_number'],
+                'unique_together': {('monthly_menu', 'week_number')},
+            },
+        ),
+        migrations.CreateModel(
+            name='WeeklyMenuRecipe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day_of_week', models.IntegerField(choices=[(0, '月曜日'), (1, '火曜日'), (2, '水曜日'), (3, '木曜日'), (4, '金曜日'), (5, '土曜日'), (6, '日曜日')], verbose_name='曜日')),
+                ('meal_type', models.CharField(choices=[('breakfast', '朝食'), ('lunch', '昼食'), ('dinner', '夕食')], default='dinner', max_length=20, verbose_name='食事の種類')),
+                ('servings', models.PositiveIntegerField(default=2, help_text='この日に作る人数分', verbose_name='人数分')),
+                ('notes', models.TextField(blank=True, help_text='調理時の注意点など', verbose_name='メモ')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='recipes.recipe', verbose_name='レシピ')),
+                ('weekly_menu', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='menu_recipes', to='menus.weeklymenu', verbose_name='週献立')),
+            ],
+            options={
+                'verbose_name': '週献立レシピ',
+                'verbose_name_plural': '週献立レシピ',
+                'ordering': ['day_of_week', 'meal_type'],
+                'unique_together': {('weekly_menu', 'day_of_week', 'meal_type')},
+            },
+        ),
+    ]
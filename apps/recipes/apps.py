@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.recipes'
-    verbose_name = 'レシピ管理' 
\ No newline at end of file
+    verbose_name = 'レシピ管理'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.3 on 2026-10-17 02:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('ingredients', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Recipe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='レシピ名')),
+                ('description', models.TextField(blank=True, verbose_name='説明')),
+                ('instructions', models.TextField(help_text='調理手順を記述してください', verbose_name='作り方')),
+                ('cooking_time', models.PositiveIntegerField(blank=True, null=True, verbose_name='調理時間（分）')),
+                ('servings', models.PositiveIntegerField(default=2, verbose_name='人数分')),
+                ('difficulty', models.CharField(choices=[('easy', '簡単'), ('medium', '普通'), ('hard', '難しい')], default='medium', max_length=20, verbose_name='難易度')),
+                ('source_url', models.URLField(blank=True, help_text='YouTubeなどの参照元URL', verbose_name='参照URL')),
+                ('is_ai_generated', models.BooleanField(default=False, help_text='AIによって生成されたレシピかどうか', verbose_name='AI生成')),
+                ('ai_analysis_data', models.JSONField(blank=True, help_text='AIによる解析結果のJSONデータ', null=True, verbose_name='AI解析データ')),
+                ('image', models.ImageField(blank=True, null=True, upload_to='recipes/images/', verbose_name='画像')),
+                ('tags', models.CharField(blank=True, help_text='カンマ区切りでタグを入力（例: 和食,簡単,30分以内）', max_length=200, verbose_name='タグ')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='作成者')),
+            ],
+            options={
+                'verbose_name': 'レシピ',
+                'verbose_name_plural': 'レシピ',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeFavorite',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='お気に入り登録日時')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='recipes.recipe', verbose_name='レシピ')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='ユーザー')),
+            ],
+            options={
+                'verbose_name': 'お気に入りレシピ',
+                'verbose_name_plural': 'お気に入りレシピ',
+                'unique_together': {('user', 'recipe')},
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.CharField(help_text='例: 1個、200g、大さじ2', max_length=50, verbose_name='分量')),
+                ('is_optional', models.BooleanField(default=False, help_text='必須でない材料の場合はチェック', verbose_name='オプション')),
+                ('order', models.PositiveIntegerField(default=1, verbose_name='表示順序')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ingredients.ingredient', verbose_name='材料')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipe_ingredients', to='recipes.recipe', verbose_name='レシピ')),
+            ],
+            options={
+                'verbose_name': 'レシピ材料',
+                'verbose_name_plural': 'レシピ材料',
+                'ordering': ['order', 'id'],
+                'unique_together': {('recipe', 'ingredient')},
+            },
+        ),
+    ]
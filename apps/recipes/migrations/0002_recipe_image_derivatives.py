@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 02:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='サムネイル等の派生ファイルのパス（自動生成）', verbose_name='画像派生ファイル'),
+        ),
+    ]
@@ -67,6 +67,13 @@ class Recipe(models.Model):
         null=True, 
         verbose_name="画像"
     )
+    image_derivatives = models.JSONField(
+        default=dict, 
+        blank=True, 
+        editable=False, 
+        verbose_name="画像派生ファイル",
+        help_text="サムネイル等の派生ファイルのパス（自動生成）"
+    )
     
     # タグ機能
     tags = models.CharField(
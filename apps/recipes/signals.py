@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes import images
+
+from .models import Recipe
+
+
+@receiver(post_save, sender=Recipe)
+def process_image_on_save(sender, instance, raw=False, **kwargs):
+    """画像の保存時に派生ファイル（サムネイル）を生成、クリア時に削除"""
+    if not raw:
+        images.handle_image_save(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_images_on_delete(sender, instance, **kwargs):
+    """削除時に元画像と派生ファイルを削除"""
+    images.handle_image_delete(instance)
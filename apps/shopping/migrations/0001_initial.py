@@ -0,0 +1,86 @@
+# Generated by Django 5.2.3 on 2026-10-17 02:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('ingredients', '0001_initial'),
+        ('menus', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingList',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='例: 6/15(水)の買い物', max_length=100, verbose_name='買い物リスト名')),
+                ('target_date', models.DateField(help_text='買い物に行く予定の日', verbose_name='買い物予定日')),
+                ('is_auto_generated', models.BooleanField(default=False, help_text='システムによって自動生成されたリストかどうか', verbose_name='自動生成')),
+                ('generation_period_start', models.DateField(blank=True, help_text='リスト生成時の対象期間の開始日', null=True, verbose_name='生成対象期間開始')),
+                ('generation_period_end', models.DateField(blank=True, help_text='リスト生成時の対象期間の終了日', null=True, verbose_name='生成対象期間終了')),
+                ('is_notified', models.BooleanField(default=False, help_text='ユーザーに通知済みかどうか', verbose_name='通知済み')),
+                ('notification_sent_at', models.DateTimeField(blank=True, null=True, verbose_name='通知送信日時')),
+                ('is_completed', models.BooleanField(default=False, help_text='買い物が完了したかどうか', verbose_name='買い物完了')),
+                ('completed_at', models.DateTimeField(blank=True, null=True, verbose_name='完了日時')),
+                ('notes', models.TextField(blank=True, help_text='買い物時の注意点など', verbose_name='メモ')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='ユーザー')),
+                ('weekly_menus', models.ManyToManyField(blank=True, help_text='この買い物リストの対象となる週献立', to='menus.weeklymenu', verbose_name='対象献立')),
+            ],
+            options={
+                'verbose_name': '買い物リスト',
+                'verbose_name_plural': '買い物リスト',
+                'ordering': ['-target_date', '-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('custom_name', models.CharField(blank=True, help_text='材料マスタにない場合の名前', max_length=100, verbose_name='カスタム名')),
+                ('quantity', models.CharField(help_text='例: 2個、300g、1パック', max_length=50, verbose_name='必要量')),
+                ('category', models.CharField(choices=[('vegetables', '野菜'), ('fruits', '果物'), ('meat', '肉類'), ('fish', '魚介類'), ('dairy', '乳製品'), ('grains', '穀物・主食'), ('seasonings', '調味料'), ('beverages', '飲み物'), ('snacks', 'お菓子'), ('frozen', '冷凍食品'), ('others', 'その他')], default='others', max_length=20, verbose_name='カテゴリ')),
+                ('is_purchased', models.BooleanField(default=False, verbose_name='購入済み')),
+                ('purchased_at', models.DateTimeField(blank=True, null=True, verbose_name='購入日時')),
+                ('actual_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='実際の価格')),
+                ('order', models.PositiveIntegerField(default=1, verbose_name='表示順序')),
+                ('priority', models.CharField(choices=[('high', '高'), ('medium', '中'), ('low', '低')], default='medium', max_length=10, verbose_name='優先度')),
+                ('notes', models.TextField(blank=True, help_text='特売情報、代替品など', verbose_name='メモ')),
+                ('ingredient', models.ForeignKey(blank=True, help_text='登録済み材料の場合', null=True, on_delete=django.db.models.deletion.CASCADE, to='ingredients.ingredient', verbose_name='材料')),
+                ('shopping_list', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='shopping.shoppinglist', verbose_name='買い物リスト')),
+            ],
+            options={
+                'verbose_name': '買い物アイテム',
+                'verbose_name_plural': '買い物アイテム',
+                'ordering': ['category', 'order', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ShoppingNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notification_type', models.CharField(choices=[('reminder', 'リマインダー'), ('list_ready', 'リスト作成完了'), ('weekly_prep', '週次準備')], max_length=20, verbose_name='通知タイプ')),
+                ('title', models.CharField(max_length=100, verbose_name='通知タイトル')),
+                ('message', models.TextField(verbose_name='通知メッセージ')),
+                ('is_sent', models.BooleanField(default=False, verbose_name='送信済み')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='送信日時')),
+                ('error_message', models.TextField(blank=True, help_text='送信に失敗した場合のエラー内容', verbose_name='エラーメッセージ')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+                ('shopping_list', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='shopping.shoppinglist', verbose_name='買い物リスト')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='ユーザー')),
+            ],
+            options={
+                'verbose_name': '買い物通知',
+                'verbose_name_plural': '買い物通知',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -25,14 +25,17 @@ class CategoryAdmin(admin.ModelAdmin):
 class RecipeAdmin(admin.ModelAdmin):
     list_display = [
         'title', 'category', 'author', 'cooking_time', 
-        'servings', 'difficulty', 'is_public', 'created_at'
+        'servings', 'difficulty', 'favorite_count', 'rating_avg', 'is_public', 'created_at'
     ]
     list_filter = [
         'category', 'difficulty', 'is_public', 'created_at', 'author'
     ]
     search_fields = ['title', 'description']
     ordering = ['-created_at']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = [
+        'favorite_count', 'rating_avg', 'rating_count', 'rating_histogram',
+        'created_at', 'updated_at'
+    ]
     
     fieldsets = (
         ('基本情報', {
@@ -48,7 +51,10 @@ class RecipeAdmin(admin.ModelAdmin):
             'fields': ('is_public',)
         }),
         ('メタデータ', {
-            'fields': ('created_at', 'updated_at'),
+            'fields': (
+                'favorite_count', 'rating_avg', 'rating_count', 'rating_histogram',
+                'created_at', 'updated_at'
+            ),
             'classes': ('collapse',)
         }),
     )
@@ -0,0 +1,406 @@
+"""APIのエンドツーエンド・ベンチマーク
+
+create_sample_data --recipes で生成したデータに対し、テストクライアントで
+ミドルウェアを含む実際のリクエスト処理を繰り返し実行し、エンドポイントごとに
+レイテンシ（p50/p95/p99）・SQLクエリ数・レスポンスのバイト数を記録する。
+結果はJSONに保存し、保存済みのベースラインと比較できる。
+
+シナリオは Request を yield するジェネレーターで、直前のレスポンスを受け取って
+次のリクエストを組み立てる（作成したレシピの更新・削除など）。
+書き込みを伴うシナリオは、1回の実行ごとに元の状態へ戻す（追加→削除など）。
+"""
+import json
+import platform
+import statistics
+import time
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+from fnmatch import fnmatch
+
+import django
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from .models import Category, Ingredient, Recipe, RecipeFavorite, RecipeRating, Step
+from .sample_data import SAMPLE_PASSWORD
+
+
+PERCENTILES = (50, 95, 99)
+# 比較時に回帰とみなすレイテンシ（p95）の増加率の既定値
+DEFAULT_THRESHOLD = 0.2
+
+
+class Request:
+    """シナリオが発行する1リクエスト（route は結果の表示用のパス）"""
+
+    def __init__(self, name, method, route, params=None, data=None, headers=None, anonymous=False):
+        self.name = name
+        self.method = method
+        self.route = route
+        self.path = route.format(**(params or {}))
+        self.data = data
+        self.headers = headers or {}
+        self.anonymous = anonymous
+
+
+class BenchmarkContext:
+    """シナリオが参照する、生成済みデータから選んだユーザー・レシピ"""
+
+    def __init__(self, prefix='sample', sample_size=50):
+        users = User.objects.filter(username__startswith=f'{prefix}_')
+        # 自分のレシピ・お気に入りの一覧が空にならないよう、投稿の多いユーザーを使う
+        self.user = users.annotate(recipe_total=Count('recipe')).order_by('-recipe_total', 'id').first()
+        if self.user is None:
+            raise ValueError(
+                f'ユーザー名が「{prefix}_」で始まるユーザーがいません。'
+                'create_sample_data --recipes で事前にデータを生成してください'
+            )
+        public = Recipe.objects.filter(is_public=True)
+        self.popular_ids = list(
+            public.order_by('-favorite_count', 'id').values_list('id', flat=True)[:sample_size]
+        )
+        if not self.popular_ids:
+            raise ValueError('公開レシピがありません')
+        self.unfavorited_ids = list(
+            public.exclude(id__in=RecipeFavorite.objects.filter(user=self.user).values('recipe_id'))
+            .order_by('id').values_list('id', flat=True)[:sample_size]
+        )
+        self.unrated_ids = list(
+            public.exclude(id__in=RecipeRating.objects.filter(user=self.user).values('recipe_id'))
+            .order_by('id').values_list('id', flat=True)[:sample_size]
+        )
+        self.category_ids = list(Category.objects.order_by('id').values_list('id', flat=True))
+        self.ingredient_names = list(
+            Ingredient.objects.filter(recipe_id__in=self.popular_ids[:5])
+            .values_list('name', flat=True).distinct()[:5]
+        )
+        self.pages = max(1, public.count() // settings.REST_FRAMEWORK.get('PAGE_SIZE', 20))
+
+    def pick(self, ids, iteration):
+        return ids[iteration % len(ids)]
+
+
+def browse_flow(ctx, i):
+    recipe_id = ctx.pick(ctx.popular_ids, i)
+    yield Request('categories', 'GET', '/api/categories/')
+    yield Request('recipe_list', 'GET', '/api/recipes/')
+    yield Request('recipe_list_anonymous', 'GET', '/api/recipes/', anonymous=True)
+    if ctx.category_ids:
+        yield Request(
+            'recipe_list_filtered', 'GET', '/api/recipes/?category={category}&difficulty=2',
+            {'category': ctx.pick(ctx.category_ids, i)},
+        )
+    yield Request('recipe_list_search', 'GET', '/api/recipes/?search=鶏')
+    yield Request('recipe_list_cursor', 'GET', '/api/recipes/?cursor=&facets=false')
+    yield Request(
+        'recipe_list_deep_page', 'GET', '/api/recipes/?page={page}', {'page': min(50, ctx.pages)}
+    )
+    response = yield Request('recipe_detail', 'GET', '/api/recipes/{id}/', {'id': recipe_id})
+    yield Request(
+        'recipe_detail_not_modified', 'GET', '/api/recipes/{id}/', {'id': recipe_id},
+        headers={'HTTP_IF_NONE_MATCH': response.get('ETag', '')},
+    )
+    yield Request('recipe_similar', 'GET', '/api/recipes/{id}/similar/', {'id': recipe_id})
+    if ctx.ingredient_names:
+        yield Request(
+            'recipe_cookable', 'GET', '/api/recipes/cookable/?ingredients={names}',
+            {'names': ','.join(ctx.ingredient_names)},
+        )
+    yield Request('stats', 'GET', '/api/stats/')
+
+
+def my_flow(ctx, i):
+    yield Request('my_recipes', 'GET', '/api/recipes/my/')
+    yield Request('favorite_list', 'GET', '/api/favorites/')
+
+
+def favorite_flow(ctx, i):
+    if not ctx.unfavorited_ids:
+        return
+    params = {'id': ctx.pick(ctx.unfavorited_ids, i)}
+    yield Request('favorite_add', 'POST', '/api/recipes/{id}/favorite/', params)
+    yield Request('favorite_remove', 'DELETE', '/api/recipes/{id}/favorite/', params)
+    operations = [
+        {'recipe_id': recipe_id, 'action': 'add'} for recipe_id in ctx.unfavorited_ids[:10]
+    ]
+    yield Request('favorite_batch_add', 'POST', '/api/favorites/batch/', data={'operations': operations})
+    for operation in operations:
+        operation['action'] = 'remove'
+    yield Request('favorite_batch_remove', 'POST', '/api/favorites/batch/', data={'operations': operations})
+
+
+def rating_flow(ctx, i):
+    if not ctx.unrated_ids:
+        return
+    params = {'id': ctx.pick(ctx.unrated_ids, i)}
+    yield Request('rating_create', 'POST', '/api/recipes/{id}/rating/', params, data={'rating': 4})
+    yield Request('rating_update', 'PUT', '/api/recipes/{id}/rating/', params, data={'rating': 5})
+    yield Request('rating_delete', 'DELETE', '/api/recipes/{id}/rating/', params)
+
+
+def recipe_write_flow(ctx, i):
+    data = {
+        'title': f'ベンチマーク用レシピ{i}',
+        'description': 'ベンチマークで作成したレシピです。',
+        'cooking_time': 20,
+        'ingredients': [{'name': name, 'amount': '1', 'order': order} for order, name in enumerate(ctx.ingredient_names)],
+        'steps': [{'step_number': number, 'description': f'手順{number}'} for number in range(1, 4)],
+    }
+    response = yield Request('recipe_create', 'POST', '/api/recipes/', data=data)
+    if response.status_code != 201:
+        return
+    # 作成APIのレスポンスにはIDが含まれないため、計測外でDBから引く
+    recipe_id = (
+        Recipe.objects.filter(author=ctx.user, title=data['title'])
+        .order_by('-id').values_list('id', flat=True).first()
+    )
+    params = {'id': recipe_id}
+    yield Request('recipe_update', 'PATCH', '/api/recipes/{id}/', params, data={'title': f'更新したレシピ{i}'})
+    yield Request('recipe_delete', 'DELETE', '/api/recipes/{id}/', params)
+
+
+def auth_flow(ctx, i):
+    credentials = {'username': ctx.user.username, 'password': SAMPLE_PASSWORD}
+    yield Request('login', 'POST', '/api/login/', data=credentials, anonymous=True)
+    yield Request('logout', 'POST', '/api/logout/', anonymous=True)
+
+
+def export_flow(ctx, i):
+    yield Request('recipe_export', 'GET', '/api/recipes/export/')
+
+
+# (シナリオ名, ジェネレーター, 重いシナリオか)
+FLOWS = [
+    ('browse', browse_flow, False),
+    ('my', my_flow, False),
+    ('favorite', favorite_flow, False),
+    ('rating', rating_flow, False),
+    ('recipe_write', recipe_write_flow, False),
+    ('export', export_flow, True),
+    # ログイン時にパスワードハッシュが更新されるとログイン済みのセッションが無効になるため最後に実行する
+    ('auth', auth_flow, False),
+]
+
+
+def unavailable_flows():
+    """このプロジェクトで実行できないシナリオと理由"""
+    skipped = {}
+    for name, app in (('menus', 'apps.menus'), ('shopping', 'apps.shopping')):
+        if not django_apps.is_installed(app):
+            skipped[name] = f'{app} が INSTALLED_APPS に含まれていません'
+        else:
+            skipped[name] = f'{app} のAPI（URL）が定義されていません'
+    return skipped
+
+
+def percentile(values, p):
+    """線形補間によるパーセンタイル（values は昇順）"""
+    if len(values) == 1:
+        return values[0]
+    position = (len(values) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(samples):
+    latencies = sorted(samples['latencies'])
+    summary = {
+        'method': samples['method'],
+        'route': samples['route'],
+        'iterations': len(latencies),
+        'status': {str(code): count for code, count in sorted(samples['statuses'].items())},
+        'latency_ms': {f'p{p}': round(percentile(latencies, p), 3) for p in PERCENTILES},
+        'queries': {
+            'min': min(samples['queries']),
+            'max': max(samples['queries']),
+            'mean': round(statistics.fmean(samples['queries']), 2),
+        },
+        'bytes': {
+            'mean': round(statistics.fmean(samples['bytes']), 1),
+            'max': max(samples['bytes']),
+        },
+    }
+    summary['latency_ms']['mean'] = round(statistics.fmean(latencies), 3)
+    summary['latency_ms']['max'] = round(latencies[-1], 3)
+    return summary
+
+
+def _host():
+    hosts = [host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*']
+    return 'localhost' if not hosts or 'localhost' in hosts else hosts[0]
+
+
+class BenchmarkRunner:
+    """シナリオを繰り返し実行して計測する
+
+    warmup 回は計測せずに実行し、続く iterations 回を計測する。
+    cold_cache を指定すると、各リクエストの前にキャッシュを空にする。
+    """
+
+    def __init__(self, iterations=50, warmup=5, only=None, heavy=False, cold_cache=False,
+                 prefix='sample', report=None):
+        self.iterations = iterations
+        self.warmup = warmup
+        self.only = only or []
+        self.heavy = heavy
+        self.cold_cache = cold_cache
+        self.prefix = prefix
+        self.report = report or (lambda message: None)
+
+    def selected(self, name):
+        return not self.only or any(fnmatch(name, pattern) for pattern in self.only)
+
+    def run(self):
+        ctx = BenchmarkContext(self.prefix)
+        host = _host()
+        self.client = Client(HTTP_HOST=host)
+        self.client.force_login(ctx.user)
+        self.anonymous_client = Client(HTTP_HOST=host)
+        self.logins = 0
+
+        samples = {}
+        skipped = unavailable_flows()
+        for name, flow, heavy in FLOWS:
+            if heavy and not self.heavy:
+                skipped[name] = '重いシナリオのため --heavy の指定時のみ実行します'
+                continue
+            for _ in range(self.warmup):
+                self.run_flow(flow, ctx, 0, None)
+            for i in range(self.iterations):
+                self.run_flow(flow, ctx, i, samples)
+            self.report(f'{name}: {self.iterations}回実行しました')
+
+        return {
+            'meta': self.metadata(),
+            'results': {name: summarize(data) for name, data in sorted(samples.items())},
+            'skipped': skipped,
+        }
+
+    def run_flow(self, flow, ctx, i, samples):
+        generator = flow(ctx, i)
+        response = None
+        try:
+            while True:
+                request = generator.send(response)
+                response = self.execute(request, samples)
+        except StopIteration:
+            pass
+
+    def execute(self, request, samples):
+        client = self.anonymous_client if request.anonymous else self.client
+        if request.name == 'login':
+            # ログイン状態を持ち越さないよう、毎回新しいクライアントでログインする。
+            # IPアドレスごとの試行回数の制限にかからないよう、毎回別のアドレスから送る
+            self.logins += 1
+            client = self.anonymous_client = Client(
+                HTTP_HOST=_host(), REMOTE_ADDR=f'10.{self.logins >> 16 & 255}.{self.logins >> 8 & 255}.{self.logins & 255}'
+            )
+        kwargs = dict(request.headers)
+        if request.data is not None:
+            kwargs.update(data=json.dumps(request.data), content_type='application/json')
+        if self.cold_cache:
+            cache.clear()
+
+        selected = samples is not None and self.selected(request.name)
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(client, request.method.lower())(request.path, **kwargs)
+            if response.streaming:
+                body = b''.join(response.streaming_content)
+            else:
+                body = response.content
+            elapsed = (time.perf_counter() - started) * 1000
+        if not selected:
+            return response
+
+        data = samples.setdefault(request.name, {
+            'method': request.method,
+            'route': request.route,
+            'latencies': [],
+            'queries': [],
+            'bytes': [],
+            'statuses': Counter(),
+        })
+        data['latencies'].append(elapsed)
+        data['queries'].append(len(queries.captured_queries))
+        data['bytes'].append(len(body))
+        data['statuses'][response.status_code] += 1
+        return response
+
+    def metadata(self):
+        return {
+            'created_at': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+            'iterations': self.iterations,
+            'warmup': self.warmup,
+            'cold_cache': self.cold_cache,
+            'heavy': self.heavy,
+            'only': self.only,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'cache': settings.CACHES['default']['BACKEND'],
+            'dataset': {
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'ingredients': Ingredient.objects.count(),
+                'steps': Step.objects.count(),
+                'favorites': RecipeFavorite.objects.count(),
+                'ratings': RecipeRating.objects.count(),
+            },
+        }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """ベースラインと比較し、エンドポイントごとの差分を返す
+
+    p95 が threshold を超えて増えた場合、最大クエリ数が増えた場合、返したステータスコードの
+    種類が変わった場合、ベースラインにあるエンドポイントが今回の結果にない場合を回帰とする。
+    --only で対象外にしたエンドポイントは結果になくても回帰としない。
+    """
+    only = results.get('meta', {}).get('only') or []
+    rows = []
+    for name, current in results['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if base is None:
+            rows.append({'name': name, 'new': True, 'missing': False, 'regression': False})
+            continue
+        p95 = current['latency_ms']['p95']
+        base_p95 = base['latency_ms']['p95']
+        change = (p95 - base_p95) / base_p95 if base_p95 else 0
+        slower = change > threshold
+        more_queries = current['queries']['max'] > base['queries']['max']
+        # 回数は実行回数で変わるため、ステータスコードの種類だけを比べる
+        status = sorted(current['status'])
+        base_status = sorted(base['status'])
+        status_changed = status != base_status
+        rows.append({
+            'name': name,
+            'new': False,
+            'missing': False,
+            'p95_ms': p95,
+            'baseline_p95_ms': base_p95,
+            'p95_change': round(change, 3),
+            'queries': current['queries']['max'],
+            'baseline_queries': base['queries']['max'],
+            'bytes': current['bytes']['mean'],
+            'baseline_bytes': base['bytes']['mean'],
+            'status': status,
+            'baseline_status': base_status,
+            'status_changed': status_changed,
+            'regression': slower or more_queries or status_changed,
+        })
+
+    for name in sorted(baseline.get('results', {})):
+        if name in results['results']:
+            continue
+        if only and not any(fnmatch(name, pattern) for pattern in only):
+            continue
+        rows.append({'name': name, 'new': False, 'missing': True, 'regression': True})
+    return rows
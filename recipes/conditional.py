@@ -0,0 +1,132 @@
+"""ETag / Last-Modified による条件付きGET
+
+シリアライズの前に、表示内容を決める値（更新日時・集計値・作成者・カテゴリ）
+だけからETagを組み立て、変更がなければ 304 Not Modified を返す。
+レシピの updated_at（Last-Modified）を進める変更:
+- レシピの保存（auto_now）。APIでの材料・手順の一括更新もレシピの保存を伴う
+- 材料・手順の個別の保存・削除（シグナルでコミット後にまとめて更新する）
+- 評価の追加・変更・削除（apply_rating_change）と reconcile_rating_aggregates での修復
+- 画像の派生ファイルの生成完了
+
+お気に入り数（追加・削除・reconcile_favorite_counts）と作成者名・カテゴリ名の変更は
+updated_at を進めないため、ETagに含めた値でのみ検出される（Last-Modified だけを
+送るクライアントには 304 を返しうる）。
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+# recipe_version() が参照するレシピの列（?fields= で列を絞り込む場合も必ず取得する）
+RECIPE_VERSION_COLUMNS = [
+    'id', 'created_at', 'updated_at', 'is_public',
+    'favorite_count', 'rating_count', 'rating_sum', 'author', 'category',
+]
+
+
+def _related_version(recipe, name, *fields):
+    """関連先の表示内容の値（select_related していない場合はIDのみを出力するためIDで判定）"""
+    field = recipe._meta.get_field(name)
+    if not field.is_cached(recipe):
+        return getattr(recipe, field.attname)
+    related = getattr(recipe, name)
+    if related is None:
+        return None
+    return (related.pk,) + tuple(getattr(related, attr) for attr in fields)
+
+
+def recipe_version(recipe):
+    """レシピの表示内容が変わると必ず変わる値の組"""
+    return (
+        recipe.pk, recipe.updated_at.isoformat(), recipe.is_public,
+        recipe.favorite_count, recipe.rating_count, recipe.rating_sum,
+        _related_version(recipe, 'author', 'username', 'first_name', 'last_name', 'email'),
+        _related_version(recipe, 'category', 'name', 'description'),
+    )
+
+
+class ConditionalGetMixin:
+    """一覧・詳細のGETで ETag / Last-Modified を返し、変更がなければ 304 を返すMixin
+
+    EagerLoadingViewMixin と組み合わせ、詳細では prefetch を 304 判定の後に遅らせる。
+    """
+
+    def get_version(self, obj):
+        return recipe_version(obj)
+
+    def get_last_modified(self, obj):
+        return obj.updated_at
+
+    def get_validators(self, objects, extra=None):
+        """ETag と Last-Modified（UNIX時刻）を返す"""
+        return self.make_validators(
+            [self.get_version(obj) for obj in objects],
+            [self.get_last_modified(obj).timestamp() for obj in objects],
+            extra,
+        )
+
+    def make_validators(self, versions, timestamps, extra=None):
+        """表示内容のバージョンの列と更新時刻（UNIX時刻）の列から ETag と Last-Modified を作る"""
+        request = self.request
+        source = repr((
+            request.get_full_path(),
+            request.accepted_renderer.format,
+            request.user.pk,
+            extra,
+            versions,
+        ))
+        etag = '"%s"' % hashlib.sha1(source.encode('utf-8')).hexdigest()
+        last_modified = int(max(timestamps)) if timestamps else None
+        return etag, last_modified
+
+    def not_modified_response(self, etag, last_modified):
+        response = get_conditional_response(
+            self.request, etag=etag, last_modified=last_modified
+        )
+        if response is not None:
+            self.set_validators(response, etag, last_modified)
+        return response
+
+    def set_validators(self, response, etag, last_modified):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        # 毎回サーバーに問い合わせて再検証させる
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        self.defer_prefetch = True
+        instance = self.get_object()
+        etag, last_modified = self.get_validators([instance])
+        response = self.not_modified_response(etag, last_modified)
+        if response is not None:
+            return response
+
+        self.prefetch_instances([instance])
+        serializer = self.get_serializer(instance)
+        return self.set_validators(Response(serializer.data), etag, last_modified)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        objects = list(page) if page is not None else list(queryset)
+
+        state = None
+        if page is not None and hasattr(self.paginator, 'get_state'):
+            # 総件数や前後ページの有無が変わった場合もETagを変える
+            state = self.paginator.get_state()
+        etag, last_modified = self.get_validators(objects, extra=state)
+        response = self.not_modified_response(etag, last_modified)
+        if response is not None:
+            return response
+
+        serializer = self.get_serializer(objects, many=True)
+        if page is not None:
+            response = self.get_paginated_response(serializer.data)
+        else:
+            response = Response(serializer.data)
+        return self.set_validators(response, etag, last_modified)
@@ -0,0 +1,211 @@
+"""レシピ一覧のファセット（絞り込み条件の値ごとの件数）
+
+カテゴリ・難易度・作成者・調理時間帯の件数を、一覧と同じ絞り込み条件のもとで
+1回の GROUP BY 集計から求める（ファセットの値ごとに COUNT を発行しない）。
+結果は絞り込み条件（クエリパラメータ）ごとにキャッシュし、件数が変わりうる変更の
+種類ごとにバージョンを分けて無効化する。
+
+- recipes: レシピの作成・削除と、集計するフィールド（カテゴリ・難易度・作成者・公開・
+  調理時間帯）の変更、カテゴリ名・作成者名の変更。すべてのファセットが参照する
+- search: 検索インデックスの更新。キーワード検索している場合のみ参照する
+- ratings: 評価の変更。評価で絞り込んでいる場合のみ参照する
+
+説明の変更や画像の差し替え、お気に入り数の更新などではファセットを無効化しない。
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, Value, When
+from rest_framework.settings import api_settings
+
+from .models import Recipe
+from .stats import get_or_compute
+
+
+CACHE_PREFIX = 'recipes:facets:'
+FACETS_TIMEOUT = 60 * 10
+# カテゴリ・作成者は件数の多い順にこの数まで返す
+FACET_LIMIT = 50
+
+# 調理時間帯（キー, 表示名, 下限, 上限）。上限・下限は分で、両端を含む
+COOKING_TIME_BUCKETS = [
+    ('lte15', '15分以内', None, 15),
+    ('lte30', '16〜30分', 16, 30),
+    ('lte60', '31〜60分', 31, 60),
+    ('gt60', '61分以上', 61, None),
+]
+COOKING_TIME_BUCKET_CHOICES = [(key, label) for key, label, _, _ in COOKING_TIME_BUCKETS]
+
+# 評価の集計値で絞り込むクエリパラメータ
+RATING_PARAMS = {'min_rating', 'min_rating_count'}
+
+# バージョンの種類（先頭の recipes はすべてのファセットが参照する）
+VERSION_NAMES = ('recipes', 'search', 'ratings')
+
+# 値が変わるとファセットの件数が変わるレシピのフィールド（調理時間は時間帯で判定する）
+FACET_FIELDS = {'category_id', 'difficulty', 'author_id', 'is_public'}
+
+
+def _version_key(name):
+    return f'{CACHE_PREFIX}version:{name}'
+
+
+def get_version(name):
+    return cache.get_or_set(_version_key(name), 1, None)
+
+
+def invalidate_facets(*names):
+    """コミット後にファセットのキャッシュを破棄する（names のバージョンを進める。省略時はすべて）"""
+    names = names or VERSION_NAMES
+
+    def apply():
+        for name in names:
+            try:
+                cache.incr(_version_key(name))
+            except ValueError:
+                cache.set(_version_key(name), 1, None)
+    transaction.on_commit(apply)
+
+
+def recipe_facets_changed(recipe, update_fields=None):
+    """保存したレシピで、ファセットの件数に影響する値が変わったか（post_save から呼ぶ）"""
+    changed = recipe.get_changed_fields(update_fields)
+    if changed is None:
+        return True
+    if FACET_FIELDS & set(changed):
+        return True
+    return 'cooking_time' in changed and (
+        cooking_time_bucket(changed['cooking_time']) != cooking_time_bucket(recipe.cooking_time)
+    )
+
+
+def cooking_time_bucket(minutes):
+    """調理時間（分）が含まれる調理時間帯のキー"""
+    for key, _, _, upper in COOKING_TIME_BUCKETS:
+        if upper is not None and minutes <= upper:
+            return key
+    return COOKING_TIME_BUCKETS[-1][0]
+
+
+def cooking_time_bucket_range(key):
+    """調理時間帯のキーから (下限, 上限) を返す"""
+    for bucket_key, _, lower, upper in COOKING_TIME_BUCKETS:
+        if bucket_key == key:
+            return lower, upper
+    raise KeyError(key)
+
+
+def _cooking_time_bucket():
+    return Case(
+        *[
+            When(cooking_time__lte=upper, then=Value(key))
+            for key, _, _, upper in COOKING_TIME_BUCKETS if upper is not None
+        ],
+        default=Value(COOKING_TIME_BUCKETS[-1][0]),
+    )
+
+
+def _ranked(counts, labels):
+    values = sorted(counts, key=lambda value: (-counts[value], value is None, value or 0))
+    return [
+        {'value': value, 'label': labels.get(value), 'count': counts[value]}
+        for value in values[:FACET_LIMIT]
+    ]
+
+
+def _fixed(counts, choices):
+    # 選択肢が決まっているファセットは0件の値も返す
+    return [
+        {'value': value, 'label': label, 'count': counts.get(value, 0)}
+        for value, label in choices
+    ]
+
+
+def compute_facets(queryset):
+    """絞り込み済みのクエリセットからファセットを集計する（クエリは1回）"""
+    rows = (
+        queryset.order_by()
+        .values(
+            'category', 'category__name', 'difficulty', 'author', 'author__username',
+            cooking_time_bucket=_cooking_time_bucket(),
+        )
+        .annotate(count=Count('id'))
+    )
+    names = ('category', 'difficulty', 'author', 'cooking_time_bucket')
+    counts = {name: {} for name in names}
+    labels = {'category': {}, 'author': {}}
+    for row in rows:
+        for name in names:
+            counts[name][row[name]] = counts[name].get(row[name], 0) + row['count']
+        labels['category'][row['category']] = row['category__name']
+        labels['author'][row['author']] = row['author__username']
+
+    return {
+        'category': _ranked(counts['category'], labels['category']),
+        'difficulty': _fixed(counts['difficulty'], Recipe.DIFFICULTY_CHOICES),
+        'author': _ranked(counts['author'], labels['author']),
+        'cooking_time': _fixed(counts['cooking_time_bucket'], COOKING_TIME_BUCKET_CHOICES),
+    }
+
+
+def get_facets(queryset, params):
+    """絞り込み条件 params（{パラメータ名: 値の一覧}）に対するファセットをキャッシュから取得する"""
+    versions = get_facets_versions(params)
+    signature = repr((versions, sorted(params.items())))
+    key = CACHE_PREFIX + hashlib.sha1(signature.encode('utf-8')).hexdigest()
+    return get_or_compute(key, lambda: compute_facets(queryset), FACETS_TIMEOUT)
+
+
+def get_facets_versions(params):
+    """params のファセットに影響するバージョンの組"""
+    names = [VERSION_NAMES[0]]
+    if api_settings.SEARCH_PARAM in params:
+        names.append('search')
+    if RATING_PARAMS & set(params):
+        names.append('ratings')
+    found = cache.get_many([_version_key(name) for name in names])
+    return tuple(found.get(_version_key(name)) or get_version(name) for name in names)
+
+
+class FacetsMixin:
+    """ページ付きの一覧レスポンスに facets を追加するビュー用Mixin
+
+    ファセットはページ・並び順に依存しないため、フィルターバックエンドだけを適用した
+    クエリセットから集計する。?facets=false で省略できる（無限スクロールの2ページ目以降など）。
+    ConditionalGetMixin・RepresentationCacheMixin より前に置く。
+    """
+    facets_query_param = 'facets'
+
+    def include_facets(self):
+        return self.request.query_params.get(
+            self.facets_query_param, 'true'
+        ).lower() not in ('false', '0')
+
+    def get_facet_params(self):
+        """ファセットの件数に影響するクエリパラメータ"""
+        names = set(self.filterset_class.base_filters)
+        names.update(
+            backend.search_param for backend in self.filter_backends
+            if hasattr(backend, 'search_param')
+        )
+        params = self.request.query_params
+        return {name: tuple(params.getlist(name)) for name in sorted(names) if name in params}
+
+    def get_facet_queryset(self):
+        queryset = self.get_queryset()
+        for backend in self.filter_backends:
+            queryset = backend().filter_queryset(self.request, queryset, self)
+        return queryset
+
+    def make_validators(self, versions, timestamps, extra=None):
+        # ページに現れないレシピの変更でも件数は変わるため、ファセットのバージョンをETagに含める
+        if self.include_facets():
+            extra = (extra, get_facets_versions(self.get_facet_params()))
+        return super().make_validators(versions, timestamps, extra)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.include_facets():
+            response.data['facets'] = get_facets(self.get_facet_queryset(), self.get_facet_params())
+        return response
@@ -0,0 +1,118 @@
+"""ユーザーごとのお気に入りレシピIDのキャッシュ
+
+一覧の is_favorited を1行ごとのEXISTSではなく集合の参照で判定するため、
+ユーザーのお気に入りID集合を一度だけ読み込んでキャッシュに保持する。
+お気に入りの追加・削除はコミット後にキャッシュを破棄し、次の参照時にDBから読み直す
+（集合の読み書きは不可分ではないため、同じユーザーの変更が重なっても取りこぼさないよう
+差分を書き込まない）。
+"""
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from . import representations
+from .models import Recipe, RecipeFavorite
+
+
+CACHE_PREFIX = 'recipes:favorite_ids:'
+# 管理画面など、API以外からの変更を取り込むための有効期限
+FAVORITE_IDS_TIMEOUT = 60 * 10
+
+
+def _cache_key(user_id):
+    return f'{CACHE_PREFIX}{user_id}'
+
+
+def get_favorite_ids(user):
+    """ユーザーのお気に入りレシピIDの集合を取得する"""
+    key = _cache_key(user.pk)
+    favorite_ids = cache.get(key)
+    if favorite_ids is None:
+        favorite_ids = frozenset(
+            RecipeFavorite.objects.filter(user=user).values_list('recipe_id', flat=True)
+        )
+        cache.set(key, favorite_ids, FAVORITE_IDS_TIMEOUT)
+    return favorite_ids
+
+
+def invalidate_favorite_ids(user_id):
+    """コミット後にキャッシュ済みの集合を破棄する"""
+    key = _cache_key(user_id)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def lock_favorites(user):
+    """ユーザーのお気に入りの変更を直列化する（トランザクション内で呼ぶ）
+
+    現状の読み取りからお気に入り数の増減までの間に同じユーザーの別の変更が入ると、
+    両方が「未登録」と判断して二重に加算（削除では二重に減算）してしまうため、
+    ユーザーの行をロックしてからお気に入りを読む。
+    """
+    list(User.objects.select_for_update().filter(pk=user.pk).values_list('pk', flat=True))
+
+
+def apply_favorite_operations(user, operations):
+    """お気に入りの追加・削除をまとめて反映し、操作ごとの結果を返す
+
+    同じレシピへの操作が複数ある場合は最後の操作のみを適用する（オフライン中の操作の再生用）。
+    追加は1回の bulk insert（重複は無視）、削除は1回の DELETE で行い、
+    お気に入り数も同じトランザクション内で更新する。同じユーザーの変更は
+    lock_favorites で直列化するため、重なった一括操作でも増減は実際の行の変化と一致する。
+    """
+    latest = {}
+    for index, operation in enumerate(operations):
+        latest[operation['recipe_id']] = index
+
+    recipe_ids = set(latest)
+    existing_recipe_ids = set(
+        Recipe.objects.filter(id__in=recipe_ids).values_list('id', flat=True)
+    )
+    add_ids = {
+        recipe_id for recipe_id, index in latest.items()
+        if operations[index]['action'] == 'add' and recipe_id in existing_recipe_ids
+    }
+    remove_ids = {
+        recipe_id for recipe_id, index in latest.items()
+        if operations[index]['action'] == 'remove' and recipe_id in existing_recipe_ids
+    }
+
+    with transaction.atomic():
+        lock_favorites(user)
+        favorited_ids = set(
+            RecipeFavorite.objects.filter(user=user, recipe_id__in=add_ids | remove_ids)
+            .values_list('recipe_id', flat=True)
+        )
+        added_ids = add_ids - favorited_ids
+        removed_ids = remove_ids & favorited_ids
+
+        if added_ids:
+            RecipeFavorite.objects.bulk_create(
+                [RecipeFavorite(user=user, recipe_id=recipe_id) for recipe_id in added_ids],
+                ignore_conflicts=True,
+            )
+            Recipe.objects.filter(id__in=added_ids).update(
+                favorite_count=F('favorite_count') + 1
+            )
+        if removed_ids:
+            RecipeFavorite.objects.filter(user=user, recipe_id__in=removed_ids).delete()
+            Recipe.objects.filter(id__in=removed_ids, favorite_count__gt=0).update(
+                favorite_count=F('favorite_count') - 1
+            )
+        if added_ids or removed_ids:
+            invalidate_favorite_ids(user.id)
+        representations.invalidate_representations(*added_ids, *removed_ids)
+
+    results = []
+    for index, operation in enumerate(operations):
+        recipe_id = operation['recipe_id']
+        if latest[recipe_id] != index:
+            result = 'superseded'
+        elif recipe_id not in existing_recipe_ids:
+            result = 'not_found'
+        elif operation['action'] == 'add':
+            result = 'added' if recipe_id in added_ids else 'already_favorited'
+        else:
+            result = 'removed' if recipe_id in removed_ids else 'not_favorited'
+        results.append({**operation, 'result': result})
+    return results
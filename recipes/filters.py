@@ -0,0 +1,25 @@
+import django_filters
+
+from .facets import COOKING_TIME_BUCKET_CHOICES, cooking_time_bucket_range
+from .models import Recipe
+
+
+class RecipeFilter(django_filters.FilterSet):
+    """レシピ一覧の絞り込み条件"""
+    min_rating = django_filters.NumberFilter(field_name='rating_avg', lookup_expr='gte')
+    min_rating_count = django_filters.NumberFilter(field_name='rating_count', lookup_expr='gte')
+    cooking_time_bucket = django_filters.ChoiceFilter(
+        choices=COOKING_TIME_BUCKET_CHOICES, method='filter_cooking_time_bucket'
+    )
+
+    class Meta:
+        model = Recipe
+        fields = ['category', 'difficulty', 'author']
+
+    def filter_cooking_time_bucket(self, queryset, name, value):
+        lower, upper = cooking_time_bucket_range(value)
+        if lower is not None:
+            queryset = queryset.filter(cooking_time__gte=lower)
+        if upper is not None:
+            queryset = queryset.filter(cooking_time__lte=upper)
+        return queryset
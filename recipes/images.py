@@ -0,0 +1,261 @@
+"""レシピ画像・手順画像の派生ファイル（サムネイル）生成
+
+アップロードされた画像から幅の異なる WebP / JPEG を生成し、
+モデルの image_derivatives に {形式: {幅: パス}} として記録する。
+生成はコミット後にバックグラウンドのスレッドで行い、リクエストを待たせない。
+
+元画像の扱い（ディスク使用量を抑えるための方針）:
+- 長辺が RECIPE_IMAGE_ORIGINAL_MAX_SIZE を超える元画像は、派生ファイル生成時に縮小して上書きする
+- 画像の差し替え・クリア・レコード削除時は、古い元画像と派生ファイルを削除する
+- どのレコードからも参照されないファイルは prune_recipe_images コマンドで削除する
+"""
+import io
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+# 生成する幅（px）。元画像より大きい幅は作らない
+DERIVATIVE_WIDTHS = (320, 640, 1280)
+DERIVATIVE_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+DERIVATIVE_DIR = 'derivatives'
+ORIGINAL_QUALITY = 90
+MAX_WORKERS = 2
+
+# 派生ファイルの記録後に送信する（sender はモデルクラス）
+derivatives_ready = Signal()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='recipe-images')
+        return _executor
+
+
+def derivative_name(source, width, fmt):
+    """元画像のパスから派生ファイルのパスを決める（例: derivatives/recipes/a_320w.webp）"""
+    stem = posixpath.splitext(source)[0]
+    return f'{DERIVATIVE_DIR}/{stem}_{width}w.{fmt}'
+
+
+def derivative_paths(derivatives):
+    """image_derivatives に記録されている派生ファイルのパス一覧"""
+    return [
+        path
+        for fmt in DERIVATIVE_FORMATS
+        for path in (derivatives or {}).get(fmt, {}).values()
+    ]
+
+
+def needs_derivatives(instance):
+    """画像があり、派生ファイルが未生成または別の画像のものかどうか"""
+    return bool(instance.image) and (instance.image_derivatives or {}).get('source') != instance.image.name
+
+
+def _to_rgb(image):
+    """透過を白背景で塗りつぶしてRGBに変換する（JPEGは透過を扱えないため）"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _encode(image, fmt):
+    pil_format, options = DERIVATIVE_FORMATS[fmt]
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def _replace_file(storage, name, content):
+    """同名のファイルを置き換える（Storage.save は既存ファイルがあると別名にするため）"""
+    if storage.exists(name):
+        storage.delete(name)
+    return storage.save(name, ContentFile(content))
+
+
+def delete_files(storage, names):
+    for name in names:
+        if name:
+            try:
+                storage.delete(name)
+            except OSError:
+                logger.warning('画像ファイルを削除できませんでした: %s', name, exc_info=True)
+
+
+def _original_max_size():
+    return getattr(settings, 'RECIPE_IMAGE_ORIGINAL_MAX_SIZE', None)
+
+
+def shrink_original(field_file, image):
+    """長辺が上限を超える元画像を縮小して上書きし、(ファイル名, 縮小後の画像) を返す"""
+    max_size = _original_max_size()
+    if not max_size or max(image.size) <= max_size:
+        return field_file.name, image
+
+    image = image.copy()
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+    # 拡張子と中身の形式を揃える
+    extension = posixpath.splitext(field_file.name)[1].lower()
+    pil_format = Image.registered_extensions().get(extension, 'JPEG')
+    options = {'quality': ORIGINAL_QUALITY} if pil_format in ('JPEG', 'WEBP') else {}
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    name = _replace_file(field_file.storage, field_file.name, buffer.getvalue())
+    return name, image
+
+
+def generate_derivatives(field_file):
+    """画像ファイルから派生ファイルを生成し、image_derivatives に保存する値を返す"""
+    storage = field_file.storage
+    with field_file.open('rb') as f:
+        image = Image.open(f)
+        # JPEGは必要な大きさに近い解像度でデコードさせ、巨大な写真の展開を避ける
+        scale = min(1, max(
+            max(DERIVATIVE_WIDTHS) / image.width,
+            (_original_max_size() or 0) / max(image.size),
+        ))
+        image.draft('RGB', (round(image.width * scale), round(image.height * scale)))
+        image = _to_rgb(ImageOps.exif_transpose(image))
+
+    source, image = shrink_original(field_file, image)
+    derivatives = {'source': source, 'width': image.width, 'height': image.height}
+    for fmt in DERIVATIVE_FORMATS:
+        derivatives[fmt] = {}
+
+    # 大きい順に縮小し、直前の縮小結果から次の幅を作る
+    resized = image
+    for width in sorted({min(width, image.width) for width in DERIVATIVE_WIDTHS}, reverse=True):
+        height = max(1, round(image.height * width / image.width))
+        if resized.width != width:
+            resized = resized.resize((width, height), Image.LANCZOS)
+        for fmt in DERIVATIVE_FORMATS:
+            name = derivative_name(source, width, fmt)
+            derivatives[fmt][str(width)] = _replace_file(storage, name, _encode(resized, fmt))
+    return derivatives
+
+
+def process_image(model, pk):
+    """レコード1件の派生ファイルを生成して記録する（差し替え前のファイルは削除する）"""
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not needs_derivatives(instance):
+        return False
+
+    source = instance.image.name
+    previous = instance.image_derivatives or {}
+    derivatives = generate_derivatives(instance.image)
+
+    values = {'image_derivatives': derivatives}
+    if derivatives['source'] != source:
+        values['image'] = derivatives['source']
+    # 処理中に画像が差し替えられていた場合は記録しない（新しい画像の処理に任せる）
+    updated = model.objects.filter(pk=pk, image=source).update(**values)
+    if not updated:
+        delete_files(instance.image.storage, derivative_paths(derivatives))
+        return False
+
+    if previous.get('source') and previous['source'] != source:
+        delete_files(instance.image.storage, [previous['source']] + derivative_paths(previous))
+    derivatives_ready.send(sender=model, instance=instance, derivatives=derivatives)
+    return True
+
+
+def _run(model, pk):
+    try:
+        process_image(model, pk)
+    except Exception:
+        logger.exception('画像の派生ファイル生成に失敗しました: %s(pk=%s)', model.__name__, pk)
+    finally:
+        # ワーカースレッドごとに開いた接続を残さない
+        connections.close_all()
+
+
+def schedule_derivatives(*instances):
+    """コミット後に派生ファイルを生成する
+
+    RECIPE_IMAGE_BACKGROUND が False の場合（テスト・コマンド実行時など）はその場で生成する。
+    """
+    # 主キーを取得できない bulk_create の行は generate_image_derivatives コマンドで補完する
+    targets = [
+        (type(instance), instance.pk) for instance in instances
+        if instance.pk is not None and needs_derivatives(instance)
+    ]
+    if not targets:
+        return
+
+    def submit():
+        background = getattr(settings, 'RECIPE_IMAGE_BACKGROUND', True)
+        for model, pk in targets:
+            if background:
+                _get_executor().submit(_run, model, pk)
+            else:
+                process_image(model, pk)
+    transaction.on_commit(submit)
+
+
+def schedule_cleanup(storage, derivatives, extra=()):
+    """コミット後に元画像・派生ファイルを削除する"""
+    names = list(extra) + derivative_paths(derivatives)
+    if derivatives:
+        names.append(derivatives.get('source'))
+    names = [name for name in dict.fromkeys(names) if name]
+    if names:
+        transaction.on_commit(lambda: delete_files(storage, names))
+
+
+def handle_image_save(instance):
+    """保存時に、新しい画像の派生ファイル生成または削除された画像の後始末を行う"""
+    derivatives = instance.image_derivatives or {}
+    if instance.image:
+        schedule_derivatives(instance)
+    elif derivatives:
+        schedule_cleanup(instance.image.storage, derivatives)
+        type(instance).objects.filter(pk=instance.pk).update(image_derivatives={})
+
+
+def handle_image_delete(instance):
+    """削除時に元画像と派生ファイルを削除する"""
+    extra = [instance.image.name] if instance.image else []
+    schedule_cleanup(instance.image.storage, instance.image_derivatives, extra)
+
+
+def build_srcset(instance, request=None):
+    """派生ファイルを <source srcset> にそのまま使える形式へ変換する
+
+    {'webp': 'https://.../a_320w.webp 320w, ...', 'jpeg': '...', 'width': 1280, 'height': 960}
+    生成前、または記録が現在の画像のものでない場合は None を返す。
+    """
+    derivatives = instance.image_derivatives or {}
+    if not instance.image or derivatives.get('source') != instance.image.name:
+        return None
+
+    storage = instance.image.storage
+    srcset = {'width': derivatives.get('width'), 'height': derivatives.get('height')}
+    for fmt in DERIVATIVE_FORMATS:
+        entries = []
+        for width, path in sorted(derivatives.get(fmt, {}).items(), key=lambda item: int(item[0])):
+            url = storage.url(path)
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            entries.append(f'{url} {width}w')
+        srcset[fmt] = ', '.join(entries)
+    return srcset
@@ -0,0 +1,127 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from recipes.benchmark import DEFAULT_THRESHOLD, BenchmarkRunner, compare
+
+
+class Command(BaseCommand):
+    help = (
+        'create_sample_data --recipes で生成したデータに対してAPIのベンチマークを実行し、'
+        'エンドポイントごとのレイテンシ・クエリ数・レスポンスサイズをJSONに保存します'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations', type=int, default=50,
+            help='シナリオごとの計測回数（デフォルト: 50）'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=5,
+            help='計測前に実行する回数（デフォルト: 5）'
+        )
+        parser.add_argument(
+            '--only', action='append', default=[],
+            help='計測するエンドポイント名（ワイルドカード可、複数指定可。例: recipe_list*）'
+        )
+        parser.add_argument(
+            '--heavy', action='store_true',
+            help='全件エクスポートなどの重いシナリオも実行する'
+        )
+        parser.add_argument(
+            '--cold-cache', action='store_true',
+            help='リクエストごとにキャッシュを空にして計測する'
+        )
+        parser.add_argument(
+            '--prefix', default='sample',
+            help='生成データのユーザー名の接頭辞（デフォルト: sample）'
+        )
+        parser.add_argument(
+            '--output', default='benchmark-results.json',
+            help='結果を保存するJSONファイル（デフォルト: benchmark-results.json）'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='比較するベースラインのJSONファイル'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=DEFAULT_THRESHOLD,
+            help=f'回帰とみなすp95の増加率（デフォルト: {DEFAULT_THRESHOLD}）'
+        )
+        parser.add_argument(
+            '--fail-on-regression', action='store_true',
+            help='回帰があった場合にエラー終了する'
+        )
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1 or options['warmup'] < 0:
+            raise CommandError('--iterations は1以上、--warmup は0以上を指定してください')
+
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline'], encoding='utf-8') as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'ベースラインを読み込めません: {e}')
+
+        runner = BenchmarkRunner(
+            iterations=options['iterations'],
+            warmup=options['warmup'],
+            only=options['only'],
+            heavy=options['heavy'],
+            cold_cache=options['cold_cache'],
+            prefix=options['prefix'],
+            report=self.stdout.write,
+        )
+        try:
+            results = runner.run()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+
+        self.write_results(results)
+        for name, reason in results['skipped'].items():
+            self.stdout.write(f'スキップ: {name}（{reason}）')
+
+        if baseline is not None:
+            rows = compare(results, baseline, options['threshold'])
+            self.write_comparison(rows)
+            regressions = [row['name'] for row in rows if row['regression']]
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'性能の回帰があります: {", ".join(regressions)}')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'{len(results["results"])}件のエンドポイントの結果を {options["output"]} に保存しました')
+        )
+
+    def write_results(self, results):
+        self.stdout.write(
+            f'{"endpoint":<28} {"p50":>9} {"p95":>9} {"p99":>9} {"queries":>8} {"bytes":>9}  status'
+        )
+        for name, result in results['results'].items():
+            latency = result['latency_ms']
+            status = ' '.join(f'{code}x{count}' for code, count in result['status'].items())
+            self.stdout.write(
+                f'{name:<28} {latency["p50"]:>9.2f} {latency["p95"]:>9.2f} {latency["p99"]:>9.2f} '
+                f'{result["queries"]["max"]:>8} {result["bytes"]["mean"]:>9.0f}  {status}'
+            )
+
+    def write_comparison(self, rows):
+        self.stdout.write('ベースラインとの比較（p95・最大クエリ数・ステータス）:')
+        for row in rows:
+            if row['new']:
+                self.stdout.write(f'  {row["name"]:<28} 新規')
+                continue
+            if row['missing']:
+                self.stdout.write(self.style.ERROR(f'  {row["name"]:<28} 今回の結果にありません'))
+                continue
+            line = (
+                f'  {row["name"]:<28} {row["baseline_p95_ms"]:>9.2f} -> {row["p95_ms"]:>9.2f}ms '
+                f'({row["p95_change"]:+.0%})  queries {row["baseline_queries"]} -> {row["queries"]}'
+            )
+            if row['status_changed']:
+                line += f'  status {",".join(row["baseline_status"])} -> {",".join(row["status"])}'
+            self.stdout.write(self.style.ERROR(line) if row['regression'] else line)
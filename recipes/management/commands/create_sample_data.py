@@ -1,27 +1,63 @@
-from django.core.management.base import BaseCommand
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
+from recipes import pantry, stats
+from recipes.facets import invalidate_facets
 from recipes.models import Category, Recipe, Ingredient, Step
-import random
+from recipes.sample_data import CATEGORIES, CHUNK_SIZE, SampleDataGenerator
 
 
 class Command(BaseCommand):
-    help = 'サンプルデータを作成します'
+    help = 'サンプルデータを作成します（--recipes を指定すると性能検証用の大量データを生成します）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int,
+            help='生成するレシピ数（指定すると大量生成モードになります）'
+        )
+        parser.add_argument(
+            '--users', type=int, default=100,
+            help='生成するユーザー数（デフォルト: 100）'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='乱数のシード。同じ値なら同じデータを生成します（デフォルト: 0）'
+        )
+        parser.add_argument(
+            '--prefix', default='sample',
+            help='生成するユーザー名の接頭辞（デフォルト: sample）'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=CHUNK_SIZE,
+            help=f'bulk_create 1回あたりの件数（デフォルト: {CHUNK_SIZE}）'
+        )
+        parser.add_argument(
+            '--favorites-per-user', type=int, default=10,
+            help='ユーザーあたりのお気に入り数の平均（デフォルト: 10）'
+        )
+        parser.add_argument(
+            '--ratings-per-user', type=int, default=5,
+            help='ユーザーあたりの評価数の平均（デフォルト: 5）'
+        )
+        parser.add_argument(
+            '--menus-per-user', type=int, default=2,
+            help='ユーザーあたりの週献立・買い物リスト数（デフォルト: 2）'
+        )
+        parser.add_argument(
+            '--skip-indexes', action='store_true',
+            help='生成後の検索インデックス・類似レシピの再構築を行わない'
+        )
 
     def handle(self, *args, **options):
+        if options['recipes'] is not None:
+            return self.generate_dataset(options)
+
         self.stdout.write('サンプルデータを作成中...')
 
         # カテゴリを作成
-        categories_data = [
-            {'name': '和食', 'description': '日本の伝統的な料理'},
-            {'name': '洋食', 'description': '西洋の料理'},
-            {'name': '中華', 'description': '中国の料理'},
-            {'name': 'イタリアン', 'description': 'イタリアの料理'},
-            {'name': 'デザート', 'description': 'スイーツ・デザート'},
-            {'name': 'サラダ', 'description': '野菜中心の料理'},
-        ]
-
         categories = []
-        for cat_data in categories_data:
+        for cat_data in CATEGORIES:
             category, created = Category.objects.get_or_create(
                 name=cat_data['name'],
                 defaults={'description': cat_data['description']}
@@ -154,4 +190,44 @@ class Command(BaseCommand):
 
         self.stdout.write(
             self.style.SUCCESS('サンプルデータの作成が完了しました！')
-        ) 
\ No newline at end of file
+        ) 
+
+    def generate_dataset(self, options):
+        if options['recipes'] < 0 or options['users'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--recipes は0以上、--users と --chunk-size は1以上を指定してください')
+
+        self.stdout.write(
+            f'大量データを生成中（レシピ {options["recipes"]}件・ユーザー {options["users"]}件・'
+            f'シード {options["seed"]}）...'
+        )
+        generator = SampleDataGenerator(
+            recipes=options['recipes'],
+            users=options['users'],
+            seed=options['seed'],
+            prefix=options['prefix'],
+            chunk_size=options['chunk_size'],
+            favorites_per_user=options['favorites_per_user'],
+            ratings_per_user=options['ratings_per_user'],
+            menus_per_user=options['menus_per_user'],
+            report=self.stdout.write,
+        )
+        try:
+            counts = generator.generate()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        # bulk_create はシグナルを発行しないため、キャッシュ・インデックスをまとめて作り直す
+        for name in stats.COUNTERS:
+            stats.invalidate_counter(name)
+        stats.invalidate_recent_recipes()
+        invalidate_facets()
+        cache.delete(pantry.GENERATION_KEY)
+        if not options['skip_indexes']:
+            call_command('rebuild_search_index', batch_size=1000, stdout=self.stdout)
+            call_command('rebuild_recipe_similarity', stdout=self.stdout)
+
+        seconds = counts.pop('seconds')
+        summary = '・'.join(f'{name} {count}件' for name, count in counts.items())
+        self.stdout.write(
+            self.style.SUCCESS(f'{sum(counts.values())}件を{seconds}秒で生成しました（{summary}）')
+        )
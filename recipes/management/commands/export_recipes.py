@@ -0,0 +1,42 @@
+import sys
+
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+from recipes.ndjson import DEFAULT_CHUNK_SIZE, export_ndjson
+
+
+class Command(BaseCommand):
+    help = 'レシピを材料・手順付きでNDJSON形式にエクスポートします'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', '-o', default='-',
+            help='出力先ファイル（デフォルト: 標準出力）'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+            help=f'1回のクエリで取得するレシピ数（デフォルト: {DEFAULT_CHUNK_SIZE}）'
+        )
+        parser.add_argument(
+            '--public-only', action='store_true',
+            help='公開レシピのみを出力します'
+        )
+
+    def handle(self, *args, **options):
+        queryset = Recipe.objects.all()
+        if options['public_only']:
+            queryset = queryset.filter(is_public=True)
+
+        output = options['output']
+        stream = sys.stdout.buffer if output == '-' else open(output, 'wb')
+        exported = 0
+        try:
+            for line in export_ndjson(queryset, options['chunk_size']):
+                stream.write(line)
+                exported += 1
+        finally:
+            if stream is not sys.stdout.buffer:
+                stream.close()
+
+        # 標準出力はデータ用のため、結果は標準エラーに出す
+        self.stderr.write(self.style.SUCCESS(f'{exported}件のレシピをエクスポートしました'))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from recipes.images import process_image
+from recipes.models import Recipe, Step
+
+
+class Command(BaseCommand):
+    help = 'レシピ画像・手順画像の派生ファイル（サムネイル）を生成します（未生成・画像差し替え済みのもの）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='1回の取得で扱う件数（デフォルト: 500）'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        for model in (Recipe, Step):
+            self.stdout.write(f'{model._meta.verbose_name}の画像を処理中...')
+            queryset = model.objects.exclude(Q(image='') | Q(image__isnull=True)).order_by('id')
+
+            processed = 0
+            failed = 0
+            last_id = 0
+            while True:
+                batch = list(queryset.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size])
+                if not batch:
+                    break
+                last_id = batch[-1]
+                for pk in batch:
+                    try:
+                        processed += process_image(model, pk)
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(f'{model.__name__}(id={pk}) の処理に失敗しました: {e}')
+
+            self.stdout.write(
+                self.style.SUCCESS(f'{processed}件の派生ファイルを生成しました（失敗: {failed}件）')
+            )
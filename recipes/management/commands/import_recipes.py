@@ -0,0 +1,50 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from recipes.ndjson import DEFAULT_CHUNK_SIZE, import_ndjson
+
+
+class Command(BaseCommand):
+    help = 'NDJSON形式のレシピを一括でインポートします'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='入力ファイル（"-" で標準入力）'
+        )
+        parser.add_argument(
+            '--author', required=True,
+            help='インポートしたレシピの作成者にするユーザー名'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+            help=f'1回のトランザクションで登録するレシピ数（デフォルト: {DEFAULT_CHUNK_SIZE}）'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            author = User.objects.get(username=options['author'])
+        except User.DoesNotExist:
+            raise CommandError(f'ユーザー「{options["author"]}」が見つかりません')
+
+        path = options['path']
+        stream = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        progress = {'processed': 0, 'imported': 0, 'failed': 0}
+        try:
+            for progress in import_ndjson(stream, author, options['chunk_size']):
+                for error in progress['errors']:
+                    self.stderr.write(f'{error["line"]}行目: {error["errors"]}')
+                self.stdout.write(
+                    f'{progress["processed"]}件処理 / {progress["imported"]}件登録 / '
+                    f'{progress["failed"]}件失敗'
+                )
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{progress["imported"]}件のレシピをインポートしました（失敗: {progress["failed"]}件）'
+            )
+        )
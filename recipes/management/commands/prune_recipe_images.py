@@ -0,0 +1,62 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from recipes.images import DERIVATIVE_DIR, derivative_paths
+from recipes.models import Recipe, Step
+
+
+class Command(BaseCommand):
+    help = 'どのレシピ・手順からも参照されていない画像ファイル（元画像・派生ファイル）を削除します'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age-hours', type=int, default=24,
+            help='この時間より新しいファイルは削除しない（アップロード処理中のファイルを守るため。デフォルト: 24）'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='削除は行わず、対象ファイル数のみ表示します'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        cutoff = timezone.now() - timedelta(hours=options['min_age_hours'])
+
+        referenced = set()
+        directories = {DERIVATIVE_DIR}
+        for model in (Recipe, Step):
+            directories.add(model._meta.get_field('image').upload_to.rstrip('/'))
+            for name, derivatives in model.objects.exclude(image='').values_list('image', 'image_derivatives').iterator():
+                if name:
+                    referenced.add(name)
+                referenced.update(derivative_paths(derivatives))
+
+        self.stdout.write('参照されていない画像ファイルを検索中...')
+        removed = 0
+        freed = 0
+        for directory in sorted(directories):
+            for name in self.walk(directory):
+                if name in referenced or default_storage.get_modified_time(name) > cutoff:
+                    continue
+                removed += 1
+                freed += default_storage.size(name)
+                if not dry_run:
+                    default_storage.delete(name)
+
+        size = f'{freed / 1024 / 1024:.1f}MB'
+        if dry_run:
+            self.stdout.write(f'{removed}件（{size}）のファイルが削除対象です（dry-run）')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{removed}件（{size}）のファイルを削除しました'))
+
+    def walk(self, directory):
+        """ストレージ上のディレクトリ配下のファイル名を再帰的に返す"""
+        if not default_storage.exists(directory):
+            return
+        subdirectories, files = default_storage.listdir(directory)
+        for name in files:
+            yield f'{directory}/{name}'
+        for subdirectory in subdirectories:
+            yield from self.walk(f'{directory}/{subdirectory}')
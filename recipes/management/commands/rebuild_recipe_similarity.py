@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from recipes.similarity import BATCH_SIZE, METRICS, TOP_K, get_metric, rebuild_similarities
+
+
+class Command(BaseCommand):
+    help = '材料の重なりによる類似レシピ（上位k件）を全件作り直します'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-k', type=int, default=TOP_K,
+            help=f'レシピごとに保存する類似レシピの件数（デフォルト: {TOP_K}）'
+        )
+        parser.add_argument(
+            '--metric', choices=METRICS, default=None,
+            help='類似度の種類（デフォルト: settings.RECIPE_SIMILARITY_METRIC）'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help=f'1回の行列積・保存で扱うレシピ数（デフォルト: {BATCH_SIZE}）'
+        )
+
+    def handle(self, *args, **options):
+        metric = options['metric'] or get_metric()
+
+        self.stdout.write(f'類似レシピを再計算中（{metric}）...')
+        processed = rebuild_similarities(
+            k=options['top_k'], metric=metric, batch_size=options['batch_size']
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f'{processed}件のレシピの類似レシピを再計算しました')
+        )
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+from recipes.search import index_recipes
+
+
+class Command(BaseCommand):
+    help = 'レシピ検索用のN-gramインデックスを全件作り直します'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='1回の処理で扱うレシピ数（デフォルト: 500）'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        self.stdout.write('検索インデックスを再構築中...')
+
+        indexed = 0
+        last_id = 0
+        while True:
+            batch = list(
+                Recipe.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .prefetch_related('ingredients', 'steps')[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].id
+            index_recipes(batch)
+            indexed += len(batch)
+            self.stdout.write(f'{indexed}件を処理しました')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'{indexed}件のレシピの検索インデックスを再構築しました')
+        )
@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from recipes.models import Recipe, RecipeFavorite
+from recipes.representations import invalidate_representations
+
+
+class Command(BaseCommand):
+    help = 'レシピのお気に入り数をRecipeFavoriteの実件数と突き合わせて修復します'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='1回の処理で扱うレシピ数（デフォルト: 1000）'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='修復は行わず、ずれているレシピ数のみ表示します'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+
+        self.stdout.write('お気に入り数を照合中...')
+
+        checked = 0
+        fixed = 0
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                # 主キー順にバッチで取得し、照合中の同時更新を防ぐため行ロックする
+                batch = list(
+                    Recipe.objects.select_for_update()
+                    .filter(id__gt=last_id)
+                    .order_by('id')
+                    .values_list('id', 'favorite_count')[:batch_size]
+                )
+                if not batch:
+                    break
+                last_id = batch[-1][0]
+                checked += len(batch)
+
+                ids = [recipe_id for recipe_id, _ in batch]
+                actual_counts = dict(
+                    RecipeFavorite.objects.filter(recipe_id__in=ids)
+                    .values('recipe_id')
+                    .annotate(count=Count('id'))
+                    .values_list('recipe_id', 'count')
+                )
+
+                drifted = [
+                    Recipe(id=recipe_id, favorite_count=actual_counts.get(recipe_id, 0))
+                    for recipe_id, stored in batch
+                    if stored != actual_counts.get(recipe_id, 0)
+                ]
+                fixed += len(drifted)
+                if drifted and not dry_run:
+                    Recipe.objects.bulk_update(drifted, ['favorite_count'])
+                    invalidate_representations(*[recipe.id for recipe in drifted])
+
+        if dry_run:
+            self.stdout.write(f'{checked}件中 {fixed}件のお気に入り数がずれています（dry-run）')
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(f'{checked}件中 {fixed}件のお気に入り数を修復しました')
+            )
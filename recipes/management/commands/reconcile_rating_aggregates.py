@@ -0,0 +1,89 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from recipes.facets import invalidate_facets
+from recipes.models import Recipe, RecipeRating
+from recipes.representations import invalidate_representations
+
+
+RATING_FIELDS = ['rating_avg', 'rating_count', 'rating_sum'] + [f'rating_{star}' for star in range(1, 6)]
+
+
+class Command(BaseCommand):
+    help = 'レシピの評価集計値（平均・件数・分布）をRecipeRatingから再計算して検証・修復します'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='1回の処理で扱うレシピ数（デフォルト: 1000）'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='修復は行わず、ずれているレシピ数のみ表示します'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+
+        self.stdout.write('評価集計値を照合中...')
+
+        checked = 0
+        fixed = 0
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                # 主キー順にバッチで取得し、照合中の評価変更を防ぐため行ロックする
+                batch = list(
+                    Recipe.objects.select_for_update()
+                    .filter(id__gt=last_id)
+                    .order_by('id')
+                    .only(*RATING_FIELDS)[:batch_size]
+                )
+                if not batch:
+                    break
+                last_id = batch[-1].id
+                checked += len(batch)
+
+                # レシピ×評価値ごとの件数を1クエリで集計
+                histograms = {}
+                rows = (
+                    RecipeRating.objects.filter(recipe_id__in=[recipe.id for recipe in batch])
+                    .values('recipe_id', 'rating')
+                    .annotate(count=Count('id'))
+                    .values_list('recipe_id', 'rating', 'count')
+                )
+                for recipe_id, rating, count in rows:
+                    histograms.setdefault(recipe_id, {})[rating] = count
+
+                drifted = []
+                for recipe in batch:
+                    histogram = histograms.get(recipe.id, {})
+                    expected = {f'rating_{star}': histogram.get(star, 0) for star in range(1, 6)}
+                    expected['rating_count'] = sum(histogram.values())
+                    expected['rating_sum'] = sum(star * count for star, count in histogram.items())
+                    expected['rating_avg'] = Recipe.calculate_rating_avg(
+                        expected['rating_sum'], expected['rating_count']
+                    )
+                    if any(getattr(recipe, field) != value for field, value in expected.items()):
+                        for field, value in expected.items():
+                            setattr(recipe, field, value)
+                        drifted.append(recipe)
+
+                fixed += len(drifted)
+                if drifted and not dry_run:
+                    # bulk_update では auto_now が働かないため、更新日時も書き込む
+                    now = timezone.now()
+                    for recipe in drifted:
+                        recipe.updated_at = now
+                    Recipe.objects.bulk_update(drifted, RATING_FIELDS + ['updated_at'])
+                    invalidate_representations(*[recipe.id for recipe in drifted])
+                    invalidate_facets('ratings')
+
+        if dry_run:
+            self.stdout.write(f'{checked}件中 {fixed}件の評価集計値がずれています（dry-run）')
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(f'{checked}件中 {fixed}件の評価集計値を修復しました')
+            )
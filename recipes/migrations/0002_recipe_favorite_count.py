@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-17 00:32
+
+from django.db import migrations, models
+
+
+def backfill_favorite_count(apps, schema_editor):
+    """既存のお気に入り件数をfavorite_countへ反映"""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeFavorite = apps.get_model('recipes', 'RecipeFavorite')
+    counts = (
+        RecipeFavorite.objects.values('recipe_id')
+        .annotate(count=models.Count('id'))
+        .values_list('recipe_id', 'count')
+    )
+    recipes = [Recipe(id=recipe_id, favorite_count=count) for recipe_id, count in counts]
+    Recipe.objects.bulk_update(recipes, ['favorite_count'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorite_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='お気に入り数'),
+        ),
+        migrations.RunPython(backfill_favorite_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-17 00:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_recipe_favorite_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['is_public', '-created_at', '-id'], name='recipe_public_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='recipe_author_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipefavorite',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='favorite_user_feed_idx'),
+        ),
+    ]
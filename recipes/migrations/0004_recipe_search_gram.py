@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-17 00:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_feed_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSearchGram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gram', models.CharField(max_length=2, verbose_name='N-gram')),
+                ('weight', models.PositiveIntegerField(default=1, verbose_name='重み')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_grams', to='recipes.recipe', verbose_name='レシピ')),
+            ],
+            options={
+                'verbose_name': '検索インデックス',
+                'verbose_name_plural': '検索インデックス',
+                'indexes': [models.Index(fields=['gram', 'recipe', 'weight'], name='recipe_search_gram_idx')],
+            },
+        ),
+    ]
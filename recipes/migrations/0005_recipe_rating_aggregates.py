@@ -0,0 +1,88 @@
+# Generated by Django 5.2.3 on 2026-10-17 00:39
+
+from django.conf import settings
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    """既存の評価から集計値を計算して反映"""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeRating = apps.get_model('recipes', 'RecipeRating')
+    histograms = {}
+    rows = (
+        RecipeRating.objects.values('recipe_id', 'rating')
+        .annotate(count=models.Count('id'))
+        .values_list('recipe_id', 'rating', 'count')
+    )
+    for recipe_id, rating, count in rows:
+        histograms.setdefault(recipe_id, {})[rating] = count
+
+    recipes = []
+    for recipe_id, histogram in histograms.items():
+        recipe = Recipe(id=recipe_id)
+        for star in range(1, 6):
+            setattr(recipe, f'rating_{star}', histogram.get(star, 0))
+        recipe.rating_count = sum(histogram.values())
+        recipe.rating_sum = sum(star * count for star, count in histogram.items())
+        recipe.rating_avg = (Decimal(recipe.rating_sum) / recipe.rating_count).quantize(Decimal('0.01'))
+        recipes.append(recipe)
+    fields = ['rating_avg', 'rating_count', 'rating_sum'] + [f'rating_{star}' for star in range(1, 6)]
+    Recipe.objects.bulk_update(recipes, fields, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_search_gram'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0, verbose_name='★1の件数'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0, verbose_name='★2の件数'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0, verbose_name='★3の件数'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0, verbose_name='★4の件数'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0, verbose_name='★5の件数'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_avg',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=3, verbose_name='平均評価'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='評価数'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, verbose_name='評価合計'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['is_public', '-rating_avg', '-rating_count'], name='recipe_rating_idx'),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-17 00:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='画像派生ファイル'),
+        ),
+        migrations.AddField(
+            model_name='step',
+            name='image_derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='手順画像派生ファイル'),
+        ),
+    ]
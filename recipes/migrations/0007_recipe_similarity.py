@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-17 00:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='類似度')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similarities', to='recipes.recipe', verbose_name='レシピ')),
+                ('similar_recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_to', to='recipes.recipe', verbose_name='類似レシピ')),
+            ],
+            options={
+                'verbose_name': '類似レシピ',
+                'verbose_name_plural': '類似レシピ',
+                'ordering': ['-score', 'similar_recipe'],
+                'indexes': [models.Index(fields=['recipe', '-score'], name='recipe_similarity_idx')],
+                'unique_together': {('recipe', 'similar_recipe')},
+            },
+        ),
+    ]
@@ -1,6 +1,8 @@
+from decimal import Decimal
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 
 
 class Category(models.Model):
@@ -30,6 +32,7 @@ class Recipe(models.Model):
     description = models.TextField('説明', blank=True)
     youtube_url = models.URLField('YouTube URL', blank=True, null=True)
     image = models.ImageField('画像', upload_to='recipes/', blank=True, null=True)
+    image_derivatives = models.JSONField('画像派生ファイル', default=dict, blank=True, editable=False)
     
     # 調理情報
     cooking_time = models.PositiveIntegerField('調理時間（分）', default=30)
@@ -64,6 +67,18 @@ class Recipe(models.Model):
         related_name='favorite_recipes',
         blank=True
     )
+    # お気に入り数（RecipeFavoriteの件数を非正規化して保持）
+    favorite_count = models.PositiveIntegerField('お気に入り数', default=0, db_index=True)
+    
+    # 評価の集計値（RecipeRatingを非正規化して保持）
+    rating_avg = models.DecimalField('平均評価', max_digits=3, decimal_places=2, default=0)
+    rating_count = models.PositiveIntegerField('評価数', default=0)
+    rating_sum = models.PositiveIntegerField('評価合計', default=0)
+    rating_1 = models.PositiveIntegerField('★1の件数', default=0)
+    rating_2 = models.PositiveIntegerField('★2の件数', default=0)
+    rating_3 = models.PositiveIntegerField('★3の件数', default=0)
+    rating_4 = models.PositiveIntegerField('★4の件数', default=0)
+    rating_5 = models.PositiveIntegerField('★5の件数', default=0)
     
     # メタデータ
     created_at = models.DateTimeField('作成日時', auto_now_add=True)
@@ -74,14 +89,106 @@ class Recipe(models.Model):
         verbose_name = 'レシピ'
         verbose_name_plural = 'レシピ'
         ordering = ['-created_at']
+        indexes = [
+            # キーセットページネーション用（公開フィード・自分のレシピ）
+            models.Index(fields=['is_public', '-created_at', '-id'], name='recipe_public_feed_idx'),
+            models.Index(fields=['author', '-created_at', '-id'], name='recipe_author_feed_idx'),
+            # 評価順の並べ替え・絞り込み用
+            models.Index(fields=['is_public', '-rating_avg', '-rating_count'], name='recipe_rating_idx'),
+        ]
+
+    # 保存時に変更を検出するフィールド（ファセット・検索インデックスの更新対象を絞るため）
+    TRACKED_FIELDS = ('title', 'description', 'cooking_time', 'difficulty', 'category_id', 'author_id', 'is_public')
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = instance._tracked_values()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        # 読み直した値を読み込み時点の値とする（読み直していないフィールドの変更は残す）
+        self._remember_values(fields and [self._meta.get_field(name).attname for name in fields])
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        self._remember_values(update_fields and [self._meta.get_field(name).attname for name in update_fields])
+
+    def _tracked_values(self):
+        deferred = self.get_deferred_fields()
+        return {name: getattr(self, name) for name in self.TRACKED_FIELDS if name not in deferred}
+
+    def _remember_values(self, attnames=None):
+        current = self._tracked_values()
+        loaded = getattr(self, '_loaded_values', None)
+        if attnames is None or loaded is None:
+            self._loaded_values = current
+        else:
+            self._loaded_values = {**loaded, **{name: current[name] for name in attnames if name in current}}
+
+    def get_changed_fields(self, update_fields=None):
+        """読み込み後に変更された TRACKED_FIELDS と変更前の値（{attname: 変更前の値}）
+
+        post_save のシグナルハンドラーから呼ぶと、その保存で変更された値を返す。
+        update_fields を渡すと、そのフィールドに限る。DBから読み込んでいない
+        インスタンスでは変更前の値がわからないため None を返す。
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return None
+        missing = object()
+        changed = {
+            name: loaded.get(name)
+            for name, value in self._tracked_values().items()
+            if loaded.get(name, missing) != value
+        }
+        if update_fields is not None:
+            saved = {self._meta.get_field(name).attname for name in update_fields}
+            changed = {name: value for name, value in changed.items() if name in saved}
+        return changed
+
     @property
-    def favorite_count(self):
-        """お気に入り数を取得"""
-        return self.favorites.count()
+    def rating_histogram(self):
+        """評価ごとの件数を取得"""
+        return {star: getattr(self, f'rating_{star}') for star in range(1, 6)}
+
+    @staticmethod
+    def calculate_rating_avg(rating_sum, rating_count):
+        """評価合計と件数から平均評価を計算"""
+        if not rating_count:
+            return Decimal('0')
+        return (Decimal(rating_sum) / rating_count).quantize(Decimal('0.01'))
+
+    def apply_rating_change(self, added=None, removed=None):
+        """評価の追加・変更・削除を集計値に反映する
+
+        select_for_update() でロックしたインスタンスに対し、評価の保存と
+        同じトランザクション内で呼ぶこと。シグナルを発行しないよう update() で書き込む
+        （update() では auto_now が働かないため、更新日時も明示的に書き込む）。
+        """
+        from .facets import invalidate_facets
+        from .representations import invalidate_representations
+
+        if removed is not None:
+            self.rating_count -= 1
+            self.rating_sum -= removed
+            setattr(self, f'rating_{removed}', getattr(self, f'rating_{removed}') - 1)
+        if added is not None:
+            self.rating_count += 1
+            self.rating_sum += added
+            setattr(self, f'rating_{added}', getattr(self, f'rating_{added}') + 1)
+        self.rating_avg = self.calculate_rating_avg(self.rating_sum, self.rating_count)
+        self.updated_at = timezone.now()
+
+        fields = ['rating_avg', 'rating_count', 'rating_sum', 'updated_at'] + [f'rating_{star}' for star in range(1, 6)]
+        Recipe.objects.filter(pk=self.pk).update(**{field: getattr(self, field) for field in fields})
+        invalidate_representations(self.pk)
+        invalidate_facets('ratings')
 
 
 class Ingredient(models.Model):
@@ -137,6 +244,7 @@ class Step(models.Model):
     step_number = models.PositiveIntegerField('手順番号')
     description = models.TextField('手順内容')
     image = models.ImageField('手順画像', upload_to='steps/', blank=True, null=True)
+    image_derivatives = models.JSONField('手順画像派生ファイル', default=dict, blank=True, editable=False)
     cooking_time = models.PositiveIntegerField('所要時間（分）', blank=True, null=True)
 
     class Meta:
@@ -160,6 +268,9 @@ class RecipeFavorite(models.Model):
         verbose_name_plural = 'お気に入り'
         unique_together = ['user', 'recipe']
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='favorite_user_feed_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.recipe.title}"
@@ -185,3 +296,59 @@ class RecipeRating(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.recipe.title} ({self.rating}★)"
+
+
+class RecipeSearchGram(models.Model):
+    """レシピ検索用の文字N-gram転置インデックス
+
+    タイトル・説明・材料名・手順を正規化し、1文字/2文字のN-gram単位で
+    出現重みを保持する。分かち書きを必要としないため日本語でもそのまま検索できる。
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='search_grams',
+        verbose_name='レシピ'
+    )
+    gram = models.CharField('N-gram', max_length=2)
+    weight = models.PositiveIntegerField('重み', default=1)
+
+    class Meta:
+        verbose_name = '検索インデックス'
+        verbose_name_plural = '検索インデックス'
+        indexes = [
+            # 検索時にテーブル本体を読まずに集計できるよう重みまで含める
+            models.Index(fields=['gram', 'recipe', 'weight'], name='recipe_search_gram_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.gram} - {self.recipe_id} ({self.weight})"
+
+
+class RecipeSimilarity(models.Model):
+    """類似レシピ（材料の重なりから事前計算した上位k件）"""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similarities',
+        verbose_name='レシピ'
+    )
+    similar_recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_to',
+        verbose_name='類似レシピ'
+    )
+    score = models.FloatField('類似度')
+
+    class Meta:
+        verbose_name = '類似レシピ'
+        verbose_name_plural = '類似レシピ'
+        ordering = ['-score', 'similar_recipe']
+        unique_together = ['recipe', 'similar_recipe']
+        indexes = [
+            models.Index(fields=['recipe', '-score'], name='recipe_similarity_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.recipe.title} → {self.similar_recipe.title} ({self.score:.2f})"
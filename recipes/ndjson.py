@@ -0,0 +1,154 @@
+"""レシピのNDJSON形式での一括エクスポート・インポート
+
+1行1レシピ（材料・手順を含む）のNDJSONを、全件をメモリに載せずに読み書きする。
+カテゴリは環境ごとにIDが異なるため名前で受け渡す。画像は対象外。
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .models import Category
+from .serializers import RecipeBulkCreateSerializer, RecipeCreateSerializer
+
+
+RECIPE_FIELDS = [
+    'title', 'description', 'youtube_url', 'cooking_time', 'servings',
+    'difficulty', 'is_public', 'created_at', 'updated_at',
+]
+INGREDIENT_FIELDS = ['name', 'amount', 'unit', 'notes', 'order']
+STEP_FIELDS = ['step_number', 'description', 'cooking_time']
+
+DEFAULT_CHUNK_SIZE = 500
+# 1回の進捗報告に含めるエラーの上限
+MAX_REPORTED_ERRORS = 20
+
+
+def recipe_to_record(recipe):
+    """レシピ1件をエクスポート用のdictに変換（材料・手順はprefetch済みを想定）"""
+    record = {field: getattr(recipe, field) for field in RECIPE_FIELDS}
+    record['category'] = recipe.category.name if recipe.category else None
+    record['author'] = recipe.author.username
+    record['ingredients'] = [
+        {field: getattr(ingredient, field) for field in INGREDIENT_FIELDS}
+        for ingredient in recipe.ingredients.all()
+    ]
+    record['steps'] = [
+        {field: getattr(step, field) for field in STEP_FIELDS}
+        for step in recipe.steps.all()
+    ]
+    return record
+
+
+def iter_recipes(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """主キー順にチャンク単位で取得し、1件ずつ返す（クエリセット全体を保持しない）"""
+    queryset = queryset.order_by('id').select_related('category', 'author').prefetch_related(
+        'ingredients', 'steps'
+    )
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return
+        yield from chunk
+        last_id = chunk[-1].id
+
+
+def export_ndjson(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """レシピをNDJSONの行（bytes）として順に返す"""
+    for recipe in iter_recipes(queryset, chunk_size):
+        line = json.dumps(recipe_to_record(recipe), ensure_ascii=False, cls=DjangoJSONEncoder)
+        yield (line + '\n').encode('utf-8')
+
+
+class RecipeImporter:
+    """NDJSONのレシピをチャンク単位でまとめて登録する
+
+    各チャンクはカテゴリの作成を含めて1トランザクションにまとめて挿入し、
+    コミットしてから進捗を返す（ストリーミング中の書き込みもチャンク単位で完結させる）。
+    不正な行はスキップし、行番号付きでエラーとして報告する。
+    """
+
+    def __init__(self, author, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.author = author
+        self.chunk_size = chunk_size
+        self.categories = {}
+        self.processed = 0
+        self.imported = 0
+        self.failed = 0
+
+    def run(self, lines):
+        """行のイテラブルを読み込み、チャンクごとに進捗（dict）を返す"""
+        chunk = []
+        errors = []
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+
+            self.processed += 1
+            validated, error = self.validate_line(line)
+            if error is not None:
+                self.failed += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({'line': line_number, 'errors': error})
+            else:
+                chunk.append(validated)
+
+            if self.processed % self.chunk_size == 0:
+                yield self.flush(chunk, errors)
+                chunk = []
+                errors = []
+
+        if chunk or errors:
+            yield self.flush(chunk, errors)
+
+    def validate_line(self, line):
+        # json.loads は bytes も受け付け、UTF-8として不正な場合も ValueError になる
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            return None, f'JSONの形式が正しくありません: {e}'
+        if not isinstance(record, dict):
+            return None, 'レシピはJSONオブジェクトで指定してください'
+
+        category_name = record.pop('category', None)
+        serializer = RecipeCreateSerializer(data=record)
+        if not serializer.is_valid():
+            return None, serializer.errors
+
+        validated = serializer.validated_data
+        validated['author'] = self.author
+        # カテゴリはチャンクの登録と同じトランザクションで作成する
+        validated['category'] = category_name or None
+        return validated, None
+
+    def get_category(self, name, created):
+        """カテゴリ名からカテゴリを取得（なければ作成する。コミット後にキャッシュへ移す）"""
+        if not name:
+            return None
+        if name not in self.categories and name not in created:
+            created[name], _ = Category.objects.get_or_create(name=name)
+        return self.categories.get(name) or created[name]
+
+    def flush(self, chunk, errors):
+        if chunk:
+            created = {}
+            with transaction.atomic():
+                for validated in chunk:
+                    validated['category'] = self.get_category(validated['category'], created)
+                RecipeBulkCreateSerializer(child=RecipeCreateSerializer()).create(chunk)
+            # ロールバックされたカテゴリを使わないよう、コミット後にキャッシュする
+            self.categories.update(created)
+            self.imported += len(chunk)
+        return {
+            'processed': self.processed,
+            'imported': self.imported,
+            'failed': self.failed,
+            'errors': errors,
+        }
+
+
+def import_ndjson(lines, author, chunk_size=DEFAULT_CHUNK_SIZE):
+    """NDJSONの行を読み込んでレシピを登録し、チャンクごとの進捗を返す"""
+    return RecipeImporter(author, chunk_size).run(lines)
+
@@ -0,0 +1,131 @@
+import base64
+from collections import OrderedDict
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class RecipeFeedPagination(PageNumberPagination):
+    """レシピフィード用のページネーション
+
+    既定はページ番号方式（?page=N）。?cursor= を付けると (created_at, id) の
+    キーセット方式に切り替わり、OFFSETを使わないため何ページ目でも同じコストになる。
+    カーソル方式は常に新しい順（-created_at, -id）で返す。
+    総件数の COUNT(*) はページ番号方式では ?count=false で省略でき、カーソル方式では
+    既定で省略する（?count=true で含める）。
+    """
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = '無効なカーソルです'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        # 無限スクロールでは総件数を使わないため、カーソル方式では既定で数えない
+        self.include_count = request.query_params.get(
+            self.count_query_param, 'false' if self.cursor_mode else 'true'
+        ).lower() not in ('false', '0')
+        self.count = None
+
+        if self.cursor_mode:
+            return self.paginate_by_cursor(queryset, request)
+        if self.include_count:
+            return super().paginate_queryset(queryset, request, view)
+        return self.paginate_without_count(queryset, request)
+
+    def paginate_by_cursor(self, queryset, request):
+        """(created_at, id) より後ろの行をインデックスに沿って取得する"""
+        page_size = self.get_page_size(request)
+        if self.include_count:
+            self.count = queryset.count()
+
+        queryset = queryset.order_by('-created_at', '-id')
+        position = self.decode_cursor(request)
+        if position is not None:
+            created_at, pk = position
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            )
+
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        self.next_cursor = self.encode_cursor(rows[-1]) if self.has_next else None
+        return rows
+
+    def paginate_without_count(self, queryset, request):
+        """COUNT(*) を発行せず、1件多く取得して次ページの有無を判定する"""
+        page_size = self.get_page_size(request)
+        try:
+            self.page_number = max(int(request.query_params.get(self.page_query_param, 1)), 1)
+        except ValueError:
+            raise NotFound(self.invalid_page_message)
+
+        offset = (self.page_number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1])
+        self.has_next = len(rows) > page_size
+        return rows[:page_size]
+
+    def encode_cursor(self, instance):
+        position = f'{instance.created_at.isoformat()}|{instance.pk}'
+        return base64.urlsafe_b64encode(position.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8')
+            created_at, pk = position.rsplit('|', 1)
+            return datetime.fromisoformat(created_at), int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if self.cursor_mode:
+            if not self.next_cursor:
+                return None
+            url = self.request.build_absolute_uri()
+            return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+        if not self.include_count:
+            if not self.has_next:
+                return None
+            url = self.request.build_absolute_uri()
+            return replace_query_param(url, self.page_query_param, self.page_number + 1)
+        return super().get_next_link()
+
+    def get_previous_link(self):
+        if self.cursor_mode:
+            # キーセット方式は前方向のみ（無限スクロール用）
+            return None
+        if not self.include_count:
+            if self.page_number <= 1:
+                return None
+            url = self.request.build_absolute_uri()
+            if self.page_number == 2:
+                return remove_query_param(url, self.page_query_param)
+            return replace_query_param(url, self.page_query_param, self.page_number - 1)
+        return super().get_previous_link()
+
+    def get_state(self):
+        """総件数と前後ページのリンク（条件付きGETのETag計算用）"""
+        count = self.count
+        if not self.cursor_mode and self.include_count:
+            count = self.page.paginator.count
+        return count, self.get_next_link(), self.get_previous_link()
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode and self.include_count:
+            return super().get_paginated_response(data)
+
+        payload = OrderedDict()
+        if self.count is not None:
+            payload['count'] = self.count
+        payload['next'] = self.get_next_link()
+        payload['previous'] = self.get_previous_link()
+        payload['results'] = data
+        return Response(payload)
@@ -0,0 +1,215 @@
+"""手持ちの材料で作れるレシピ（材料→レシピの転置インデックス）
+
+公開レシピの材料名（similarity.ingredient_term で正規化）ごとに、その材料を含む
+レシピの行番号の配列（ポスティングリスト）をプロセス内に保持する。
+手持ちの材料のポスティングリストを連結して数えるだけで、全レシピについて
+「使える材料の数」と「足りない材料の数」が求まり、各レシピの材料一覧は走査しない。
+
+レシピ・材料の変更はコミット後に世代番号とともにキャッシュへ記録し、
+各プロセスは次の検索時に自分の世代以降の変更分だけをDBから読み直して差し替える。
+記録が欠けている（有効期限切れ・取りこぼし）場合は全件を読み直す。
+"""
+import threading
+import time
+
+import numpy as np
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .similarity import ingredient_term, load_terms
+
+
+GENERATION_KEY = 'recipes:pantry:generation'
+CHANGES_PREFIX = 'recipes:pantry:changes:'
+CHANGES_TIMEOUT = 60 * 60
+# 追いつくために読み直す世代数の上限（超えた場合は全件を読み直す）
+MAX_REPLAY = 100
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+MAX_INGREDIENTS = 100
+
+
+def normalize_terms(names):
+    """入力された材料名を照合用の語の集合にする"""
+    return {term for term in (ingredient_term(name) for name in names) if term}
+
+
+class IngredientIndex:
+    """材料→レシピのポスティングリスト
+
+    レシピは追加順の行番号で表し、ポスティングリストは行番号の昇順の配列で持つ。
+    削除したレシピの行は材料数0のまま残す（どの検索にも一致しない）。
+    """
+
+    def __init__(self, rows=None):
+        self.postings = {}
+        self.row_of = {}
+        self.terms_of = []
+        self.recipe_ids = np.zeros(0, dtype=np.int64)
+        self.sizes = np.zeros(0, dtype=np.int32)
+        if rows:
+            self.set_rows(rows)
+
+    def _row(self, recipe_id):
+        row = self.row_of.get(recipe_id)
+        if row is None:
+            row = self.row_of[recipe_id] = len(self.terms_of)
+            self.terms_of.append(frozenset())
+        return row
+
+    def set_rows(self, rows):
+        """{レシピID: 材料名の集合} でレシピの材料を差し替える（空集合の場合は取り除く）"""
+        added = {}
+        removed = {}
+        changed_rows = []
+        for recipe_id, terms in rows.items():
+            if not terms and recipe_id not in self.row_of:
+                continue
+            row = self._row(recipe_id)
+            terms = frozenset(terms)
+            previous = self.terms_of[row]
+            for term in terms - previous:
+                added.setdefault(term, []).append(row)
+            for term in previous - terms:
+                removed.setdefault(term, []).append(row)
+            self.terms_of[row] = terms
+            changed_rows.append((row, recipe_id, len(terms)))
+
+        for term in added.keys() | removed.keys():
+            posting = self.postings.get(term, np.zeros(0, dtype=np.int32))
+            if term in removed:
+                posting = posting[~np.isin(posting, removed[term])]
+            if term in added:
+                posting = np.union1d(posting, np.array(added[term], dtype=np.int32))
+            if len(posting):
+                self.postings[term] = posting.astype(np.int32, copy=False)
+            else:
+                self.postings.pop(term, None)
+
+        grow = len(self.terms_of) - len(self.sizes)
+        if grow:
+            self.recipe_ids = np.concatenate((self.recipe_ids, np.zeros(grow, dtype=np.int64)))
+            self.sizes = np.concatenate((self.sizes, np.zeros(grow, dtype=np.int32)))
+        for row, recipe_id, size in changed_rows:
+            self.recipe_ids[row] = recipe_id
+            self.sizes[row] = size
+
+    def search(self, terms, limit=DEFAULT_LIMIT, max_missing=None):
+        """手持ちの材料 terms で作れるレシピを、足りない材料が少ない順に返す
+
+        [(レシピID, 使える材料の数, 足りない材料の数), ...] を返す。
+        足りない材料の数が同じ場合は、使える材料が多い順・新しいレシピ順に並べる。
+        """
+        postings = [self.postings[term] for term in terms if term in self.postings]
+        if not postings:
+            return []
+        rows, matched = np.unique(np.concatenate(postings), return_counts=True)
+        missing = self.sizes[rows] - matched
+        if max_missing is not None:
+            keep = missing <= max_missing
+            rows, matched, missing = rows[keep], matched[keep], missing[keep]
+
+        recipe_ids = self.recipe_ids[rows]
+        if len(rows) > limit:
+            # (足りない数, -使える数) の順位で上位 limit 件と同順位の行に絞り込んでから並べる
+            rank = missing.astype(np.int64) * (len(postings) + 1) - matched
+            threshold = np.partition(rank, limit - 1)[limit - 1]
+            top = np.flatnonzero(rank <= threshold)
+            matched, missing, recipe_ids = matched[top], missing[top], recipe_ids[top]
+        order = np.lexsort((-recipe_ids, -matched, missing))[:limit]
+        return [
+            (int(recipe_ids[i]), int(matched[i]), int(missing[i]))
+            for i in order
+        ]
+
+
+_index_lock = threading.Lock()
+_index_state = {'index': None, 'generation': None}
+
+
+def _changes_key(generation):
+    return f'{CHANGES_PREFIX}{generation}'
+
+
+def _current_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # 世代番号が消えていた場合は、以前の番号と重ならない値から始め直す
+        # （変更の記録がないため、どのプロセスも次の検索時に全件を読み直す）
+        cache.add(GENERATION_KEY, time.time_ns() // 1000, None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def get_index():
+    """このプロセスのインデックス（他のプロセスの変更分を取り込んでから返す）"""
+    with _index_lock:
+        generation = _current_generation()
+        index = _index_state['index']
+        current = _index_state['generation']
+        if index is not None and current == generation:
+            return index
+
+        changed = None
+        if index is not None and current < generation <= current + MAX_REPLAY:
+            keys = [_changes_key(number) for number in range(current + 1, generation + 1)]
+            found = cache.get_many(keys)
+            if len(found) == len(keys):
+                changed = set().union(*found.values())
+
+        if changed is None:
+            index = IngredientIndex(load_terms())
+        else:
+            terms = load_terms(changed)
+            index.set_rows({recipe_id: terms.get(recipe_id, set()) for recipe_id in changed})
+        _index_state['index'] = index
+        _index_state['generation'] = generation
+        return index
+
+
+def _publish_changes(recipe_ids):
+    """変更されたレシピを次の世代として記録する"""
+    try:
+        generation = cache.incr(GENERATION_KEY)
+    except ValueError:
+        _current_generation()
+        return
+    cache.set(_changes_key(generation), set(recipe_ids), CHANGES_TIMEOUT)
+
+
+_pending = threading.local()
+
+
+def schedule_pantry_update(*recipe_ids):
+    """コミット後にインデックスの変更を記録する（同じトランザクションの変更はまとめる）"""
+    if not hasattr(_pending, 'recipe_ids'):
+        _pending.recipe_ids = set()
+    _pending.recipe_ids.update(recipe_ids)
+    transaction.on_commit(_flush_pending)
+
+
+def _flush_pending():
+    recipe_ids = getattr(_pending, 'recipe_ids', None)
+    if not recipe_ids:
+        return
+    _pending.recipe_ids = set()
+    _publish_changes(recipe_ids)
+
+
+def load_inventory(user):
+    """apps.ingredients の在庫（数量があり賞味期限切れでない材料）の名前
+
+    在庫機能が有効でない場合は None を返す。
+    """
+    if not django_apps.is_installed('apps.ingredients'):
+        return None
+    from apps.ingredients.models import UserInventory
+
+    return list(
+        UserInventory.objects.filter(user=user, quantity__gt=0)
+        .filter(Q(expiry_date__isnull=True) | Q(expiry_date__gte=timezone.localdate()))
+        .values_list('ingredient__name', flat=True)
+    )
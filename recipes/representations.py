@@ -0,0 +1,237 @@
+"""シリアライズ済みレシピの表現キャッシュ
+
+レシピごとのバージョン（ランダムなトークン）をキャッシュに持ち、表現は
+「シリアライザー・ホスト・レシピID・バージョン」をキーにJSONエンコード済みのbytesで保存する。
+レシピ・材料・手順・カテゴリ・作成者・集計値が変わると invalidate_representations() で
+バージョンを破棄し、次の参照時に新しいバージョンで作り直す（古い表現は有効期限で消える）。
+"""
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import Http404, HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+from .favorites import get_favorite_ids
+
+
+CACHE_PREFIX = 'recipes:repr:'
+REPRESENTATION_TIMEOUT = 60 * 60
+# バージョンが先に消えても作り直すだけなので、表現より長ければよい
+VERSION_TIMEOUT = 60 * 60 * 24
+
+_renderer = JSONRenderer()
+
+
+def _version_key(recipe_id):
+    return f'{CACHE_PREFIX}version:{recipe_id}'
+
+
+def _representation_key(kind, base_url, recipe_id, version):
+    return f'{CACHE_PREFIX}{kind}:{base_url}:{recipe_id}:{version}'
+
+
+def invalidate_representations(*recipe_ids):
+    """コミット後にレシピの表現キャッシュを無効化する（バージョンを破棄する）"""
+    keys = [_version_key(recipe_id) for recipe_id in recipe_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def get_versions(recipe_ids):
+    """{レシピID: バージョン} を返す（なければ新しく発行する）
+
+    表現をDBから作る前に呼ぶこと。先にバージョンを確定させておけば、
+    作成中に更新がコミットされても、古い内容が新しいバージョンで保存されることはない。
+    """
+    keys = {recipe_id: _version_key(recipe_id) for recipe_id in recipe_ids}
+    found = cache.get_many(keys.values())
+    versions = {}
+    issued = {}
+    for recipe_id, key in keys.items():
+        if key in found:
+            versions[recipe_id] = found[key]
+        else:
+            versions[recipe_id] = issued[key] = uuid.uuid4().hex
+    if issued:
+        cache.set_many(issued, VERSION_TIMEOUT)
+    return versions
+
+
+def get_representations(kind, base_url, versions):
+    """{レシピID: 表現} をまとめて取得する（キャッシュにないレシピは含まない）"""
+    keys = {
+        _representation_key(kind, base_url, recipe_id, version): recipe_id
+        for recipe_id, version in versions.items()
+    }
+    return {keys[key]: value for key, value in cache.get_many(keys).items()}
+
+
+def set_representations(kind, base_url, versions, representations):
+    cache.set_many({
+        _representation_key(kind, base_url, recipe_id, versions[recipe_id]): representation
+        for recipe_id, representation in representations.items()
+    }, REPRESENTATION_TIMEOUT)
+
+
+def build_representation(recipe, data):
+    """保存する表現（JSONのbytesと、ORMを通さずに閲覧可否・更新日時を判定するための値）"""
+    return {
+        'body': _renderer.render(data),
+        'is_public': recipe.is_public,
+        'author_id': recipe.author_id,
+        'updated_at': recipe.updated_at.timestamp(),
+    }
+
+
+def add_member(body, name, value):
+    """JSONオブジェクトのbytesにメンバーを1つ追加する（ユーザーごとに異なる値を後から足す）"""
+    return body[:-1] + b',' + _renderer.render({name: value})[1:]
+
+
+class RepresentationCacheMixin:
+    """一覧・詳細のGETを表現キャッシュから組み立てるビュー用Mixin
+
+    ConditionalGetMixin・EagerLoadingViewMixin より前に置く。
+    一覧は並び順・ページだけをDBで決め（主キー等の列のみ取得）、各レシピの表現はキャッシュから取る。
+    詳細はキャッシュにあればORMを通さず、閲覧可否もキャッシュした値で判定する。
+    JSON以外の形式や ?fields= / ?expand= の指定がある場合は通常の処理に任せる。
+    """
+    # ユーザーごとに異なるためキャッシュに入れず、応答時に付け足すフィールド
+    per_user_fields = ['is_favorited']
+    ids_only = False
+
+    def use_representation_cache(self):
+        return (
+            self.request.accepted_renderer.format == 'json'
+            and self.get_sparse_fields() == (None, None)
+        )
+
+    def get_sparse_fields(self):
+        if self.ids_only:
+            return {'id'}, set()
+        return super().get_sparse_fields()
+
+    def get_representation_kind(self):
+        return self.get_serializer_class().__name__
+
+    def get_base_url(self):
+        # 画像URLは絶対URLで返すため、ホストごとにキャッシュを分ける
+        return self.request.build_absolute_uri('/')
+
+    def build_representations(self, recipes, versions):
+        """キャッシュになかったレシピをシリアライズして保存する"""
+        context = self.get_serializer_context()
+        context['favorite_ids'] = frozenset()
+        data = self.get_serializer_class()(recipes, many=True, context=context).data
+        representations = {}
+        for recipe, item in zip(recipes, data):
+            for name in self.per_user_fields:
+                item.pop(name, None)
+            representations[recipe.id] = build_representation(recipe, item)
+        set_representations(
+            self.get_representation_kind(), self.get_base_url(), versions, representations
+        )
+        return representations
+
+    def get_user_favorite_ids(self):
+        """is_favorited を出力する場合のお気に入りID集合（出力しない場合は None）"""
+        if 'is_favorited' not in self.get_serializer_class().get_all_fields():
+            return None
+        user = self.request.user
+        return get_favorite_ids(user) if user.is_authenticated else frozenset()
+
+    def get_representation_body(self, recipe_id, representation, favorite_ids=None):
+        body = representation['body']
+        if favorite_ids is not None:
+            body = add_member(body, 'is_favorited', recipe_id in favorite_ids)
+        return body
+
+    def representation_response(self, body, etag, last_modified):
+        response = HttpResponse(body, content_type=self.request.accepted_renderer.media_type)
+        return self.set_validators(response, etag, last_modified)
+
+    def can_view(self, representation):
+        user = self.request.user
+        return representation['is_public'] or representation['author_id'] == user.pk
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.use_representation_cache():
+            return super().retrieve(request, *args, **kwargs)
+
+        try:
+            recipe_id = int(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except ValueError:
+            raise Http404
+        versions = get_versions([recipe_id])
+        representation = get_representations(
+            self.get_representation_kind(), self.get_base_url(), versions
+        ).get(recipe_id)
+        if representation is None:
+            instance = self.get_object()
+            representation = self.build_representations([instance], versions)[instance.id]
+        elif not self.can_view(representation):
+            raise Http404
+
+        etag, last_modified = self.make_validators(
+            [versions[recipe_id]], [representation['updated_at']]
+        )
+        response = self.not_modified_response(etag, last_modified)
+        if response is not None:
+            return response
+        body = self.get_representation_body(recipe_id, representation, self.get_user_favorite_ids())
+        return self.representation_response(body, etag, last_modified)
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_representation_cache():
+            return super().list(request, *args, **kwargs)
+
+        self.ids_only = True
+        try:
+            queryset = self.filter_queryset(self.get_queryset())
+        finally:
+            self.ids_only = False
+        page = self.paginate_queryset(queryset)
+        objects = list(page) if page is not None else list(queryset)
+        recipe_ids = [obj.id for obj in objects]
+
+        versions = get_versions(recipe_ids)
+        representations = get_representations(
+            self.get_representation_kind(), self.get_base_url(), versions
+        )
+        missing = [recipe_id for recipe_id in recipe_ids if recipe_id not in representations]
+        if missing:
+            serializer_class = self.get_serializer_class()
+            recipes = serializer_class.setup_eager_loading(
+                serializer_class.Meta.model.objects.filter(id__in=missing).order_by()
+            )
+            representations.update(self.build_representations(list(recipes), versions))
+            # ページの取得後に削除されたレシピは除く
+            recipe_ids = [recipe_id for recipe_id in recipe_ids if recipe_id in representations]
+
+        state = None
+        if page is not None and hasattr(self.paginator, 'get_state'):
+            state = self.paginator.get_state()
+        etag, last_modified = self.make_validators(
+            [versions[recipe_id] for recipe_id in recipe_ids],
+            [representations[recipe_id]['updated_at'] for recipe_id in recipe_ids],
+            extra=state,
+        )
+        response = self.not_modified_response(etag, last_modified)
+        if response is not None:
+            return response
+
+        favorite_ids = self.get_user_favorite_ids()
+        results = b'[' + b','.join(
+            self.get_representation_body(recipe_id, representations[recipe_id], favorite_ids)
+            for recipe_id in recipe_ids
+        ) + b']'
+        if page is None:
+            return self.representation_response(results, etag, last_modified)
+
+        # ページ情報だけを通常どおり組み立て、results にエンコード済みの配列を差し込む
+        envelope = dict(self.get_paginated_response([]).data)
+        envelope.pop('results')
+        body = _renderer.render(envelope)
+        body = (body[:-1] + b',' if envelope else b'{') + b'"results":' + results + b'}'
+        return self.representation_response(body, etag, last_modified)
@@ -0,0 +1,468 @@
+"""性能検証用の大規模サンプルデータ生成
+
+ユーザー・レシピ・材料・手順・お気に入り・評価（と、有効な場合は週献立・買い物リスト）を
+乱数のシードから決定的に合成し、bulk_create でチャンクごとに登録する。
+同じ件数・シードで実行すれば、同じ内容・同じ関係のデータができる（主キーの値はDBの状態による）。
+
+bulk_create はシグナルを発行しないため、お気に入り数・評価の集計値は生成時に計算して保存し、
+プロフィールも合わせて作成する。検索インデックス等の作り直しは呼び出し側で行う。
+
+生成した日時を保存するため、生成中はモデルのフィールド定義（auto_now / auto_now_add）を
+書き換える（explicit_timestamps）。フィールド定義はプロセス全体で共有されるため、
+リクエストを処理中のサーバープロセスからは使わず、管理コマンドから実行すること。
+"""
+import random
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import accumulate
+
+from django.apps import apps as django_apps
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+
+from accounts.models import UserProfile
+from .models import Category, Recipe, Ingredient, Step, RecipeFavorite, RecipeRating
+
+
+CHUNK_SIZE = 5000
+# 作成日時はこの日時から days 日間に分布させる（実行日時によらず同じデータにするため固定）
+BASE_DATE = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+SAMPLE_PASSWORD = 'password'
+
+CATEGORIES = [
+    {'name': '和食', 'description': '日本の伝統的な料理'},
+    {'name': '洋食', 'description': '西洋の料理'},
+    {'name': '中華', 'description': '中国の料理'},
+    {'name': 'イタリアン', 'description': 'イタリアの料理'},
+    {'name': 'デザート', 'description': 'スイーツ・デザート'},
+    {'name': 'サラダ', 'description': '野菜中心の料理'},
+]
+
+# (材料名, 買い物リストのカテゴリ, 単位, 分量の候補)。よく使われる順に並べる
+INGREDIENTS = [
+    ('塩', 'seasonings', '少々', ['']),
+    ('醤油', 'seasonings', '大さじ', ['1', '2']),
+    ('砂糖', 'seasonings', '小さじ', ['1', '2']),
+    ('玉ねぎ', 'vegetables', '個', ['1/2', '1']),
+    ('卵', 'dairy', '個', ['1', '2', '3']),
+    ('サラダ油', 'seasonings', '大さじ', ['1']),
+    ('みりん', 'seasonings', '大さじ', ['1', '2']),
+    ('にんにく', 'vegetables', '個', ['1']),
+    ('こしょう', 'seasonings', '少々', ['']),
+    ('酒', 'seasonings', '大さじ', ['1', '2']),
+    ('にんじん', 'vegetables', '本', ['1/2', '1']),
+    ('鶏もも肉', 'meat', 'g', ['200', '300']),
+    ('しょうが', 'vegetables', '個', ['1']),
+    ('じゃがいも', 'vegetables', '個', ['2', '3']),
+    ('豚バラ肉', 'meat', 'g', ['150', '200']),
+    ('バター', 'dairy', 'g', ['10', '20']),
+    ('牛乳', 'dairy', 'ml', ['100', '200']),
+    ('キャベツ', 'vegetables', '枚', ['2', '4']),
+    ('味噌', 'seasonings', '大さじ', ['1', '2']),
+    ('ごま油', 'seasonings', '大さじ', ['1']),
+    ('長ねぎ', 'vegetables', '本', ['1']),
+    ('薄力粉', 'grains', '大さじ', ['2', '3']),
+    ('ごはん', 'grains', 'g', ['300', '400']),
+    ('だし汁', 'seasonings', 'ml', ['200', '400']),
+    ('トマト', 'vegetables', '個', ['1', '2']),
+    ('豆腐', 'others', 'パック', ['1']),
+    ('きのこ', 'vegetables', 'パック', ['1']),
+    ('鶏むね肉', 'meat', 'g', ['250', '300']),
+    ('合いびき肉', 'meat', 'g', ['200', '300']),
+    ('ピーマン', 'vegetables', '個', ['2', '3']),
+    ('なす', 'vegetables', '本', ['2']),
+    ('大根', 'vegetables', 'g', ['200', '300']),
+    ('ほうれん草', 'vegetables', '袋', ['1']),
+    ('オリーブオイル', 'seasonings', '大さじ', ['1', '2']),
+    ('パスタ', 'grains', 'g', ['200']),
+    ('ベーコン', 'meat', 'g', ['50', '100']),
+    ('生クリーム', 'dairy', 'ml', ['100', '200']),
+    ('チーズ', 'dairy', 'g', ['30', '50']),
+    ('鮭', 'fish', '枚', ['2']),
+    ('えび', 'fish', 'g', ['150']),
+    ('ブロッコリー', 'vegetables', '個', ['1']),
+    ('レタス', 'vegetables', '個', ['1/2']),
+    ('きゅうり', 'vegetables', '本', ['1', '2']),
+    ('ケチャップ', 'seasonings', '大さじ', ['2', '3']),
+    ('マヨネーズ', 'seasonings', '大さじ', ['2']),
+    ('片栗粉', 'grains', '大さじ', ['1']),
+    ('もやし', 'vegetables', '袋', ['1']),
+    ('白菜', 'vegetables', '枚', ['3', '4']),
+    ('さば', 'fish', '切れ', ['2']),
+    ('かぼちゃ', 'vegetables', 'g', ['200']),
+    ('れんこん', 'vegetables', 'g', ['150']),
+    ('ごぼう', 'vegetables', '本', ['1']),
+    ('こんにゃく', 'others', '枚', ['1']),
+    ('牛こま切れ肉', 'meat', 'g', ['200']),
+    ('うどん', 'grains', '袋', ['2']),
+    ('食パン', 'grains', '枚', ['2']),
+    ('りんご', 'fruits', '個', ['1']),
+    ('バナナ', 'fruits', '本', ['2']),
+    ('レモン', 'fruits', '個', ['1/2']),
+    ('チョコレート', 'snacks', 'g', ['100']),
+    ('ホットケーキミックス', 'grains', 'g', ['150']),
+    ('ヨーグルト', 'dairy', 'g', ['100']),
+    ('カレールー', 'seasonings', '箱', ['1/2']),
+    ('コンソメ', 'seasonings', '個', ['1', '2']),
+]
+UNITS = {value for value, _ in Ingredient.UNIT_CHOICES}
+
+DISHES = [
+    ('照り焼き', '和食'), ('肉じゃが', '和食'), ('煮物', '和食'), ('味噌汁', '和食'), ('丼', '和食'),
+    ('炒め', '中華'), ('麻婆', '中華'), ('スープ', '中華'), ('あんかけ', '中華'),
+    ('グラタン', '洋食'), ('シチュー', '洋食'), ('ソテー', '洋食'), ('ハンバーグ', '洋食'), ('カレー', '洋食'),
+    ('パスタ', 'イタリアン'), ('リゾット', 'イタリアン'), ('カルパッチョ', 'イタリアン'),
+    ('サラダ', 'サラダ'), ('マリネ', 'サラダ'),
+    ('ケーキ', 'デザート'), ('プリン', 'デザート'), ('マフィン', 'デザート'),
+]
+PREFIXES = ['', '', '基本の', '簡単', 'ほっこり', '作り置き', '本格', 'ヘルシー', '時短', 'おうち']
+
+FIRST_STEP = '{a}を食べやすい大きさに切ります。'
+STEP_TEMPLATES = [
+    '{a}と{b}を下ごしらえします。',
+    'フライパンに油を熱し、{a}を中火で炒めます。',
+    '{b}を加えてさらに{t}分ほど炒めます。',
+    '鍋に{a}と調味料を入れて{t}分煮ます。',
+    '{a}に火が通ったら{b}を加えて全体をなじませます。',
+    '味を見て、塩・こしょうで調えます。',
+]
+LAST_STEP = '器に盛り付けて完成です。'
+# 料理名に使う材料のカテゴリ（調味料は料理名にしない）
+MAIN_CATEGORIES = {'meat', 'fish', 'vegetables', 'fruits', 'grains', 'dairy'}
+COOKING_TIMES = [5, 10, 15, 20, 25, 30, 40, 45, 60, 90, 120]
+MEAL_TYPES = ['breakfast', 'lunch', 'dinner']
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """auto_now / auto_now_add を一時的に無効にし、生成した日時をそのまま保存する
+
+    フィールド定義を書き換えるため、同じプロセスの他のスレッドの保存にも影響する
+    （その間の保存では更新日時が自動で設定されない）。管理コマンドなど専用のプロセスでのみ使う。
+    """
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class WeightedChoice:
+    """偏りのある候補から選ぶ（順位 r の重みは 1 / (r + 1) ** skew）"""
+
+    def __init__(self, population, skew=1.0):
+        self.population = population
+        self.cumulative = list(accumulate(1 / (rank + 1) ** skew for rank in range(len(population))))
+
+    def choose(self, rng):
+        position = bisect_left(self.cumulative, rng.random() * self.cumulative[-1])
+        return self.population[min(position, len(self.population) - 1)]
+
+    def sample(self, rng, k, attempts=3):
+        """重複しない最大k件（重みの大きい候補に偏るため、k件に満たない場合がある）"""
+        chosen = {}
+        for _ in range(k * attempts):
+            if len(chosen) >= k:
+                break
+            value = self.choose(rng)
+            chosen.setdefault(value, None)
+        return list(chosen)
+
+
+class SampleDataGenerator:
+    """シードから決定的に大規模データを合成して登録する
+
+    report(メッセージ) で進捗を通知する。generate() はテーブルごとの登録件数を返す。
+    """
+
+    def __init__(self, recipes, users, seed=0, prefix='sample', chunk_size=CHUNK_SIZE,
+                 favorites_per_user=10, ratings_per_user=5, menus_per_user=2, days=365, report=None):
+        self.recipe_total = recipes
+        self.user_total = users
+        self.seed = seed
+        self.prefix = prefix
+        self.chunk_size = chunk_size
+        self.favorites_per_user = favorites_per_user
+        self.ratings_per_user = ratings_per_user
+        self.menus_per_user = menus_per_user
+        self.days = days
+        self.report = report or (lambda message: None)
+        self.rng = random.Random(seed)
+        self.counts = {}
+
+    def _timestamp(self, offset_seconds):
+        return BASE_DATE + timedelta(seconds=offset_seconds)
+
+    def _insert(self, model, objects, label):
+        created = []
+        for chunk in _chunks(objects, self.chunk_size):
+            created += model.objects.bulk_create(chunk, batch_size=self.chunk_size)
+        self.counts[label] = self.counts.get(label, 0) + len(objects)
+        return created
+
+    def generate(self):
+        if not connection.features.can_return_rows_from_bulk_insert:
+            # 関連を張るため、bulk_create で主キーを取得できるDB（PostgreSQL・SQLite等）が必要
+            raise ValueError('このデータベースでは大量生成を利用できません')
+        started = time.monotonic()
+        with transaction.atomic(), explicit_timestamps(User, UserProfile, Recipe, RecipeFavorite, RecipeRating):
+            self.categories = self.create_categories()
+            self.users = self.create_users()
+            self.report(f'ユーザー {len(self.users)}件を作成しました')
+            headers = self.plan_recipes()
+            favorites, ratings = self.plan_reactions(headers)
+            self.recipe_ids = self.create_recipes(headers, favorites, ratings)
+            self.report(f'レシピ {len(self.recipe_ids)}件を作成しました')
+            self.create_reactions(favorites, ratings)
+            self.report(f'お気に入り {len(favorites)}件・評価 {len(ratings)}件を作成しました')
+            self.create_menus()
+        self.counts['seconds'] = round(time.monotonic() - started, 1)
+        return self.counts
+
+    def create_categories(self):
+        categories = {}
+        for data in CATEGORIES:
+            category, _ = Category.objects.get_or_create(
+                name=data['name'], defaults={'description': data['description']}
+            )
+            categories[category.name] = category
+        return categories
+
+    def create_users(self):
+        """ユーザーとプロフィールを作成する（パスワードのハッシュは1回だけ計算する）"""
+        if User.objects.filter(username__startswith=f'{self.prefix}_').exists():
+            raise ValueError(f'ユーザー名が「{self.prefix}_」で始まるユーザーが既に存在します（--prefix で変更できます）')
+        password = make_password(SAMPLE_PASSWORD, salt=f'{self.prefix}{self.seed}')
+        span = self.days * 24 * 60 * 60
+        joined = sorted(self.rng.randrange(span) for _ in range(self.user_total))
+        users = [
+            User(
+                username=f'{self.prefix}_{i:07d}',
+                email=f'{self.prefix}_{i:07d}@example.com',
+                password=password,
+                date_joined=self._timestamp(offset),
+            )
+            for i, offset in enumerate(joined)
+        ]
+        users = self._insert(User, users, 'users')
+        self._insert(UserProfile, [
+            UserProfile(user=user, created_at=user.date_joined, updated_at=user.date_joined)
+            for user in users
+        ], 'profiles')
+        return users
+
+    def plan_recipes(self):
+        """レシピの作成者・カテゴリ・作成日時など、関連を決めるための値を先に決める"""
+        rng = self.rng
+        # 少数のユーザーが多くのレシピを投稿する
+        authors = WeightedChoice(list(range(len(self.users))), skew=0.8)
+        span = self.days * 24 * 60 * 60
+        created = sorted(rng.randrange(span) for _ in range(self.recipe_total))
+        headers = []
+        for offset in created:
+            author = authors.choose(rng)
+            # 作成者の登録後に投稿したことにする
+            joined = int((self.users[author].date_joined - BASE_DATE).total_seconds())
+            headers.append({
+                'author': author,
+                'created': max(offset, joined),
+                'is_public': rng.random() < 0.9,
+            })
+        return headers
+
+    def plan_reactions(self, headers):
+        """お気に入り・評価を (ユーザー番号, レシピ番号, 日時[, 評価]) で決め、集計値を計算する"""
+        rng = self.rng
+        public = [index for index, header in enumerate(headers) if header['is_public']]
+        if not public:
+            return [], []
+        # 人気のあるレシピに偏らせる（人気順はシードで決まる）
+        rng.shuffle(public)
+        popular = WeightedChoice(public, skew=0.7)
+        span = self.days * 24 * 60 * 60
+
+        def per_user(average):
+            # 平均 average 件の指数分布（少数のユーザーが多く反応する）
+            return min(len(public), int(rng.expovariate(1 / average))) if average else 0
+
+        favorites = []
+        ratings = []
+        for user_index in range(len(self.users)):
+            for recipe_index in popular.sample(rng, per_user(self.favorites_per_user)):
+                at = rng.randrange(headers[recipe_index]['created'], span + 1)
+                favorites.append((user_index, recipe_index, at))
+            for recipe_index in popular.sample(rng, per_user(self.ratings_per_user)):
+                at = rng.randrange(headers[recipe_index]['created'], span + 1)
+                rating = rng.choices((1, 2, 3, 4, 5), weights=(1, 2, 6, 10, 8))[0]
+                ratings.append((user_index, recipe_index, at, rating))
+
+        for header in headers:
+            header['favorite_count'] = 0
+            header['ratings'] = [0] * 5
+        for _, recipe_index, _ in favorites:
+            headers[recipe_index]['favorite_count'] += 1
+        for _, recipe_index, _, rating in ratings:
+            headers[recipe_index]['ratings'][rating - 1] += 1
+        return favorites, ratings
+
+    def build_recipe(self, header):
+        """レシピ1件分のモデル（未保存）と材料・手順の値を合成する"""
+        rng = self.rng
+        names = self.ingredient_choice.sample(rng, rng.randint(3, 12))
+        dish, category = rng.choice(DISHES)
+        main = next(
+            (name for name in names if self.ingredient_data[name][1] in MAIN_CATEGORIES), names[0]
+        )
+        stars = header['ratings']
+        rating_count = sum(stars)
+        rating_sum = sum(star * count for star, count in zip(range(1, 6), stars))
+        created_at = self._timestamp(header['created'])
+        recipe = Recipe(
+            title=f'{rng.choice(PREFIXES)}{main}の{dish}',
+            description=f'{main}を使った{dish}です。',
+            cooking_time=rng.choice(COOKING_TIMES),
+            servings=rng.randint(1, 6),
+            difficulty=rng.choices((1, 2, 3), weights=(5, 4, 1))[0],
+            category=self.categories[category] if rng.random() < 0.95 else None,
+            author=self.users[header['author']],
+            is_public=header['is_public'],
+            favorite_count=header.get('favorite_count', 0),
+            rating_count=rating_count,
+            rating_sum=rating_sum,
+            rating_avg=Recipe.calculate_rating_avg(rating_sum, rating_count),
+            created_at=created_at,
+            updated_at=created_at + timedelta(minutes=rng.randrange(0, 60 * 24)),
+            **{f'rating_{star}': stars[star - 1] for star in range(1, 6)},
+        )
+
+        ingredients = []
+        for order, name in enumerate(names, start=1):
+            _, _, unit, amounts = self.ingredient_data[name]
+            ingredients.append({
+                'name': name,
+                'amount': rng.choice(amounts),
+                'unit': unit if unit in UNITS else '',
+                'order': order,
+            })
+        templates = [FIRST_STEP] + [rng.choice(STEP_TEMPLATES) for _ in range(rng.randint(1, 6))] + [LAST_STEP]
+        steps = [
+            {
+                'step_number': number,
+                'description': template.format(a=rng.choice(names), b=rng.choice(names), t=rng.randint(2, 15)),
+            }
+            for number, template in enumerate(templates, start=1)
+        ]
+        return recipe, ingredients, steps
+
+    def create_recipes(self, headers, favorites, ratings):
+        """レシピをチャンクごとに作成し、続けてそのチャンクの材料・手順を作成する"""
+        self.ingredient_data = {data[0]: data for data in INGREDIENTS}
+        self.ingredient_choice = WeightedChoice([data[0] for data in INGREDIENTS], skew=0.6)
+        recipe_ids = []
+        for chunk in _chunks(headers, self.chunk_size):
+            built = [self.build_recipe(header) for header in chunk]
+            recipes = self._insert(Recipe, [recipe for recipe, _, _ in built], 'recipes')
+            recipe_ids += [recipe.id for recipe in recipes]
+            self._insert(Ingredient, [
+                Ingredient(recipe=recipe, **data)
+                for recipe, (_, ingredients, _) in zip(recipes, built) for data in ingredients
+            ], 'ingredients')
+            self._insert(Step, [
+                Step(recipe=recipe, **data)
+                for recipe, (_, _, steps) in zip(recipes, built) for data in steps
+            ], 'steps')
+            self.report(f'レシピ {len(recipe_ids)}/{len(headers)}件')
+        return recipe_ids
+
+    def create_reactions(self, favorites, ratings):
+        users = self.users
+        recipe_ids = self.recipe_ids
+        self._insert(RecipeFavorite, [
+            RecipeFavorite(user=users[user], recipe_id=recipe_ids[recipe], created_at=self._timestamp(at))
+            for user, recipe, at in favorites
+        ], 'favorites')
+        self._insert(RecipeRating, [
+            RecipeRating(
+                user=users[user], recipe_id=recipe_ids[recipe], rating=rating,
+                created_at=self._timestamp(at), updated_at=self._timestamp(at),
+            )
+            for user, recipe, at, rating in ratings
+        ], 'ratings')
+
+    def create_menus(self):
+        """週献立と買い物リストを作成する（apps.menus / apps.shopping が有効な場合のみ）"""
+        if not self.menus_per_user:
+            return
+        if not (django_apps.is_installed('apps.menus') and django_apps.is_installed('apps.shopping')):
+            self.report('apps.menus / apps.shopping が有効でないため、週献立・買い物リストは作成しません')
+            return
+        from apps.menus.models import WeeklyMenu, WeeklyMenuRecipe
+        from apps.shopping.models import ShoppingList, ShoppingListItem
+
+        # 週献立のレシピは apps.recipes のレシピを参照する
+        menu_recipe_model = WeeklyMenuRecipe._meta.get_field('recipe').related_model
+        menu_recipe_ids = list(menu_recipe_model.objects.order_by('id').values_list('id', flat=True))
+        rng = self.rng
+        first_monday = BASE_DATE.date() - timedelta(days=BASE_DATE.weekday())
+        weeks = max(1, self.days // 7)
+
+        with explicit_timestamps(WeeklyMenu, ShoppingList):
+            menus = []
+            for user in self.users:
+                for week in sorted(rng.sample(range(weeks), min(weeks, self.menus_per_user))):
+                    start = first_monday + timedelta(weeks=week)
+                    at = datetime.combine(start, datetime.min.time(), tzinfo=dt_timezone.utc) - timedelta(days=2)
+                    menus.append(WeeklyMenu(
+                        user=user, name=f'{start:%Y年%m月%d日}の週の献立', start_date=start,
+                        created_at=at, updated_at=at,
+                    ))
+            menus = self._insert(WeeklyMenu, menus, 'weekly_menus')
+
+            if menu_recipe_ids:
+                self._insert(WeeklyMenuRecipe, [
+                    WeeklyMenuRecipe(
+                        weekly_menu=menu, recipe_id=rng.choice(menu_recipe_ids),
+                        day_of_week=day, meal_type=meal, servings=rng.randint(1, 4),
+                    )
+                    for menu in menus for day in range(7)
+                    for meal in rng.sample(MEAL_TYPES, rng.randint(1, 3))
+                ], 'weekly_menu_recipes')
+
+            lists = self._insert(ShoppingList, [
+                ShoppingList(
+                    user=menu.user, name=f'{menu.start_date:%m/%d}の週の買い物',
+                    target_date=menu.start_date - timedelta(days=1), is_auto_generated=True,
+                    generation_period_start=menu.start_date, generation_period_end=menu.end_date,
+                    created_at=menu.created_at, updated_at=menu.created_at,
+                )
+                for menu in menus
+            ], 'shopping_lists')
+            self._insert(ShoppingList.weekly_menus.through, [
+                ShoppingList.weekly_menus.through(shoppinglist_id=shopping.id, weeklymenu_id=menu.id)
+                for shopping, menu in zip(lists, menus)
+            ], 'shopping_list_menus')
+            items = []
+            for shopping in lists:
+                for order, name in enumerate(self.ingredient_choice.sample(rng, rng.randint(5, 15)), start=1):
+                    _, category, unit, amounts = self.ingredient_data[name]
+                    items.append(ShoppingListItem(
+                        shopping_list=shopping, custom_name=name, category=category, order=order,
+                        quantity=f'{rng.choice(amounts)}{unit}',
+                    ))
+            self._insert(ShoppingListItem, items, 'shopping_list_items')
+        self.report(f'週献立 {len(menus)}件・買い物リスト {len(lists)}件を作成しました')
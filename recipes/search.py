@@ -0,0 +1,161 @@
+"""レシピ全文検索（文字N-gram転置インデックス）"""
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Sum
+from rest_framework import filters
+from rest_framework.settings import api_settings
+
+from .facets import invalidate_facets
+from .models import Recipe, RecipeSearchGram
+
+
+# フィールドごとの重み（タイトル・材料名の一致を優先する）
+FIELD_WEIGHTS = {
+    'title': 5,
+    'ingredients': 3,
+    'description': 2,
+    'steps': 1,
+}
+
+# インデックスに含めるレシピのフィールド（これ以外の変更では作り直さない）
+INDEXED_RECIPE_FIELDS = {'title', 'description'}
+
+# 記号・空白で区切られた連続文字列を1単位として扱う
+_WORD_RE = re.compile(r'\w+')
+
+# カタカナ（ァ〜ヶ）をひらがなへ寄せる変換表
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(ord('ァ'), ord('ヶ') + 1)}
+
+
+def normalize(text):
+    """全角/半角・大文字/小文字・カタカナ/ひらがなの揺れを吸収する"""
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    return text.translate(_KATAKANA_TO_HIRAGANA)
+
+
+def extract_grams(text):
+    """テキストから1文字と2文字のN-gramを出現回数付きで取り出す"""
+    grams = Counter()
+    for word in _WORD_RE.findall(normalize(text)):
+        grams.update(word)
+        grams.update(word[i:i + 2] for i in range(len(word) - 1))
+    return grams
+
+
+def query_grams(query):
+    """検索語を照合用のN-gram集合に変換する
+
+    2文字以上の語は2-gram、1文字の語はその1文字で照合する。
+    """
+    grams = set()
+    for word in _WORD_RE.findall(normalize(query)):
+        if len(word) == 1:
+            grams.add(word)
+        else:
+            grams.update(word[i:i + 2] for i in range(len(word) - 1))
+    return grams
+
+
+def build_grams(recipe):
+    """レシピ1件分の {N-gram: 重み} を組み立てる"""
+    texts = {
+        'title': recipe.title,
+        'description': recipe.description,
+        'ingredients': ' '.join(ingredient.name for ingredient in recipe.ingredients.all()),
+        'steps': ' '.join(step.description for step in recipe.steps.all()),
+    }
+    weights = Counter()
+    for field, text in texts.items():
+        for gram, count in extract_grams(text).items():
+            weights[gram] += count * FIELD_WEIGHTS[field]
+    return weights
+
+
+def index_recipes(recipes):
+    """渡されたレシピのインデックスを作り直す（材料・手順はprefetch済みを想定）"""
+    recipes = list(recipes)
+    rows = [
+        RecipeSearchGram(recipe_id=recipe.id, gram=gram, weight=weight)
+        for recipe in recipes
+        for gram, weight in build_grams(recipe).items()
+    ]
+    with transaction.atomic():
+        RecipeSearchGram.objects.filter(recipe_id__in=[recipe.id for recipe in recipes]).delete()
+        RecipeSearchGram.objects.bulk_create(rows, batch_size=1000)
+
+
+def reindex_recipe(recipe_id):
+    """レシピ1件のインデックスを更新する（削除済みなら何もしない）"""
+    recipes = Recipe.objects.filter(id=recipe_id).prefetch_related('ingredients', 'steps')
+    index_recipes(recipes)
+
+
+_pending = threading.local()
+
+
+def schedule_reindex(*recipe_ids):
+    """コミット後にインデックスを更新する
+
+    レシピ・材料・手順を同じトランザクションでまとめて保存した場合でも、
+    レシピごとに1回だけ再構築されるよう対象IDを溜めておく。
+    """
+    if not hasattr(_pending, 'recipe_ids'):
+        _pending.recipe_ids = set()
+    _pending.recipe_ids.update(recipe_ids)
+    transaction.on_commit(_flush_pending)
+
+
+def _flush_pending():
+    recipe_ids = getattr(_pending, 'recipe_ids', None)
+    if not recipe_ids:
+        return
+    _pending.recipe_ids = set()
+    index_recipes(
+        Recipe.objects.filter(id__in=recipe_ids).prefetch_related('ingredients', 'steps')
+    )
+    # 検索結果が変わるため、キーワード検索時のファセットを無効化する
+    invalidate_facets('search')
+
+
+def search_scores(query):
+    """検索語に一致するレシピIDと関連度スコアのクエリセットを返す
+
+    全てのN-gramを含むレシピのみを対象とし、重みの合計を関連度とする。
+    検索語からN-gramが得られない場合は None を返す。
+    """
+    grams = query_grams(query)
+    if not grams:
+        return None
+    return (
+        RecipeSearchGram.objects.filter(gram__in=grams)
+        .values('recipe_id')
+        .annotate(score=Sum('weight'), matched=Count('gram', distinct=True))
+        .filter(matched=len(grams))
+    )
+
+
+class RecipeSearchFilter(filters.BaseFilterBackend):
+    """N-gramインデックスを使ったレシピ検索フィルター
+
+    ?search= に一致するレシピに絞り込み、?ordering= の指定がなければ関連度順に並べる。
+    OrderingFilter より後ろに置くこと。
+    """
+    search_param = api_settings.SEARCH_PARAM
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        scores = search_scores(query)
+        if scores is None:
+            return queryset
+
+        score = scores.filter(recipe_id=OuterRef('pk')).values('score')
+        queryset = queryset.filter(id__in=scores.values('recipe_id')).annotate(
+            search_score=Subquery(score)
+        )
+        if api_settings.ORDERING_PARAM not in request.query_params:
+            queryset = queryset.order_by('-search_score', '-created_at')
+        return queryset
@@ -1,6 +1,154 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Category, Recipe, Ingredient, Step, RecipeFavorite, RecipeRating
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connection, transaction
+from django.db.models import prefetch_related_objects
+from django.db.models.fields.files import FieldFile
+from .models import Category, Recipe, Ingredient, Step, RecipeFavorite, RecipeRating, RecipeSimilarity
+from . import stats
+from .conditional import RECIPE_VERSION_COLUMNS
+from .facets import invalidate_facets
+from .favorites import get_favorite_ids
+from .images import build_srcset, schedule_derivatives
+from .pantry import DEFAULT_LIMIT, MAX_INGREDIENTS, MAX_LIMIT, schedule_pantry_update
+from .search import schedule_reindex
+from .similarity import schedule_similarity_update
+
+
+class EagerLoadingMixin:
+    """シリアライザーが参照する関連を宣言し、クエリセットへ一括取得を適用する
+
+    select_related_fields / prefetch_related_fields に必要な関連を列挙しておくと、
+    ビュー側は setup_eager_loading() を通すだけで件数に依存しないクエリ数になる。
+    """
+    select_related_fields = []
+    prefetch_related_fields = []
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, prefetch=True, fields=None, expand=None):
+        if cls.select_related_fields:
+            queryset = queryset.select_related(*cls.select_related_fields)
+        if prefetch and cls.prefetch_related_fields:
+            queryset = queryset.prefetch_related(*cls.prefetch_related_fields)
+        return queryset
+
+    @classmethod
+    def prefetch_instances(cls, instances, fields=None, expand=None):
+        """取得済みのインスタンスに後からprefetchを適用する"""
+        if cls.prefetch_related_fields:
+            prefetch_related_objects(instances, *cls.prefetch_related_fields)
+
+
+def parse_field_list(value):
+    """?fields= / ?expand= のカンマ区切りの指定を集合に変換する（未指定は None）"""
+    if value is None:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class SparseFieldsMixin(EagerLoadingMixin):
+    """?fields= / ?expand= で出力するフィールドと入れ子の展開を選べるようにするMixin
+
+    fields を指定すると列挙したフィールドのみを返す。
+    expand を指定すると expandable_fields のうち列挙した関連のみ入れ子で返し、
+    それ以外は外部キーならIDのみ、複数件の関連なら出力しない。
+    どちらかを指定した場合は SELECT する列も出力に必要なものへ絞り込み、
+    不要になった JOIN・prefetch も行わない。どちらも未指定なら全て展開する。
+    指定はビューがシリアライザーの context（fields / expand）で渡す。
+    """
+    expandable_fields = []
+    # モデルの列に対応しないフィールド → 出力に必要な列
+    field_columns = {}
+    # 出力しない場合でも常に取得する列（ETag・ページングで参照する）
+    required_columns = ['id']
+
+    @classmethod
+    def get_all_fields(cls):
+        """指定がない場合の全フィールド（クラスごとに一度だけ組み立てる）"""
+        if '_all_fields' not in cls.__dict__:
+            cls._all_fields = cls().fields
+        return cls._all_fields
+
+    @classmethod
+    def select_fields(cls, names, fields=None, expand=None):
+        """(出力するフィールド名, 展開する関連名) を返す"""
+        if fields is not None:
+            names = [name for name in names if name in fields]
+        expanded = [
+            name for name in cls.expandable_fields
+            if name in names and (expand is None or name in expand)
+        ]
+        return names, expanded
+
+    @classmethod
+    def get_columns(cls, names, expanded):
+        """出力に必要なモデルの列（関連先は 関連名__列名）"""
+        opts = cls.Meta.model._meta
+        all_fields = cls.get_all_fields()
+        columns = set(cls.required_columns)
+        for name in names:
+            if name in cls.field_columns:
+                columns.update(cls.field_columns[name])
+                continue
+            if name in cls.expandable_fields:
+                if opts.get_field(name).many_to_one:
+                    columns.add(name)
+                    if name in expanded:
+                        columns.update(f'{name}__{field}' for field in all_fields[name].Meta.fields)
+                continue
+            source = all_fields[name].source
+            try:
+                opts.get_field(source)
+            except FieldDoesNotExist:
+                continue
+            columns.add(source)
+        return sorted(columns)
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, prefetch=True, fields=None, expand=None):
+        if fields is None and expand is None:
+            return super().setup_eager_loading(queryset, prefetch)
+
+        names, expanded = cls.select_fields(list(cls.get_all_fields()), fields, expand)
+        select_related = [name for name in cls.select_related_fields if name in expanded]
+        prefetch_related = [name for name in cls.prefetch_related_fields if name in expanded]
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch and prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset.only(*cls.get_columns(names, expanded))
+
+    @classmethod
+    def prefetch_instances(cls, instances, fields=None, expand=None):
+        if fields is None and expand is None:
+            return super().prefetch_instances(instances)
+
+        _, expanded = cls.select_fields(list(cls.get_all_fields()), fields, expand)
+        prefetch_related = [name for name in cls.prefetch_related_fields if name in expanded]
+        if prefetch_related:
+            prefetch_related_objects(instances, *prefetch_related)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        root = self.root
+        # 入れ子で使われている場合は指定を適用しない
+        is_root = root is self or (root is self.parent and isinstance(root, serializers.ListSerializer))
+        selected = self.context.get('fields')
+        expand = self.context.get('expand')
+        if not is_root or (selected is None and expand is None):
+            return fields
+
+        names, expanded = self.select_fields(list(fields), selected, expand)
+        opts = self.Meta.model._meta
+        for name in list(fields):
+            if name not in names:
+                del fields[name]
+            elif name in self.expandable_fields and name not in expanded:
+                if opts.get_field(name).many_to_one:
+                    fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+                else:
+                    del fields[name]
+        return fields
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -21,48 +169,161 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'amount', 'unit', 'notes', 'order']
 
 
-class StepSerializer(serializers.ModelSerializer):
+class IngredientWriteSerializer(IngredientSerializer):
+    """レシピ作成・更新時の材料（idを指定すると既存の材料を更新する）"""
+    id = serializers.IntegerField(required=False)
+
+
+class ImageSrcsetMixin:
+    """image_srcset に画像の派生ファイル（幅違いのWebP / JPEG）を出力するMixin"""
+
+    def get_image_srcset(self, obj):
+        return build_srcset(obj, self.context.get('request'))
+
+
+class StepSerializer(ImageSrcsetMixin, serializers.ModelSerializer):
+    image_srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = Step
-        fields = ['id', 'step_number', 'description', 'image', 'cooking_time']
+        fields = ['id', 'step_number', 'description', 'image', 'image_srcset', 'cooking_time']
+
 
+def _without_id(data):
+    """入力値から id を除く（新規作成時は主キーを採番させる）"""
+    return {key: value for key, value in data.items() if key != 'id'}
 
-class RecipeListSerializer(serializers.ModelSerializer):
+
+def _has_changed(current, value):
+    if isinstance(current, FieldFile):
+        # 新しいファイルの指定、または既存ファイルのクリア
+        return bool(value) or bool(current)
+    return current != value
+
+
+class RecipeListSerializer(SparseFieldsMixin, ImageSrcsetMixin, serializers.ModelSerializer):
     """レシピ一覧用のシリアライザー（軽量版）"""
+    select_related_fields = ['author', 'category']
+    expandable_fields = ['author', 'category']
+    field_columns = {
+        'image_srcset': ['image', 'image_derivatives'],
+        'is_favorited': [],
+    }
+    required_columns = RECIPE_VERSION_COLUMNS
+
     author = UserSerializer(read_only=True)
     category = CategorySerializer(read_only=True)
+    image_srcset = serializers.SerializerMethodField()
     favorite_count = serializers.ReadOnlyField()
+    is_favorited = serializers.SerializerMethodField()
     
     class Meta:
         model = Recipe
         fields = [
-            'id', 'title', 'description', 'image', 'cooking_time', 
+            'id', 'title', 'description', 'image', 'image_srcset', 'cooking_time', 
             'servings', 'difficulty', 'category', 'author', 
-            'favorite_count', 'created_at', 'updated_at'
+            'favorite_count', 'is_favorited', 'rating_avg', 'rating_count',
+            'created_at', 'updated_at'
         ]
+        read_only_fields = ['rating_avg', 'rating_count']
+    
+    def get_is_favorited(self, recipe):
+        """ログインユーザーのお気に入りかどうか（ID集合はリクエストごとに1回だけ取得）"""
+        request = self.context.get('request')
+        if request is None or not request.user.is_authenticated:
+            return False
+        if 'favorite_ids' not in self.context:
+            self.context['favorite_ids'] = get_favorite_ids(request.user)
+        return recipe.id in self.context['favorite_ids']
 
 
-class RecipeDetailSerializer(serializers.ModelSerializer):
+class RecipeDetailSerializer(SparseFieldsMixin, ImageSrcsetMixin, serializers.ModelSerializer):
     """レシピ詳細用のシリアライザー（完全版）"""
+    select_related_fields = ['author', 'category']
+    prefetch_related_fields = ['ingredients', 'steps']
+    expandable_fields = ['author', 'category', 'ingredients', 'steps']
+    field_columns = {
+        'image_srcset': ['image', 'image_derivatives'],
+        'rating_histogram': ['rating_count', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5'],
+    }
+    required_columns = RECIPE_VERSION_COLUMNS
+
     author = UserSerializer(read_only=True)
     category = CategorySerializer(read_only=True)
     ingredients = IngredientSerializer(many=True, read_only=True)
     steps = StepSerializer(many=True, read_only=True)
+    image_srcset = serializers.SerializerMethodField()
     favorite_count = serializers.ReadOnlyField()
+    rating_histogram = serializers.ReadOnlyField()
     
     class Meta:
         model = Recipe
         fields = [
-            'id', 'title', 'description', 'youtube_url', 'image',
+            'id', 'title', 'description', 'youtube_url', 'image', 'image_srcset',
             'cooking_time', 'servings', 'difficulty', 'category',
             'author', 'ingredients', 'steps', 'favorite_count',
+            'rating_avg', 'rating_count', 'rating_histogram',
             'created_at', 'updated_at', 'is_public'
         ]
+        read_only_fields = ['rating_avg', 'rating_count']
+
+
+class RecipeBulkCreateSerializer(serializers.ListSerializer):
+    """レシピ一括作成用のシリアライザー（インポーター向け）
+
+    レシピ・材料・手順をそれぞれ bulk_create でまとめて登録する。
+    bulk_create で主キーを取得できないDBでは1件ずつ作成する。
+    """
+    max_batch_size = 100
+
+    def validate(self, attrs):
+        if len(attrs) > self.max_batch_size:
+            raise serializers.ValidationError(
+                f'一度に登録できるレシピは{self.max_batch_size}件までです'
+            )
+        return attrs
+
+    def create(self, validated_data):
+        with transaction.atomic():
+            if not connection.features.can_return_rows_from_bulk_insert:
+                recipes = [self.child.create(attrs) for attrs in validated_data]
+                prefetch_related_objects(recipes, 'ingredients', 'steps')
+                return recipes
+
+            nested = [
+                (attrs.pop('ingredients', []), attrs.pop('steps', []))
+                for attrs in validated_data
+            ]
+            recipes = Recipe.objects.bulk_create(
+                [Recipe(**attrs) for attrs in validated_data]
+            )
+
+            ingredients = []
+            steps = []
+            for recipe, (ingredients_data, steps_data) in zip(recipes, nested):
+                ingredients += [
+                    Ingredient(recipe=recipe, **_without_id(data)) for data in ingredients_data
+                ]
+                steps += [Step(recipe=recipe, **data) for data in steps_data]
+            Ingredient.objects.bulk_create(ingredients)
+            Step.objects.bulk_create(steps)
+
+            # bulk_create はシグナルを発行しないため明示的に反映する
+            schedule_reindex(*[recipe.id for recipe in recipes])
+            schedule_similarity_update(*[recipe.id for recipe in recipes])
+            schedule_pantry_update(*[recipe.id for recipe in recipes])
+            schedule_derivatives(*recipes, *steps)
+            stats.adjust_counter('total_recipes', sum(recipe.is_public for recipe in recipes))
+            stats.invalidate_recent_recipes()
+            invalidate_facets()
+        # レスポンスで材料・手順をレシピごとに読み込まないよう、まとめて取得しておく
+        prefetch_related_objects(recipes, 'ingredients', 'steps')
+        return recipes
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
     """レシピ作成用のシリアライザー"""
-    ingredients = IngredientSerializer(many=True, required=False)
+    ingredients = IngredientWriteSerializer(many=True, required=False)
     steps = StepSerializer(many=True, required=False)
     
     class Meta:
@@ -72,49 +333,148 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             'cooking_time', 'servings', 'difficulty', 'category',
             'ingredients', 'steps', 'is_public'
         ]
+        list_serializer_class = RecipeBulkCreateSerializer
+    
+    def validate_steps(self, value):
+        step_numbers = [step['step_number'] for step in value]
+        if len(step_numbers) != len(set(step_numbers)):
+            raise serializers.ValidationError('手順番号が重複しています')
+        return value
     
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients', [])
         steps_data = validated_data.pop('steps', [])
         
-        # レシピを作成
-        recipe = Recipe.objects.create(**validated_data)
-        
-        # 材料を作成
-        for ingredient_data in ingredients_data:
-            Ingredient.objects.create(recipe=recipe, **ingredient_data)
-        
-        # 手順を作成
-        for step_data in steps_data:
-            Step.objects.create(recipe=recipe, **step_data)
+        with transaction.atomic():
+            # レシピを作成
+            recipe = Recipe.objects.create(**validated_data)
+            
+            # 材料・手順をまとめて作成
+            Ingredient.objects.bulk_create(
+                [Ingredient(recipe=recipe, **_without_id(data)) for data in ingredients_data]
+            )
+            steps = Step.objects.bulk_create(
+                [Step(recipe=recipe, **data) for data in steps_data]
+            )
+            schedule_derivatives(*steps)
         
         return recipe
     
     def update(self, instance, validated_data):
-        ingredients_data = validated_data.pop('ingredients', [])
-        steps_data = validated_data.pop('steps', [])
+        # 指定されなかった材料・手順は変更しない（PATCHでの消失を防ぐ）
+        ingredients_data = validated_data.pop('ingredients', None)
+        steps_data = validated_data.pop('steps', None)
         
-        # レシピ基本情報を更新
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
+        with transaction.atomic():
+            # レシピ基本情報を更新
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.save()
+            
+            if ingredients_data is not None:
+                self.sync_ingredients(instance, ingredients_data)
+            if steps_data is not None:
+                self.sync_steps(instance, steps_data)
         
-        # 既存の材料と手順を削除
-        instance.ingredients.all().delete()
-        instance.steps.all().delete()
+        return instance
+    
+    def sync_ingredients(self, recipe, ingredients_data):
+        """材料を id（なければ order）で既存行と突き合わせて差分更新"""
+        existing = list(recipe.ingredients.all())
+        by_id = {ingredient.id: ingredient for ingredient in existing}
+        by_order = {}
+        for ingredient in existing:
+            by_order.setdefault(ingredient.order, []).append(ingredient)
         
-        # 新しい材料を作成
-        for ingredient_data in ingredients_data:
-            Ingredient.objects.create(recipe=instance, **ingredient_data)
+        requested_ids = [data['id'] for data in ingredients_data if 'id' in data]
+        if len(requested_ids) != len(set(requested_ids)):
+            raise serializers.ValidationError({'ingredients': '材料IDが重複しています'})
+        matched_ids = set(requested_ids)
+        unknown_ids = matched_ids - by_id.keys()
+        if unknown_ids:
+            raise serializers.ValidationError({
+                'ingredients': f'このレシピに存在しない材料IDです: {sorted(unknown_ids)}'
+            })
         
-        # 新しい手順を作成
-        for step_data in steps_data:
-            Step.objects.create(recipe=instance, **step_data)
+        pairs = []
+        for data in ingredients_data:
+            if 'id' in data:
+                pairs.append((by_id[data['id']], _without_id(data)))
+                continue
+            # id指定のない材料は、同じ order の未使用の既存行を再利用する
+            candidates = [
+                ingredient for ingredient in by_order.get(data.get('order', 0), [])
+                if ingredient.id not in matched_ids
+            ]
+            ingredient = candidates[0] if candidates else None
+            if ingredient is not None:
+                matched_ids.add(ingredient.id)
+            pairs.append((ingredient, data))
         
-        return instance
+        self._apply_nested_changes(recipe, Ingredient, existing, pairs)
+    
+    def sync_steps(self, recipe, steps_data):
+        """手順を step_number で既存行と突き合わせて差分更新
+
+        step_number はレシピ内で一意のため、既存行の番号は変更せず
+        不要になった番号の削除と新しい番号の作成で並べ替えを表現する。
+        """
+        existing = list(recipe.steps.all())
+        by_number = {step.step_number: step for step in existing}
+        pairs = [
+            (by_number.get(data['step_number']), _without_id(data))
+            for data in steps_data
+        ]
+        self._apply_nested_changes(recipe, Step, existing, pairs)
+    
+    def _apply_nested_changes(self, recipe, model, existing, pairs):
+        """(既存行 or None, 入力値) の組から最小限の削除・更新・作成を発行する
 
+        bulk_update / bulk_create は保存シグナルを発行しないため、材料・手順の
+        シグナルで行う検索インデックス・類似レシピ・材料インデックスの更新は明示的に予約する
+        （レシピの更新日時・表現キャッシュは update() でのレシピの保存で反映される）。
+        """
+        matched_ids = {obj.id for obj, _ in pairs if obj is not None}
+        stale_ids = [obj.id for obj in existing if obj.id not in matched_ids]
+        
+        to_create = []
+        to_update = []
+        update_fields = set()
+        for obj, data in pairs:
+            if obj is None:
+                to_create.append(model(recipe=recipe, **data))
+                continue
+            changed = [field for field, value in data.items() if _has_changed(getattr(obj, field), value)]
+            if not changed:
+                continue
+            for field in changed:
+                setattr(obj, field, data[field])
+            if any(isinstance(getattr(obj, field), FieldFile) for field in changed):
+                # bulk_update はファイルを保存しないため個別に保存する
+                obj.save(update_fields=changed)
+            else:
+                to_update.append(obj)
+                update_fields.update(changed)
+        
+        if stale_ids:
+            model.objects.filter(id__in=stale_ids).delete()
+        if to_update:
+            model.objects.bulk_update(to_update, sorted(update_fields))
+        if to_create:
+            created = model.objects.bulk_create(to_create)
+            if model is Step:
+                schedule_derivatives(*created)
+        
+        if stale_ids or to_update or to_create:
+            schedule_reindex(recipe.id)
+            if model is Ingredient:
+                schedule_similarity_update(recipe.id)
+                schedule_pantry_update(recipe.id)
+
+
+class RecipeFavoriteSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ['recipe__author', 'recipe__category']
 
-class RecipeFavoriteSerializer(serializers.ModelSerializer):
     recipe = RecipeListSerializer(read_only=True)
     
     class Meta:
@@ -122,7 +482,46 @@ class RecipeFavoriteSerializer(serializers.ModelSerializer):
         fields = ['id', 'recipe', 'created_at']
 
 
-class RecipeRatingSerializer(serializers.ModelSerializer):
+class RecipeSimilaritySerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    """類似レシピ（類似度付き）"""
+    select_related_fields = ['similar_recipe__author', 'similar_recipe__category']
+
+    recipe = RecipeListSerializer(source='similar_recipe', read_only=True)
+
+    class Meta:
+        model = RecipeSimilarity
+        fields = ['recipe', 'score']
+
+
+class FavoriteOperationSerializer(serializers.Serializer):
+    """お気に入り一括操作の1件分"""
+    ACTION_CHOICES = [
+        ('add', '追加'),
+        ('remove', '削除'),
+    ]
+
+    recipe_id = serializers.IntegerField()
+    action = serializers.ChoiceField(choices=ACTION_CHOICES)
+
+
+class FavoriteBatchSerializer(serializers.Serializer):
+    """お気に入り一括操作"""
+    operations = FavoriteOperationSerializer(many=True, allow_empty=False, max_length=200)
+
+
+class CookableQuerySerializer(serializers.Serializer):
+    """手持ちの材料で作れるレシピの検索条件"""
+    ingredients = serializers.ListField(
+        child=serializers.CharField(max_length=100), required=False, max_length=MAX_INGREDIENTS
+    )
+    use_inventory = serializers.BooleanField(default=False)
+    limit = serializers.IntegerField(min_value=1, max_value=MAX_LIMIT, default=DEFAULT_LIMIT)
+    max_missing = serializers.IntegerField(min_value=0, required=False)
+
+
+class RecipeRatingSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ['user', 'recipe__author', 'recipe__category']
+
     user = UserSerializer(read_only=True)
     recipe = RecipeListSerializer(read_only=True)
     
@@ -0,0 +1,262 @@
+import threading
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from accounts.signals import users_imported
+
+from . import images, search, stats
+from .facets import invalidate_facets, recipe_facets_changed
+from .models import Category, Recipe, Ingredient, Step
+from .representations import invalidate_representations
+from .search import schedule_reindex
+from .pantry import schedule_pantry_update
+from .similarity import schedule_similarity_update
+
+
+@receiver(post_save, sender=Recipe)
+def reindex_recipe_on_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """レシピ作成時・タイトルか説明の変更時に検索インデックスを更新
+
+    材料・手順の変更は下の個別のシグナル、APIでの一括更新は
+    RecipeCreateSerializer._apply_nested_changes で更新を予約する。
+    """
+    if raw:
+        return
+    changed = None if created else instance.get_changed_fields(update_fields)
+    if changed is None or search.INDEXED_RECIPE_FIELDS & set(changed):
+        schedule_reindex(instance.id)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=Step)
+@receiver(post_delete, sender=Step)
+def reindex_recipe_on_child_change(sender, instance, raw=False, **kwargs):
+    """材料・手順の変更時に親レシピの検索インデックスを更新"""
+    if not raw:
+        schedule_reindex(instance.recipe_id)
+
+
+@receiver(post_save, sender=Recipe)
+def update_similarity_on_recipe_save(sender, instance, raw=False, **kwargs):
+    """レシピ保存時（公開・非公開の切り替えを含む）に類似レシピを更新"""
+    if not raw:
+        schedule_similarity_update(instance.id)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def update_similarity_on_ingredient_change(sender, instance, raw=False, **kwargs):
+    """材料の変更時に類似レシピを更新"""
+    if not raw:
+        schedule_similarity_update(instance.recipe_id)
+
+
+@receiver(pre_delete, sender=Recipe)
+def update_similarity_on_recipe_delete(sender, instance, **kwargs):
+    """レシピ削除時に、そのレシピを類似レシピに含むレシピを更新（削除で1件減るため）"""
+    schedule_similarity_update(*instance.similar_to.values_list('recipe_id', flat=True))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def update_pantry_index_on_recipe_change(sender, instance, raw=False, **kwargs):
+    """レシピ保存・削除時（公開・非公開の切り替えを含む）に材料の転置インデックスを更新"""
+    if not raw:
+        schedule_pantry_update(instance.id)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def update_pantry_index_on_ingredient_change(sender, instance, raw=False, **kwargs):
+    """材料の変更時に材料の転置インデックスを更新"""
+    if not raw:
+        schedule_pantry_update(instance.recipe_id)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=Step)
+@receiver(post_delete, sender=Step)
+def touch_recipe_on_child_change(sender, instance, raw=False, **kwargs):
+    """材料・手順の変更をレシピの更新日時と表現キャッシュに反映（ETag / Last-Modified 用）"""
+    if not raw:
+        schedule_touch(instance.recipe_id)
+
+
+_pending_touches = threading.local()
+
+
+def schedule_touch(*recipe_ids):
+    """コミット後にレシピの更新日時を進める
+
+    材料・手順を同じトランザクションでまとめて保存・削除した場合でも、
+    1回の UPDATE で済むよう対象IDを溜めておく。
+    """
+    if not hasattr(_pending_touches, 'recipe_ids'):
+        _pending_touches.recipe_ids = set()
+    _pending_touches.recipe_ids.update(recipe_ids)
+    transaction.on_commit(_flush_touches)
+
+
+def _flush_touches():
+    recipe_ids = getattr(_pending_touches, 'recipe_ids', None)
+    if not recipe_ids:
+        return
+    _pending_touches.recipe_ids = set()
+    Recipe.objects.filter(id__in=recipe_ids).update(updated_at=timezone.now())
+    invalidate_representations(*recipe_ids)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_representations_on_recipe_change(sender, instance, raw=False, **kwargs):
+    """レシピ保存・削除時に表現キャッシュを無効化"""
+    if not raw:
+        invalidate_representations(instance.id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+def invalidate_representations_on_category_change(sender, instance, raw=False, **kwargs):
+    """カテゴリ変更時に、そのカテゴリのレシピの表現キャッシュを無効化
+
+    削除時はレシピのカテゴリが外される（SET_NULL）前に対象を集める。
+    """
+    if not raw:
+        invalidate_representations(
+            *Recipe.objects.filter(category=instance).values_list('id', flat=True)
+        )
+
+
+# レシピの表現に含まれる作成者の項目（UserSerializer と同じ）
+AUTHOR_FIELDS = {'username', 'first_name', 'last_name', 'email'}
+
+
+@receiver(post_save, sender=User)
+def invalidate_representations_on_author_change(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """作成者の表示項目の変更時に、その作成者のレシピの表現キャッシュを無効化
+
+    ログイン時の last_login の更新など、表示項目を含まない保存では何もしない。
+    """
+    if created or raw or (update_fields is not None and not AUTHOR_FIELDS & set(update_fields)):
+        return
+    invalidate_representations(
+        *Recipe.objects.filter(author=instance).values_list('id', flat=True)
+    )
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Step)
+def process_image_on_save(sender, instance, raw=False, **kwargs):
+    """画像の保存時に派生ファイル（サムネイル）を生成、クリア時に削除"""
+    if not raw:
+        images.handle_image_save(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Step)
+def delete_images_on_delete(sender, instance, **kwargs):
+    """削除時に元画像と派生ファイルを削除"""
+    images.handle_image_delete(instance)
+
+
+@receiver(images.derivatives_ready, sender=Recipe)
+def refresh_recipe_on_derivatives_ready(sender, instance, **kwargs):
+    """派生ファイルの生成をETag・最近のレシピに反映（update() のため保存シグナルは出ない）"""
+    Recipe.objects.filter(id=instance.id).update(updated_at=timezone.now())
+    invalidate_representations(instance.id)
+    stats.invalidate_recent_recipes()
+
+
+@receiver(images.derivatives_ready, sender=Step)
+def refresh_step_recipe_on_derivatives_ready(sender, instance, **kwargs):
+    Recipe.objects.filter(id=instance.recipe_id).update(updated_at=timezone.now())
+    invalidate_representations(instance.recipe_id)
+
+
+@receiver(post_save, sender=Recipe)
+def invalidate_facets_on_recipe_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """レシピ作成時・件数に影響するフィールドの変更時にファセットのキャッシュを無効化"""
+    if not raw and (created or recipe_facets_changed(instance, update_fields)):
+        invalidate_facets('recipes')
+
+
+@receiver(post_delete, sender=Recipe)
+def invalidate_facets_on_recipe_delete(sender, instance, **kwargs):
+    """レシピ削除時にファセットのキャッシュを無効化"""
+    invalidate_facets('recipes')
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_facets_on_category_change(sender, instance, raw=False, **kwargs):
+    """カテゴリ名の変更・削除時にファセットのキャッシュを無効化"""
+    if not raw:
+        invalidate_facets('recipes')
+
+
+@receiver(post_save, sender=User)
+def invalidate_facets_on_author_change(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """作成者名の変更時にファセットのキャッシュを無効化（新規作成・ログイン時の保存では何もしない）"""
+    if created or raw or (update_fields is not None and 'username' not in update_fields):
+        return
+    if Recipe.objects.filter(author=instance).exists():
+        invalidate_facets('recipes')
+
+
+@receiver(post_save, sender=Recipe)
+def update_stats_on_recipe_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """レシピ保存時に統計キャッシュを更新"""
+    if raw:
+        return
+    if created:
+        if instance.is_public:
+            stats.adjust_counter('total_recipes', 1)
+    else:
+        changed = instance.get_changed_fields(update_fields)
+        if changed is None:
+            # 変更前の値がわからないため、次回の参照時に数え直す
+            stats.invalidate_counter('total_recipes')
+        elif 'is_public' in changed:
+            stats.adjust_counter('total_recipes', 1 if instance.is_public else -1)
+    stats.invalidate_recent_recipes()
+
+
+@receiver(post_delete, sender=Recipe)
+def update_stats_on_recipe_delete(sender, instance, **kwargs):
+    """レシピ削除時に統計キャッシュを更新"""
+    if instance.is_public:
+        stats.adjust_counter('total_recipes', -1)
+    stats.invalidate_recent_recipes()
+
+
+@receiver(post_save, sender=Category)
+def update_stats_on_category_save(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        stats.adjust_counter('total_categories', 1)
+
+
+@receiver(post_delete, sender=Category)
+def update_stats_on_category_delete(sender, instance, **kwargs):
+    stats.adjust_counter('total_categories', -1)
+
+
+@receiver(post_save, sender=User)
+def update_stats_on_user_save(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        stats.adjust_counter('total_users', 1)
+
+
+@receiver(post_delete, sender=User)
+def update_stats_on_user_delete(sender, instance, **kwargs):
+    stats.adjust_counter('total_users', -1)
+
+
+@receiver(users_imported)
+def update_stats_on_users_imported(sender, users, **kwargs):
+    stats.adjust_counter('total_users', len(users))
@@ -0,0 +1,361 @@
+"""材料の重なりによる類似レシピ
+
+公開レシピ×材料の疎行列（SciPy）を作り、レシピごとに類似度の高い上位k件を
+RecipeSimilarity に事前計算しておく。APIはこのテーブルを読むだけなので、
+応答時間はレシピ数に依存しない。
+
+材料・レシピの変更時は、変更されたレシピの行だけを行列上で差し替え、
+そのレシピと材料を共有するレシピのうち上位k件が変わりうるものだけを再計算する。
+行列はプロセスごとに保持し、変更したレシピを世代番号とともにキャッシュへ記録する。
+他のプロセスは次の更新時に、自分の世代以降に変更されたレシピの行だけをDBから読み直す
+（記録が欠けている場合は全件を読み直す）。
+全件の作り直しは rebuild_recipe_similarity コマンドで行う。
+"""
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Count, Min, Q
+from scipy import sparse
+
+from .models import Ingredient, RecipeSimilarity
+from .search import normalize
+
+
+logger = logging.getLogger(__name__)
+
+TOP_K = 10
+METRICS = ('cosine', 'jaccard')
+# 多くのレシピに含まれる材料（塩・水など）は類似度の手がかりにならないため除外する
+MAX_DOCUMENT_FREQUENCY = 0.2
+# レシピ数がこれより少ないうちは除外しない
+MIN_RECIPES_FOR_CUTOFF = 50
+GENERATION_KEY = 'recipes:similarity:generation'
+CHANGES_PREFIX = 'recipes:similarity:changes:'
+CHANGES_TIMEOUT = 60 * 60
+# 追いつくために読み直す世代数の上限（超えた場合は全件を読み直す）
+MAX_REPLAY = 100
+BATCH_SIZE = 1000
+
+# 括弧書きの補足（例: 玉ねぎ(中)）と空白
+_NOTE_RE = re.compile(r'\(.*?\)|\[.*?\]|\s+')
+
+
+def get_metric():
+    return getattr(settings, 'RECIPE_SIMILARITY_METRIC', 'cosine')
+
+
+def ingredient_term(name):
+    """材料名を照合用に正規化する（表記揺れ・括弧書き・空白を除く）"""
+    return _NOTE_RE.sub('', normalize(name))
+
+
+def load_terms(recipe_ids=None):
+    """{レシピID: 材料名の集合} を公開レシピについて読み込む"""
+    queryset = Ingredient.objects.filter(recipe__is_public=True)
+    if recipe_ids is not None:
+        queryset = queryset.filter(recipe_id__in=recipe_ids)
+    terms = {}
+    for recipe_id, name in queryset.values_list('recipe_id', 'name').iterator(chunk_size=5000):
+        term = ingredient_term(name)
+        if term:
+            terms.setdefault(recipe_id, set()).add(term)
+    return terms
+
+
+class IngredientMatrix:
+    """公開レシピ×材料の疎行列（値は0/1）
+
+    行は {レシピID: 材料の列番号の配列} で保持し、差し替えた後に
+    最初に参照した時点で行列を作り直す（DBへの問い合わせは行わない）。
+    材料からレシピを引くため列方向（CSC）でも持ち、1件分の類似度計算は
+    そのレシピの材料を含むレシピだけを走査する。
+    """
+
+    def __init__(self, rows=None):
+        self.vocabulary = {}
+        self.rows = {}
+        self._csr = None
+        if rows:
+            self.set_rows(rows)
+
+    def set_rows(self, rows):
+        """{レシピID: 材料名の集合} で行を差し替える（空集合の場合は行を削除する）"""
+        for recipe_id, terms in rows.items():
+            if terms:
+                columns = {self.vocabulary.setdefault(term, len(self.vocabulary)) for term in terms}
+                self.rows[recipe_id] = np.array(sorted(columns), dtype=np.int32)
+            else:
+                self.rows.pop(recipe_id, None)
+        self._csr = None
+
+    def _build(self):
+        lengths = np.fromiter((len(columns) for columns in self.rows.values()), dtype=np.int64, count=len(self.rows))
+        indptr = np.concatenate(([0], np.cumsum(lengths)))
+        indices = np.concatenate(list(self.rows.values())) if self.rows else np.zeros(0, dtype=np.int32)
+        shape = (len(self.rows), len(self.vocabulary))
+        csr = sparse.csr_matrix((np.ones(len(indices), dtype=np.float32), indices, indptr), shape=shape)
+
+        if len(self.rows) >= MIN_RECIPES_FOR_CUTOFF:
+            frequency = np.bincount(indices, minlength=len(self.vocabulary))
+            keep = frequency <= MAX_DOCUMENT_FREQUENCY * len(self.rows)
+            csr = csr @ sparse.diags(keep.astype(np.float32))
+            csr.eliminate_zeros()
+            csr = csr.tocsr()
+
+        self.recipe_ids = np.fromiter(self.rows.keys(), dtype=np.int64, count=len(self.rows))
+        self.row_of = {recipe_id: row for row, recipe_id in enumerate(self.recipe_ids.tolist())}
+        self.sizes = np.diff(csr.indptr)
+        self._csr = csr
+        self._csc = csr.tocsc()
+
+    def _ensure_built(self):
+        if self._csr is None:
+            self._build()
+
+    def _top_k(self, row, candidates, intersections, k, metric):
+        """候補のレシピ（行番号）と共通の材料数から上位k件の (レシピID, 類似度) を返す"""
+        keep = candidates != row
+        candidates = candidates[keep]
+        intersections = intersections[keep].astype(np.float64)
+        if not len(candidates):
+            return []
+
+        size = self.sizes[row]
+        others = self.sizes[candidates]
+        if metric == 'jaccard':
+            scores = intersections / (size + others - intersections)
+        else:
+            scores = intersections / np.sqrt(size * others)
+
+        if len(scores) > k:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(scores))
+        recipe_ids = self.recipe_ids[candidates[top]]
+        # 同じ類似度ではレシピIDの小さい順にして結果を安定させる
+        order = np.lexsort((recipe_ids, -scores[top]))
+        return [(int(recipe_ids[i]), float(scores[top][i])) for i in order]
+
+    def neighbours(self, recipe_id, k=TOP_K, metric='cosine'):
+        """レシピ1件の類似レシピ上位k件（材料を共有するレシピだけを走査する）"""
+        self._ensure_built()
+        row = self.row_of.get(recipe_id)
+        if row is None:
+            return []
+        columns = self._csr.indices[self._csr.indptr[row]:self._csr.indptr[row + 1]]
+        if not len(columns):
+            return []
+        postings = self._csc[:, columns]
+        candidates, intersections = np.unique(postings.indices, return_counts=True)
+        return self._top_k(row, candidates, intersections, k, metric)
+
+    def all_neighbours(self, k=TOP_K, metric='cosine', batch_size=BATCH_SIZE):
+        """全レシピの (レシピID, 上位k件) を、行のブロックごとの疎行列積で順に返す"""
+        self._ensure_built()
+        transposed = self._csr.T.tocsr()
+        for start in range(0, len(self.recipe_ids), batch_size):
+            product = (self._csr[start:start + batch_size] @ transposed).tocsr()
+            for offset in range(product.shape[0]):
+                begin, end = product.indptr[offset], product.indptr[offset + 1]
+                neighbours = self._top_k(
+                    start + offset, product.indices[begin:end], product.data[begin:end], k, metric
+                )
+                yield int(self.recipe_ids[start + offset]), neighbours
+
+
+def save_neighbours(neighbours):
+    """{レシピID: 上位k件} で RecipeSimilarity を置き換える"""
+    with transaction.atomic():
+        RecipeSimilarity.objects.filter(recipe_id__in=list(neighbours)).delete()
+        RecipeSimilarity.objects.bulk_create([
+            RecipeSimilarity(recipe_id=recipe_id, similar_recipe_id=similar_id, score=score)
+            for recipe_id, items in neighbours.items()
+            for similar_id, score in items
+        ], batch_size=BATCH_SIZE)
+
+
+_matrix_lock = threading.RLock()
+_matrix_state = {'matrix': None, 'generation': None}
+
+
+def _changes_key(generation):
+    return f'{CHANGES_PREFIX}{generation}'
+
+
+def _current_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # 世代番号が消えていた場合は、以前の番号と重ならない値から始め直す
+        # （変更の記録がないため、どのプロセスも次の更新時に全件を読み直す）
+        cache.add(GENERATION_KEY, time.time_ns() // 1000, None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def get_matrix():
+    """このプロセスの行列（他のプロセスの変更分を取り込んでから返す）"""
+    generation = _current_generation()
+    matrix = _matrix_state['matrix']
+    current = _matrix_state['generation']
+    if matrix is not None and current == generation:
+        return matrix
+
+    changed = None
+    if matrix is not None and current < generation <= current + MAX_REPLAY:
+        keys = [_changes_key(number) for number in range(current + 1, generation + 1)]
+        found = cache.get_many(keys)
+        if len(found) == len(keys):
+            changed = set().union(*found.values())
+
+    if changed is None:
+        matrix = IngredientMatrix(load_terms())
+    else:
+        terms = load_terms(changed)
+        matrix.set_rows({recipe_id: terms.get(recipe_id, set()) for recipe_id in changed})
+    _matrix_state['matrix'] = matrix
+    _matrix_state['generation'] = generation
+    return matrix
+
+
+def _publish_update(recipe_ids):
+    """変更したレシピを次の世代として記録し、他のプロセスに知らせる"""
+    previous = _matrix_state['generation']
+    try:
+        generation = cache.incr(GENERATION_KEY)
+    except ValueError:
+        _current_generation()
+        return
+    cache.set(_changes_key(generation), set(recipe_ids), CHANGES_TIMEOUT)
+    if generation == previous + 1:
+        _matrix_state['generation'] = generation
+    # 間に他のプロセスの世代がある場合は世代を進めず、次回にまとめて読み直す
+    # （自分の変更も読み直すことになるが、結果は同じになる）
+
+
+def _scores_against(matrix, recipe_id, metric):
+    """レシピと材料を共有する全レシピとの類似度 {レシピID: 類似度}"""
+    return dict(matrix.neighbours(recipe_id, k=len(matrix.rows), metric=metric))
+
+
+def update_similarities(recipe_ids, k=TOP_K, metric=None):
+    """変更されたレシピの行を差し替え、影響を受けるレシピの上位k件を再計算する
+
+    再計算するのは、変更されたレシピ自身と、
+    - 変更されたレシピを現在の上位k件に含むレシピ
+    - 変更後の類似度が現在の上位k件の最小値を上回る（または上位がk件未満の）レシピ
+    """
+    metric = metric or get_metric()
+    changed = set(recipe_ids)
+    with _matrix_lock:
+        matrix = get_matrix()
+        terms = load_terms(changed)
+        matrix.set_rows({recipe_id: terms.get(recipe_id, set()) for recipe_id in changed})
+
+        affected = set(
+            RecipeSimilarity.objects.filter(similar_recipe_id__in=changed)
+            .values_list('recipe_id', flat=True)
+        )
+        scores = {}
+        for recipe_id in changed:
+            for other_id, score in _scores_against(matrix, recipe_id, metric).items():
+                scores[other_id] = max(score, scores.get(other_id, 0))
+        candidates = [recipe_id for recipe_id in scores if recipe_id not in changed | affected]
+        for start in range(0, len(candidates), BATCH_SIZE):
+            batch = candidates[start:start + BATCH_SIZE]
+            current = (
+                RecipeSimilarity.objects.filter(recipe_id__in=batch)
+                .values('recipe_id')
+                .annotate(lowest=Min('score'), count=Count('id'))
+            )
+            full = {row['recipe_id']: row['lowest'] for row in current if row['count'] >= k}
+            affected.update(
+                recipe_id for recipe_id in batch
+                if recipe_id not in full or scores[recipe_id] > full[recipe_id]
+            )
+
+        save_neighbours({
+            recipe_id: matrix.neighbours(recipe_id, k, metric)
+            for recipe_id in changed | affected
+        })
+        _publish_update(changed)
+
+
+def rebuild_similarities(k=TOP_K, metric=None, batch_size=BATCH_SIZE):
+    """全レシピの上位k件を作り直し、処理したレシピ数を返す"""
+    metric = metric or get_metric()
+    with _matrix_lock:
+        # 読み込み後の変更は、次の更新時に記録から取り込む
+        generation = _current_generation()
+        matrix = IngredientMatrix(load_terms())
+        processed = 0
+        batch = {}
+        for recipe_id, neighbours in matrix.all_neighbours(k, metric, batch_size):
+            batch[recipe_id] = neighbours
+            if len(batch) >= batch_size:
+                save_neighbours(batch)
+                processed += len(batch)
+                batch = {}
+        if batch:
+            save_neighbours(batch)
+            processed += len(batch)
+        # 行列に含まれない（非公開・材料なし）レシピの結果を消す
+        RecipeSimilarity.objects.filter(
+            Q(recipe__is_public=False) | ~Q(recipe__in=Ingredient.objects.values('recipe_id'))
+        ).delete()
+
+        _matrix_state['matrix'] = matrix
+        _matrix_state['generation'] = generation
+    return processed
+
+
+_pending = threading.local()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='recipe-similarity')
+        return _executor
+
+
+def _run(recipe_ids):
+    try:
+        update_similarities(recipe_ids)
+    except Exception:
+        logger.exception('類似レシピの更新に失敗しました: %s', sorted(recipe_ids))
+    finally:
+        connections.close_all()
+
+
+def schedule_similarity_update(*recipe_ids):
+    """コミット後に類似レシピを更新する
+
+    同じトランザクションでの変更はまとめて1回の更新にする。
+    RECIPE_SIMILARITY_BACKGROUND が False の場合はその場で更新する。
+    """
+    if not hasattr(_pending, 'recipe_ids'):
+        _pending.recipe_ids = set()
+    _pending.recipe_ids.update(recipe_ids)
+    transaction.on_commit(_flush_pending)
+
+
+def _flush_pending():
+    recipe_ids = getattr(_pending, 'recipe_ids', None)
+    if not recipe_ids:
+        return
+    _pending.recipe_ids = set()
+    if getattr(settings, 'RECIPE_SIMILARITY_BACKGROUND', True):
+        # 行列はプロセス内で共有するため、更新は1スレッドで順に行う
+        _get_executor().submit(_run, recipe_ids)
+    else:
+        update_similarities(recipe_ids)
@@ -0,0 +1,132 @@
+"""レシピ統計API用のキャッシュ
+
+件数は起動後に一度だけDBから数え、以降はシグナルから加算・減算する。
+最近のレシピは短いTTLでキャッシュし、レシピの更新時に破棄する。
+どちらもキャッシュが切れた瞬間に同時アクセスが集中しても、
+DBへ問い合わせるのは1リクエストだけになるよう排他制御する。
+"""
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Category, Recipe
+
+
+CACHE_PREFIX = 'recipes:stats:'
+# 件数のずれ（別プロセスでの取りこぼし等）を定期的に補正するための有効期限
+COUNTER_TIMEOUT = 60 * 10
+RECENT_RECIPES_TIMEOUT = 30
+RECENT_RECIPES_LIMIT = 5
+# 再計算中ロックの有効期限と、ロック待ちの上限
+LOCK_TIMEOUT = 10
+LOCK_WAIT_SECONDS = 1.0
+# プロセス内のロックの数（キーはバージョンやホストごとに増えるため、固定数のロックに割り当てる）
+LOCAL_LOCK_STRIPES = 64
+
+COUNTERS = {
+    'total_recipes': lambda: Recipe.objects.filter(is_public=True).count(),
+    'total_categories': lambda: Category.objects.count(),
+    'total_users': lambda: User.objects.count(),
+}
+
+# compute() の中から別のキーを取得しても同じロックで止まらないよう RLock にする
+_local_locks = [threading.RLock() for _ in range(LOCAL_LOCK_STRIPES)]
+
+
+def _local_lock(key):
+    return _local_locks[hash(key) % LOCAL_LOCK_STRIPES]
+
+
+def get_or_compute(key, compute, timeout):
+    """キャッシュから値を取得し、なければ1リクエストだけが compute() を実行する
+
+    プロセス内はスレッドロック、プロセス間は cache.add によるロックで直列化し、
+    ロックを取れなかったリクエストは他者の計算結果がキャッシュに入るのを待つ。
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    with _local_lock(key):
+        value = cache.get(key)
+        if value is not None:
+            return value
+
+        lock_key = f'{key}:lock'
+        acquired = cache.add(lock_key, 1, LOCK_TIMEOUT)
+        if not acquired:
+            deadline = time.monotonic() + LOCK_WAIT_SECONDS
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                value = cache.get(key)
+                if value is not None:
+                    return value
+
+        try:
+            value = compute()
+            cache.set(key, value, timeout)
+        finally:
+            if acquired:
+                cache.delete(lock_key)
+        return value
+
+
+def get_counter(name):
+    return get_or_compute(CACHE_PREFIX + name, COUNTERS[name], COUNTER_TIMEOUT)
+
+
+def adjust_counter(name, delta):
+    """コミット後に件数を加算・減算する（未キャッシュなら次回の参照時に数え直す）"""
+    def apply():
+        try:
+            cache.incr(CACHE_PREFIX + name, delta)
+        except ValueError:
+            pass
+    transaction.on_commit(apply)
+
+
+def invalidate_counter(name):
+    transaction.on_commit(lambda: cache.delete(CACHE_PREFIX + name))
+
+
+def _recent_recipes_version():
+    return cache.get_or_set(CACHE_PREFIX + 'recent_version', 1, None)
+
+
+def invalidate_recent_recipes():
+    """最近のレシピのキャッシュを破棄する（バージョンを進めて全ホスト分を無効化）"""
+    def apply():
+        try:
+            cache.incr(CACHE_PREFIX + 'recent_version')
+        except ValueError:
+            cache.set(CACHE_PREFIX + 'recent_version', 1, None)
+    transaction.on_commit(apply)
+
+
+def get_recent_recipes(request):
+    """最近の公開レシピ（シリアライズ済み）を取得する"""
+    from .serializers import RecipeListSerializer
+
+    def compute():
+        recipes = RecipeListSerializer.setup_eager_loading(
+            Recipe.objects.filter(is_public=True)
+        )[:RECENT_RECIPES_LIMIT]
+        # ユーザーごとに異なる値は共有キャッシュに入れない
+        context = {'request': request, 'favorite_ids': frozenset()}
+        data = RecipeListSerializer(recipes, many=True, context=context).data
+        for item in data:
+            item.pop('is_favorited', None)
+        return data
+
+    # 画像URLは絶対URLで返すため、ホストごとにキャッシュを分ける
+    key = f'{CACHE_PREFIX}recent:{_recent_recipes_version()}:{request.build_absolute_uri("/")}'
+    return get_or_compute(key, compute, RECENT_RECIPES_TIMEOUT)
+
+
+def get_recipe_stats(request):
+    stats = {name: get_counter(name) for name in COUNTERS}
+    stats['recent_recipes'] = get_recent_recipes(request)
+    return stats
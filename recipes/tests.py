@@ -1,3 +1,1197 @@
-from django.test import TestCase
+import io
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from . import facets, search, similarity, stats
+from .benchmark import compare, percentile, summarize
+from .favorites import get_favorite_ids
+from .images import derivative_paths
+from .models import Category, Recipe, Ingredient, Step, RecipeFavorite, RecipeRating, RecipeSimilarity
+from .pagination import RecipeFeedPagination
+from .sample_data import SampleDataGenerator
+from .serializers import RecipeCreateSerializer
+from .similarity import rebuild_similarities
+
+
+class QueryBudgetMixin:
+    """エンドポイントごとのSQLクエリ数の上限（クエリ予算）を検証するMixin"""
+
+    def assertQueryBudget(self, budget, method, url, **kwargs):
+        """リクエストを実行し、発行クエリ数が予算を超えたら失敗させる"""
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, **kwargs)
+        executed = len(ctx.captured_queries)
+        if executed > budget:
+            queries = '\n'.join(q['sql'] for q in ctx.captured_queries)
+            self.fail(
+                f'{method.upper()} {url}: クエリ予算 {budget} に対し {executed} 件発行されました\n{queries}'
+            )
+        return response
+
+
+class RecipeQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    """レシピAPIのクエリ数がページ件数に依存しないことを確認する"""
+    # ページ件数（PAGE_SIZE=20）を埋めるレシピ数
+    recipe_count = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('budget', password='password')
+        categories = [Category.objects.create(name=f'カテゴリ{i}') for i in range(3)]
+        authors = [User.objects.create_user(f'author{i}') for i in range(3)]
+        for i in range(cls.recipe_count):
+            recipe = Recipe.objects.create(
+                title=f'レシピ{i}',
+                author=authors[i % 3],
+                category=categories[i % 3],
+            )
+            RecipeFavorite.objects.create(user=cls.user, recipe=recipe)
+        Recipe.objects.create(title='自分のレシピ', author=cls.user)
+        cls.recipe = Recipe.objects.first()
+        for i in range(5):
+            Ingredient.objects.create(recipe=cls.recipe, name=f'材料{i}', order=i)
+            Step.objects.create(recipe=cls.recipe, step_number=i + 1, description=f'手順{i}')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def test_recipe_list(self):
+        # 初回は件数・ページのID・表現キャッシュにないレシピ・お気に入りID集合・ファセットの5件
+        response = self.assertQueryBudget(5, 'get', '/api/recipes/')
+        results = response.json()['results']
+        self.assertEqual(len(results), 20)
+        favorited = [recipe for recipe in results if recipe['is_favorited']]
+        self.assertEqual(len(favorited), 19)
+        # 2回目以降は件数とページのIDのみ（ファセットもキャッシュから返す）
+        response = self.assertQueryBudget(2, 'get', '/api/recipes/')
+        self.assertEqual(response.json()['results'], results)
+        self.assertQueryBudget(3, 'get', '/api/recipes/?page=2')
+
+    def test_recipe_list_cursor_without_count(self):
+        # カーソル方式では既定で COUNT(*) を発行しない
+        response = self.assertQueryBudget(3, 'get', '/api/recipes/?cursor=&facets=false')
+        data = response.json()
+        self.assertNotIn('count', data)
+        self.assertEqual(len(data['results']), 20)
+        self.assertIsNotNone(data['next'])
+
+    def test_my_recipe_list(self):
+        self.assertQueryBudget(4, 'get', '/api/recipes/my/')
+
+    def test_favorite_list(self):
+        response = self.assertQueryBudget(3, 'get', '/api/favorites/')
+        self.assertEqual(len(response.data['results']), 20)
+
+    def test_recipe_detail(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        response = self.assertQueryBudget(3, 'get', url)
+        data = response.json()
+        self.assertEqual(len(data['ingredients']), 5)
+        self.assertEqual(len(data['steps']), 5)
+        # 表現キャッシュにあればDBを参照しない
+        response = self.assertQueryBudget(0, 'get', url)
+        self.assertEqual(response.json(), data)
+
+    def test_recipe_detail_not_modified(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        etag = self.client.get(url)['ETag']
+        response = self.assertQueryBudget(0, 'get', url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_recipe_detail_invalidated(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Step.objects.filter(recipe=self.recipe, step_number=1).get().delete()
+        response = self.assertQueryBudget(3, 'get', url)
+        self.assertEqual(len(response.json()['steps']), 4)
+
+    def test_recipe_list_not_modified(self):
+        etag = self.client.get('/api/recipes/')['ETag']
+        response = self.assertQueryBudget(2, 'get', '/api/recipes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_recipe_stats(self):
+        self.assertQueryBudget(4, 'get', '/api/stats/')
+        # 2回目以降はキャッシュから返す
+        self.assertQueryBudget(0, 'get', '/api/stats/')
+
+    def test_recipe_count_adjusted_on_visibility_change(self):
+        total = Recipe.objects.filter(is_public=True).count()
+        stats.get_counter('total_recipes')
+        recipe = Recipe.objects.filter(is_public=True).first()
+
+        # 公開・非公開に関係しない変更では数え直さない
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.title = 'タイトルを修正'
+            recipe.save()
+        self.assertEqual(cache.get(stats.CACHE_PREFIX + 'total_recipes'), total)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.is_public = False
+            recipe.save()
+        self.assertEqual(cache.get(stats.CACHE_PREFIX + 'total_recipes'), total - 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.is_public = True
+            recipe.save(update_fields=['is_public'])
+        self.assertEqual(cache.get(stats.CACHE_PREFIX + 'total_recipes'), total)
+
+    def test_recipe_stats_locks_are_bounded(self):
+        # 最近のレシピのキャッシュを破棄するたびにキーが変わっても、ロックは増えない
+        for _ in range(3):
+            self.client.get('/api/stats/')
+            with self.captureOnCommitCallbacks(execute=True):
+                stats.invalidate_recent_recipes()
+        self.assertEqual(len(stats._local_locks), stats.LOCAL_LOCK_STRIPES)
+
+    def test_batch_favorites(self):
+        recipes = list(Recipe.objects.filter(author=self.user)) + list(Recipe.objects.exclude(author=self.user)[:5])
+        operations = [{'recipe_id': recipe.id, 'action': 'add'} for recipe in recipes[:1]]
+        operations += [{'recipe_id': recipe.id, 'action': 'remove'} for recipe in recipes[1:]]
+        # 操作件数によらず、存在確認・ロック・現状取得・INSERT・DELETE・件数更新の定数回に収まる
+        response = self.assertQueryBudget(
+            9, 'post', '/api/favorites/batch/', data={'operations': operations}, format='json'
+        )
+        results = [item['result'] for item in response.data['results']]
+        self.assertEqual(results, ['added'] + ['removed'] * 5)
+        self.assertEqual(RecipeFavorite.objects.filter(user=self.user).count(), 16)
+        self.assertEqual(Recipe.objects.get(author=self.user).favorite_count, 1)
+
+    def test_overlapping_batches_keep_favorite_count(self):
+        recipes = list(Recipe.objects.exclude(author=self.user)[:3])
+        # テストデータのお気に入りは件数を更新せずに作成しているため、件数を合わせておく
+        Recipe.objects.filter(id__in=[recipe.id for recipe in recipes]).update(favorite_count=1)
+        # 送信済みの操作を含む一括操作が重なって届いても、実際に変わった行だけを数える
+        batches = [
+            [('add', recipes[0]), ('remove', recipes[1])],
+            [('add', recipes[0]), ('remove', recipes[1]), ('remove', recipes[2])],
+            [('remove', recipes[2]), ('add', recipes[1])],
+        ]
+        for batch in batches:
+            operations = [{'recipe_id': recipe.id, 'action': action} for action, recipe in batch]
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.post('/api/favorites/batch/', {'operations': operations}, format='json')
+            sql = [q['sql'] for q in ctx.captured_queries]
+            # お気に入りの現状はユーザーの行をロックしてから読む
+            lock = next(i for i, q in enumerate(sql) if 'FROM "auth_user"' in q)
+            read = next(i for i, q in enumerate(sql) if q.startswith('SELECT "recipes_recipefavorite"'))
+            self.assertLess(lock, read)
+        for recipe in recipes:
+            recipe.refresh_from_db()
+            self.assertEqual(recipe.favorite_count, RecipeFavorite.objects.filter(recipe=recipe).count())
+
+    def test_recipe_list_sparse_fields(self):
+        # 関連を展開しなければ JOIN もお気に入りID集合の取得も行わない
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/recipes/?fields=id,title,author&expand=&facets=false')
+        self.assertEqual(len(ctx.captured_queries), 2)
+        self.assertNotIn('JOIN', ctx.captured_queries[-1]['sql'])
+        self.assertNotIn('"description"', ctx.captured_queries[-1]['sql'])
+        item = response.data['results'][0]
+        self.assertEqual(set(item), {'id', 'title', 'author'})
+        self.assertIsInstance(item['author'], int)
+
+    def test_recipe_detail_sparse_fields(self):
+        url = f'/api/recipes/{self.recipe.id}/?expand=steps'
+        response = self.assertQueryBudget(2, 'get', url)
+        self.assertNotIn('ingredients', response.data)
+        self.assertEqual(len(response.data['steps']), 5)
+        self.assertEqual(response.data['category'], self.recipe.category_id)
+        etag = response['ETag']
+        response = self.assertQueryBudget(1, 'get', url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class RecipeFacetTests(QueryBudgetMixin, APITestCase):
+    """レシピ一覧のファセット（絞り込み条件の値ごとの件数）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('facets', password='password')
+        cls.japanese = Category.objects.create(name='和食')
+        cls.western = Category.objects.create(name='洋食')
+        for i, (category, difficulty, cooking_time) in enumerate([
+            (cls.japanese, 1, 10),
+            (cls.japanese, 2, 25),
+            (cls.japanese, 2, 45),
+            (cls.western, 3, 90),
+        ]):
+            Recipe.objects.create(
+                title=f'レシピ{i}', author=cls.user, category=category,
+                difficulty=difficulty, cooking_time=cooking_time,
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def counts(self, facets, name):
+        return {item['value']: item['count'] for item in facets[name]}
+
+    def test_facets(self):
+        facets = self.client.get('/api/recipes/').json()['facets']
+        self.assertEqual(facets['category'][0], {'value': self.japanese.id, 'label': '和食', 'count': 3})
+        self.assertEqual(self.counts(facets, 'difficulty'), {1: 1, 2: 2, 3: 1})
+        self.assertEqual(self.counts(facets, 'author'), {self.user.id: 4})
+        self.assertEqual(
+            self.counts(facets, 'cooking_time'), {'lte15': 1, 'lte30': 1, 'lte60': 1, 'gt60': 1}
+        )
+
+        # 絞り込み条件のもとで集計し、0件の難易度・調理時間帯も返す
+        response = self.client.get(f'/api/recipes/?category={self.japanese.id}&difficulty=2')
+        facets = response.json()['facets']
+        self.assertEqual(response.json()['count'], 2)
+        self.assertEqual(self.counts(facets, 'category'), {self.japanese.id: 2})
+        self.assertEqual(self.counts(facets, 'difficulty'), {1: 0, 2: 2, 3: 0})
+        self.assertEqual(
+            self.counts(facets, 'cooking_time'), {'lte15': 0, 'lte30': 1, 'lte60': 1, 'gt60': 0}
+        )
+
+        response = self.client.get('/api/recipes/?cooking_time_bucket=gt60')
+        self.assertEqual([item['title'] for item in response.json()['results']], ['レシピ3'])
+
+        self.assertNotIn('facets', self.client.get('/api/recipes/?facets=false').json())
+
+    def test_facets_cached_and_invalidated(self):
+        self.client.get('/api/recipes/?difficulty=2')
+        # 絞り込み条件が同じならページ・並び順が違っても集計しない
+        self.assertQueryBudget(2, 'get', '/api/recipes/?difficulty=2&ordering=cooking_time')
+
+        etag = self.client.get('/api/recipes/?difficulty=2')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.create(title='追加', author=self.user, difficulty=2, category=self.western)
+        response = self.client.get('/api/recipes/?difficulty=2', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.counts(response.json()['facets'], 'category'),
+            {self.japanese.id: 2, self.western.id: 1},
+        )
+
+    def test_invalidation_scoped_to_changed_fields(self):
+        def versions():
+            return {
+                'recipes': facets.get_facets_versions({}),
+                'search': facets.get_facets_versions({'search': ('レシピ',)}),
+            }
+
+        def save(**values):
+            before = versions()
+            recipe = Recipe.objects.get(title='レシピ0')
+            for name, value in values.items():
+                setattr(recipe, name, value)
+            with self.captureOnCommitCallbacks(execute=True):
+                recipe.save()
+            after = versions()
+            return [name for name in before if before[name] != after[name]]
+
+        # 件数に影響しない変更・同じ調理時間帯の中での変更では無効化しない
+        self.assertEqual(save(servings=4, youtube_url='https://youtu.be/x'), [])
+        self.assertEqual(save(cooking_time=12), [])
+        # 説明の変更はキーワード検索時のファセットだけを無効化する
+        self.assertEqual(save(description='説明を変更'), ['search'])
+        self.assertEqual(save(cooking_time=20), ['recipes', 'search'])
+        self.assertEqual(save(category=self.western), ['recipes', 'search'])
+        self.assertEqual(save(is_public=False), ['recipes', 'search'])
+
+        # update_fields に含まれないフィールドの変更は保存されないため無効化しない
+        before = versions()
+        recipe = Recipe.objects.get(title='レシピ0')
+        recipe.difficulty = 3
+        recipe.servings = 1
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.save(update_fields=['servings'])
+        self.assertEqual(versions(), before)
+
+
+class RecipeImageDerivativeTests(APITestCase):
+    """画像アップロード時の派生ファイル生成と後始末"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            RECIPE_IMAGE_BACKGROUND=False,
+            RECIPE_IMAGE_ORIGINAL_MAX_SIZE=1000,
+            RECIPE_SIMILARITY_BACKGROUND=False,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user('photographer', password='password')
+        self.client.force_authenticate(self.user)
+
+    def upload(self, name, size):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (200, 120, 40)).save(buffer, 'JPEG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+    def test_derivatives_generated_and_replaced(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/recipes/',
+                {'title': '写真付き', 'image': self.upload('photo.jpg', (1600, 1200))},
+                format='multipart',
+            )
+        self.assertEqual(response.status_code, 201)
+        recipe = Recipe.objects.get(title='写真付き')
+        derivatives = recipe.image_derivatives
+        self.assertEqual(derivatives['source'], recipe.image.name)
+        # 元画像は長辺1000pxに縮小され、それを超える幅は作らない
+        self.assertEqual((derivatives['width'], derivatives['height']), (1000, 750))
+        self.assertEqual(sorted(derivatives['webp'], key=int), ['320', '640', '1000'])
+        with default_storage.open(derivatives['webp']['320']) as f:
+            self.assertEqual(Image.open(f).size, (320, 240))
+
+        srcset = self.client.get(f'/api/recipes/{recipe.id}/').json()['image_srcset']
+        self.assertIn('320w', srcset['webp'])
+        self.assertIn('1000w', srcset['jpeg'])
+
+        old_files = [derivatives['source']] + list(derivatives['jpeg'].values())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                f'/api/recipes/{recipe.id}/',
+                {'image': self.upload('new.jpg', (400, 300))},
+                format='multipart',
+            )
+        recipe.refresh_from_db()
+        self.assertEqual(sorted(recipe.image_derivatives['jpeg'], key=int), ['320', '400'])
+        for name in old_files:
+            self.assertFalse(default_storage.exists(name))
+
+        files = [recipe.image.name] + list(recipe.image_derivatives['webp'].values())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/recipes/{recipe.id}/')
+        for name in files:
+            self.assertFalse(default_storage.exists(name))
+
+    def test_step_derivatives_generated_and_cleaned_up(self):
+        recipe = Recipe.objects.create(title='手順写真付き', author=self.user)
+        stale = timezone.now() - timedelta(days=1)
+        Recipe.objects.filter(id=recipe.id).update(updated_at=stale)
+        with self.captureOnCommitCallbacks(execute=True):
+            step = Step(recipe=recipe, step_number=1, description='切る')
+            step.image = self.upload('step.jpg', (800, 600))
+            step.save()
+
+        step.refresh_from_db()
+        derivatives = step.image_derivatives
+        self.assertEqual(derivatives['source'], step.image.name)
+        self.assertEqual(sorted(derivatives['webp'], key=int), ['320', '640', '800'])
+        # 派生ファイルの生成でレシピの更新日時（ETag）が進む
+        recipe.refresh_from_db()
+        self.assertGreater(recipe.updated_at, stale)
+
+        detail = self.client.get(f'/api/recipes/{recipe.id}/').json()
+        self.assertIn('640w', detail['steps'][0]['image_srcset']['jpeg'])
+
+        files = [step.image.name] + derivative_paths(derivatives)
+        with self.captureOnCommitCallbacks(execute=True):
+            step.image = None
+            step.save()
+        step.refresh_from_db()
+        self.assertEqual(step.image_derivatives, {})
+        for name in files:
+            self.assertFalse(default_storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            step.image = self.upload('again.jpg', (400, 300))
+            step.save()
+        step.refresh_from_db()
+        files = [step.image.name] + derivative_paths(step.image_derivatives)
+        # レシピの削除で連鎖削除される手順の画像も削除する
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        for name in files:
+            self.assertFalse(default_storage.exists(name))
+
+
+@override_settings(RECIPE_SIMILARITY_BACKGROUND=False)
+class SimilarRecipeTests(QueryBudgetMixin, APITestCase):
+    """材料の重なりによる類似レシピ"""
+
+    def create_recipe(self, title, ingredients, **kwargs):
+        recipe = Recipe.objects.create(title=title, author=self.user, **kwargs)
+        for order, name in enumerate(ingredients):
+            Ingredient.objects.create(recipe=recipe, name=name, order=order)
+        return recipe
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('cook', password='password')
+        self.curry = self.create_recipe('カレー', ['玉ねぎ', 'にんじん', 'じゃがいも', '豚肉', 'カレールー'])
+        self.stew = self.create_recipe('シチュー', ['玉ねぎ（みじん切り）', 'ニンジン', 'じゃがいも', '鶏肉', 'シチュールー'])
+        self.nikujaga = self.create_recipe('肉じゃが', ['玉ねぎ（中）', 'じゃがいも', '牛肉', 'しょうゆ'])
+        self.salad = self.create_recipe('サラダ', ['レタス', 'トマト'])
+        rebuild_similarities()
+
+    def similar_ids(self, recipe):
+        response = self.assertQueryBudget(3, 'get', f'/api/recipes/{recipe.id}/similar/')
+        return [item['recipe']['id'] for item in response.data['results']]
+
+    def test_similar_recipes(self):
+        # 表記揺れ（カタカナ・括弧書き）を吸収し、共通の材料が多い順に並ぶ
+        self.assertEqual(self.similar_ids(self.curry), [self.stew.id, self.nikujaga.id])
+        self.assertEqual(self.similar_ids(self.salad), [])
+
+    def test_incremental_update(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(recipe=self.salad, name='じゃがいも')
+            Ingredient.objects.create(recipe=self.salad, name='にんじん')
+        self.assertIn(self.salad.id, self.similar_ids(self.curry))
+
+        # 非公開にしたレシピは他のレシピの類似レシピから外れる
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stew.is_public = False
+            self.stew.save()
+        self.assertNotIn(self.stew.id, self.similar_ids(self.curry))
+        self.assertFalse(RecipeSimilarity.objects.filter(recipe=self.stew).exists())
+
+    def test_other_process_changes_are_replayed(self):
+        matrix = similarity.get_matrix()
+        # 他のプロセスがサラダの材料を変更し、世代を進めた状態にする
+        Ingredient.objects.create(recipe=self.salad, name='じゃがいも')
+        generation = cache.incr(similarity.GENERATION_KEY)
+        cache.set(similarity._changes_key(generation), {self.salad.id})
+
+        # 変更されたレシピの材料だけを読み直す（全件は読み直さない）
+        with self.assertNumQueries(1):
+            self.assertIs(similarity.get_matrix(), matrix)
+        self.assertIn(self.salad.id, dict(matrix.neighbours(self.curry.id)))
+
+
+class CookableRecipeTests(QueryBudgetMixin, APITestCase):
+    """手持ちの材料で作れるレシピ"""
+
+    def create_recipe(self, title, ingredients, **kwargs):
+        recipe = Recipe.objects.create(title=title, author=self.user, **kwargs)
+        for order, name in enumerate(ingredients):
+            Ingredient.objects.create(recipe=recipe, name=name, order=order)
+        return recipe
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('pantry', password='password')
+        self.omelette = self.create_recipe('オムレツ', ['卵', '牛乳', '塩'])
+        self.oyakodon = self.create_recipe('親子丼', ['鶏もも肉', '卵', '玉ねぎ', 'ごはん'])
+        self.salad = self.create_recipe('サラダ', ['レタス', 'トマト'])
+
+    def search(self, query, budget=4):
+        response = self.assertQueryBudget(budget, 'get', f'/api/recipes/cookable/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [
+            (item['recipe']['title'], item['missing_count'], item['missing_ingredients'])
+            for item in response.data['results']
+        ]
+
+    def test_cookable_recipes(self):
+        self.assertEqual(self.search('ingredients=牛乳&ingredients=塩', budget=6), [
+            ('オムレツ', 1, ['卵']),
+        ])
+        # 表記揺れ（全角・半角、括弧書き）を吸収し、足りない材料が少ない順に並ぶ
+        self.assertEqual(self.search('ingredients=卵 (Lサイズ),牛乳,玉ねぎ（中）'), [
+            ('オムレツ', 1, ['塩']),
+            ('親子丼', 2, ['鶏もも肉', 'ごはん']),
+        ])
+        self.assertEqual(self.search('ingredients=卵,牛乳,玉ねぎ&max_missing=1'), [
+            ('オムレツ', 1, ['塩']),
+        ])
+        response = self.client.get('/api/recipes/cookable/')
+        self.assertEqual(response.status_code, 400)
+
+    def test_index_patched_on_write(self):
+        self.search('ingredients=卵', budget=6)
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(recipe=self.salad, name='卵')
+            self.oyakodon.is_public = False
+            self.oyakodon.save()
+        # 変更されたレシピの材料だけを読み直す
+        self.assertEqual(self.search('ingredients=卵&max_missing=2', budget=5), [
+            ('サラダ', 2, ['レタス', 'トマト']),
+            ('オムレツ', 2, ['牛乳', '塩']),
+        ])
+
+
+class RecipeFavoriteCountTests(APITestCase):
+    """お気に入りの追加・削除がお気に入り数に反映され、並べ替えに使えることを確認する"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('fan', password='password')
+        self.client.force_authenticate(self.user)
+        author = User.objects.create_user('chef')
+        self.recipe = Recipe.objects.create(title='肉じゃが', author=author)
+        self.other = Recipe.objects.create(title='味噌汁', author=author)
+        self.url = f'/api/recipes/{self.recipe.id}/favorite/'
+
+    def favorite_count(self, recipe):
+        recipe.refresh_from_db()
+        return recipe.favorite_count
+
+    def test_count_follows_toggle(self):
+        detail_url = f'/api/recipes/{self.recipe.id}/'
+        self.assertEqual(self.client.get(detail_url).json()['favorite_count'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(self.url).status_code, 201)
+        self.assertEqual(self.favorite_count(self.recipe), 1)
+        # 登録済みの追加では数えない
+        self.assertEqual(self.client.post(self.url).status_code, 200)
+        self.assertEqual(self.favorite_count(self.recipe), 1)
+        # キャッシュした詳細も新しいお気に入り数を返す
+        self.assertEqual(self.client.get(detail_url).json()['favorite_count'], 1)
+
+        guest = User.objects.create_user('guest')
+        self.client.force_authenticate(guest)
+        self.client.post(self.url)
+        self.assertEqual(self.favorite_count(self.recipe), 2)
+
+        self.assertEqual(self.client.delete(self.url).status_code, 200)
+        self.assertEqual(self.favorite_count(self.recipe), 1)
+        # 登録していない削除では減らさない
+        self.assertEqual(self.client.delete(self.url).status_code, 404)
+        self.assertEqual(self.favorite_count(self.recipe), 1)
+        self.assertEqual(self.favorite_count(self.other), 0)
+
+    def test_favorite_ids_cache_rebuilt_after_change(self):
+        def favorited():
+            results = self.client.get('/api/recipes/').json()['results']
+            return {item['title'] for item in results if item['is_favorited']}
+
+        self.assertEqual(favorited(), set())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url)
+        self.assertEqual(favorited(), {'肉じゃが'})
+
+        # 別の変更が先に書き込んだ集合が残っていても、コミット後に破棄して読み直す
+        get_favorite_ids(self.user)
+        RecipeFavorite.objects.create(user=self.user, recipe=self.other)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(self.url)
+        self.assertEqual(get_favorite_ids(self.user), frozenset({self.other.id}))
+
+    def test_ordering_by_favorite_count(self):
+        third = Recipe.objects.create(title='焼き魚', author=self.other.author)
+        guest = User.objects.create_user('guest')
+        self.client.post(f'/api/recipes/{self.other.id}/favorite/')
+        self.client.post(f'/api/recipes/{third.id}/favorite/')
+        self.client.force_authenticate(guest)
+        self.client.post(f'/api/recipes/{self.other.id}/favorite/')
+
+        results = self.client.get('/api/recipes/?ordering=-favorite_count').json()['results']
+        self.assertEqual(
+            [(item['title'], item['favorite_count']) for item in results],
+            [('味噌汁', 2), ('焼き魚', 1), ('肉じゃが', 0)],
+        )
+        results = self.client.get('/api/recipes/?ordering=favorite_count').json()['results']
+        self.assertEqual([item['title'] for item in results], ['肉じゃが', '焼き魚', '味噌汁'])
+
+    def test_reconcile_favorite_counts(self):
+        RecipeFavorite.objects.create(user=self.user, recipe=self.recipe)
+        Recipe.objects.filter(pk=self.other.pk).update(favorite_count=3)
+
+        out = io.StringIO()
+        call_command('reconcile_favorite_counts', '--dry-run', stdout=out)
+        self.assertIn('2件中 2件', out.getvalue())
+        self.assertEqual(self.favorite_count(self.recipe), 0)
+
+        call_command('reconcile_favorite_counts', '--batch-size', '1', stdout=io.StringIO())
+        self.assertEqual(self.favorite_count(self.recipe), 1)
+        self.assertEqual(self.favorite_count(self.other), 0)
+
+
+class RecipeRatingTests(APITestCase):
+    """評価の追加・変更・削除が集計値に反映されることを確認する"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('rater', password='password')
+        self.client.force_authenticate(self.user)
+        author = User.objects.create_user('chef')
+        self.recipe = Recipe.objects.create(title='肉じゃが', author=author)
+        self.other = Recipe.objects.create(title='味噌汁', author=author)
+        self.url = f'/api/recipes/{self.recipe.id}/rating/'
+
+    def assertAggregates(self, recipe, count, total, histogram):
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.rating_count, count)
+        self.assertEqual(recipe.rating_sum, total)
+        self.assertEqual(recipe.rating_avg, Recipe.calculate_rating_avg(total, count))
+        self.assertEqual(recipe.rating_histogram, {star: histogram.get(star, 0) for star in range(1, 6)})
+
+    def test_aggregates_follow_rating_changes(self):
+        updated_at = self.recipe.updated_at
+        self.assertEqual(self.client.post(self.url, {'rating': 4}).status_code, 201)
+        self.assertAggregates(self.recipe, 1, 4, {4: 1})
+        # 集計値の更新でもレシピの更新日時（ETag・Last-Modified）が進む
+        self.assertGreater(self.recipe.updated_at, updated_at)
+
+        RecipeRating.objects.create(user=User.objects.create_user('guest'), recipe=self.recipe, rating=2)
+        Recipe.objects.filter(pk=self.recipe.pk).update(rating_count=2, rating_sum=6, rating_2=1, rating_avg=3)
+        self.assertEqual(self.client.put(self.url, {'rating': 5}).status_code, 200)
+        self.assertAggregates(self.recipe, 2, 7, {2: 1, 5: 1})
+
+        self.assertEqual(self.client.delete(self.url).status_code, 200)
+        self.assertAggregates(self.recipe, 1, 2, {2: 1})
+        self.assertEqual(self.client.delete(self.url).status_code, 404)
+
+    def test_min_rating_filter(self):
+        self.client.post(self.url, {'rating': 4})
+        self.client.post(f'/api/recipes/{self.other.id}/rating/', {'rating': 2})
+        response = self.client.get('/api/recipes/?min_rating=3')
+        self.assertEqual([item['title'] for item in response.json()['results']], ['肉じゃが'])
+        response = self.client.get('/api/recipes/?min_rating=2&ordering=-rating_avg')
+        self.assertEqual([item['title'] for item in response.json()['results']], ['肉じゃが', '味噌汁'])
+
+    def test_reconcile_rating_aggregates(self):
+        RecipeRating.objects.create(user=self.user, recipe=self.recipe, rating=3)
+        RecipeRating.objects.create(user=self.user, recipe=self.other, rating=5)
+        Recipe.objects.filter(pk=self.other.pk).update(rating_count=1, rating_sum=5, rating_5=1, rating_avg=5)
+
+        out = io.StringIO()
+        call_command('reconcile_rating_aggregates', '--dry-run', stdout=out)
+        self.assertIn('2件中 1件', out.getvalue())
+        self.assertAggregates(self.recipe, 0, 0, {})
+
+        call_command('reconcile_rating_aggregates', '--batch-size', '1', stdout=io.StringIO())
+        self.assertAggregates(self.recipe, 1, 3, {3: 1})
+        self.assertAggregates(self.other, 1, 5, {5: 1})
+
+
+class RecipeSearchTests(APITestCase):
+    """N-gramインデックスによる検索と、保存時の差分更新を確認する"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('searcher', password='password')
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.curry = Recipe.objects.create(title='チキンカレー', author=self.user)
+            Ingredient.objects.create(recipe=self.curry, name='鶏もも肉', order=0)
+            self.stew = Recipe.objects.create(title='ビーフシチュー', author=self.user)
+            Step.objects.create(recipe=self.stew, step_number=1, description='残りのカレー粉を加える')
+
+    def search(self, query):
+        response = self.client.get('/api/recipes/', {'search': query, 'facets': 'false'})
+        self.assertEqual(response.status_code, 200)
+        return [item['title'] for item in response.json()['results']]
+
+    def test_normalize_and_query_grams(self):
+        self.assertEqual(search.normalize('ＣＵＲＲＹ カレー'), 'curry かれー')
+        self.assertEqual(search.query_grams('カレー 卵'), {'かれ', 'れー', '卵'})
+        self.assertEqual(search.query_grams('！？'), set())
+
+    def test_ranking(self):
+        # タイトルの一致が手順の一致より上位になり、表記揺れも一致する
+        self.assertEqual(self.search('かれー'), ['チキンカレー', 'ビーフシチュー'])
+        self.assertEqual(self.search('ｶﾚｰ 鶏'), ['チキンカレー'])
+        self.assertEqual(self.search('ハンバーグ'), [])
+        # ?ordering= の指定があれば関連度より優先する
+        response = self.client.get('/api/recipes/', {'search': 'カレー', 'ordering': '-created_at'})
+        self.assertEqual([item['title'] for item in response.json()['results']], ['ビーフシチュー', 'チキンカレー'])
+
+    def test_incremental_reindex(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(recipe=self.stew, name='にんじん', order=0)
+        self.assertEqual(self.search('人参 にんじん'), [])
+        self.assertEqual(self.search('にんじん'), ['ビーフシチュー'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            step = self.stew.steps.get()
+            step.description = '煮込む'
+            step.save()
+        self.assertEqual(self.search('カレー'), ['チキンカレー'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.curry.title = 'キーマ'
+            self.curry.save()
+            self.curry.ingredients.all().delete()
+        self.assertEqual(self.search('カレー'), [])
+        self.assertEqual(self.search('鶏'), [])
+        self.assertEqual(self.search('キーマ'), ['キーマ'])
+
+    def test_reindex_after_nested_update_via_api(self):
+        # タイトル・説明を変えずに材料だけを変更しても検索結果に反映する
+        ingredient = self.curry.ingredients.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/recipes/{self.curry.id}/',
+                {'ingredients': [{'id': ingredient.id, 'name': 'にんじん', 'order': 0}]},
+                format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.search('にんじん'), ['チキンカレー'])
+        self.assertEqual(self.search('鶏もも肉'), [])
+
+        # 説明・材料に関係しない変更ではインデックスを作り直さない
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/recipes/{self.curry.id}/', {'servings': 4}, format='json')
+            self.assertFalse(getattr(search._pending, 'recipe_ids', None))
+
+
+class RecipeNestedUpdateTests(APITestCase):
+    """レシピ更新時の材料・手順の差分更新を確認する"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('editor', password='password')
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(title='豚汁', author=self.user)
+        self.pork = Ingredient.objects.create(recipe=self.recipe, name='豚肉', order=0)
+        self.radish = Ingredient.objects.create(recipe=self.recipe, name='大根', order=1)
+        for number in (1, 2, 3):
+            Step.objects.create(recipe=self.recipe, step_number=number, description=f'手順{number}')
+
+    def update(self, data):
+        serializer = RecipeCreateSerializer(self.recipe, data=data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def test_ingredients_are_matched_by_id_then_order(self):
+        self.update({'ingredients': [
+            {'id': self.radish.id, 'name': '大根', 'order': 0},
+            {'name': 'ごぼう', 'order': 1},
+            {'name': 'こんにゃく', 'order': 2},
+        ]})
+        ingredients = list(self.recipe.ingredients.values_list('id', 'name', 'order'))
+        # 大根は id で突き合わせる。ごぼうと同じ order=1 の行（大根）は使用済みのため新規作成し、
+        # どの入力とも対応しない豚肉は削除する
+        self.assertEqual(ingredients[0], (self.radish.id, '大根', 0))
+        self.assertEqual([name for _, name, _ in ingredients], ['大根', 'ごぼう', 'こんにゃく'])
+        self.assertFalse(Ingredient.objects.filter(id=self.pork.id).exists())
+
+        # id指定のない材料は同じ order の既存行を更新する
+        gobo_id = ingredients[1][0]
+        self.update({'ingredients': [{'name': '大根', 'order': 0}, {'name': '牛蒡', 'order': 1}]})
+        self.assertEqual(
+            list(self.recipe.ingredients.values_list('id', 'name')),
+            [(self.radish.id, '大根'), (gobo_id, '牛蒡')],
+        )
+
+    def test_unknown_and_duplicate_ids_are_rejected(self):
+        other = Ingredient.objects.create(
+            recipe=Recipe.objects.create(title='他人のレシピ', author=self.user), name='塩'
+        )
+        for ingredients in (
+            [{'id': other.id, 'name': '塩', 'order': 0}],
+            [{'id': self.pork.id, 'name': '豚肉', 'order': 0}, {'id': self.pork.id, 'name': '豚肉', 'order': 1}],
+        ):
+            with self.assertRaises(ValidationError):
+                self.update({'title': '変更', 'ingredients': ingredients})
+        # 基本情報の変更も巻き戻る
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.title, '豚汁')
+        self.assertEqual(self.recipe.ingredients.count(), 2)
+        other.refresh_from_db()
+        self.assertEqual(other.name, '塩')
+
+    def test_steps_are_renumbered(self):
+        step2 = self.recipe.steps.get(step_number=2)
+        self.update({'steps': [
+            {'step_number': 2, 'description': '手順2'},
+            {'step_number': 3, 'description': '煮込む'},
+            {'step_number': 4, 'description': '味噌を溶く'},
+        ]})
+        steps = list(self.recipe.steps.values_list('id', 'step_number', 'description'))
+        self.assertEqual([(number, description) for _, number, description in steps], [
+            (2, '手順2'), (3, '煮込む'), (4, '味噌を溶く'),
+        ])
+        # 変更のない手順はそのまま残る
+        self.assertEqual(steps[0][0], step2.id)
+
+    def test_patch_without_nested_keys_keeps_children(self):
+        response = self.client.patch(f'/api/recipes/{self.recipe.id}/', {'title': '具だくさん豚汁'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.recipe.ingredients.count(), 2)
+        self.assertEqual(self.recipe.steps.count(), 3)
+
+    def test_child_changes_touch_recipe_once(self):
+        updated_at = self.recipe.updated_at
+        with CaptureQueriesContext(connection) as ctx:
+            with self.captureOnCommitCallbacks(execute=True):
+                Ingredient.objects.create(recipe=self.recipe, name='ごぼう', order=2)
+                Ingredient.objects.filter(id=self.pork.id).delete()
+                step = self.recipe.steps.first()
+                step.description = '下ごしらえ'
+                step.save()
+        touches = [
+            q['sql'] for q in ctx.captured_queries
+            if q['sql'].startswith('UPDATE "recipes_recipe" SET "updated_at"')
+        ]
+        self.assertEqual(len(touches), 1)
+        self.recipe.refresh_from_db()
+        self.assertGreater(self.recipe.updated_at, updated_at)
+
+    def test_child_changes_update_indexes(self):
+        # 材料・手順は一括で書き込むためシグナルが出ないが、検索・材料のインデックスは更新する
+        with self.captureOnCommitCallbacks(execute=True):
+            self.update({
+                'ingredients': [
+                    {'id': self.pork.id, 'name': 'にんじん', 'order': 0},
+                    {'id': self.radish.id, 'name': '大根', 'order': 1},
+                ],
+                'steps': [
+                    {'step_number': 1, 'description': '味噌を溶く'},
+                    {'step_number': 2, 'description': '手順2'},
+                    {'step_number': 3, 'description': '手順3'},
+                ],
+            })
+        grams = set(search.build_grams(self.recipe))
+        indexed = set(self.recipe.search_grams.values_list('gram', flat=True))
+        self.assertEqual(indexed, grams)
+        self.assertIn('にん', indexed)
+        self.assertIn('味噌', indexed)
+        self.assertNotIn('豚肉', indexed)
+
+        response = self.client.get('/api/recipes/cookable/?ingredients=にんじん,大根')
+        self.assertEqual(
+            [(item['recipe']['title'], item['missing_count']) for item in response.data['results']],
+            [('豚汁', 0)],
+        )
+
+    def test_query_count(self):
+        data = {
+            'ingredients': [
+                {'id': self.pork.id, 'name': '豚バラ肉', 'order': 0},
+                {'id': self.radish.id, 'name': '大根', 'order': 1},
+                {'name': '人参', 'order': 2},
+            ],
+            'steps': [
+                {'step_number': 1, 'description': '手順1'},
+                {'step_number': 2, 'description': '炒める'},
+            ],
+        }
+        # レシピの更新・材料と手順の読み込み各1件・材料と手順の一括更新各1件・材料の作成1件・
+        # 手順の削除2件（シグナル用の読み込み・削除）・セーブポイント2件
+        # 件数は材料・手順の数によらない（親レシピの更新日時はコミット後に更新する）
+        with self.assertNumQueries(10):
+            self.update(data)
+        self.assertEqual(
+            list(self.recipe.ingredients.values_list('name', flat=True)), ['豚バラ肉', '大根', '人参']
+        )
+        self.assertEqual(list(self.recipe.steps.values_list('description', flat=True)), ['手順1', '炒める'])
+
+
+class RecipeNdjsonTests(APITestCase):
+    """NDJSONでのエクスポート・インポート（API・管理コマンド）を確認する"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('exporter', password='password')
+        self.admin = User.objects.create_user('importer', password='password', is_staff=True)
+        self.category = Category.objects.create(name='和食')
+        self.recipe = Recipe.objects.create(
+            title='肉じゃが', author=self.user, category=self.category, is_public=False
+        )
+        Ingredient.objects.create(recipe=self.recipe, name='じゃがいも', amount='3', unit='個', order=0)
+        Step.objects.create(recipe=self.recipe, step_number=1, description='煮る')
+        Recipe.objects.create(title='他人の公開レシピ', author=self.admin)
+        Recipe.objects.create(title='他人の非公開レシピ', author=self.admin, is_public=False)
+
+    def read_lines(self, response):
+        content = b''.join(response.streaming_content).decode('utf-8')
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_export(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/recipes/export/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = self.read_lines(response)
+        self.assertEqual([record['title'] for record in records], ['肉じゃが', '他人の公開レシピ'])
+        self.assertEqual(records[0]['category'], '和食')
+        self.assertEqual(records[0]['ingredients'], [
+            {'name': 'じゃがいも', 'amount': '3', 'unit': '個', 'notes': '', 'order': 0},
+        ])
+        self.assertEqual(records[0]['steps'], [{'step_number': 1, 'description': '煮る', 'cooking_time': None}])
+
+    def test_import(self):
+        records = [
+            {'title': '筑前煮', 'category': '煮物', 'ingredients': [{'name': '鶏肉', 'order': 0}],
+             'steps': [{'step_number': 1, 'description': '炒める'}]},
+            '{broken',
+            {'title': ''},
+            {'title': 'きんぴら', 'category': '煮物'},
+        ]
+        payload = '\n'.join(
+            record if isinstance(record, str) else json.dumps(record, ensure_ascii=False) for record in records
+        ).encode('utf-8')
+
+        self.client.force_authenticate(self.user)
+        response = self.client.generic('POST', '/api/recipes/import/', payload, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_authenticate(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.generic(
+                'POST', '/api/recipes/import/', payload, content_type='application/x-ndjson'
+            )
+            progress = self.read_lines(response)
+        self.assertEqual(progress[-1]['processed'], 4)
+        self.assertEqual(progress[-1]['imported'], 2)
+        self.assertEqual([error['line'] for error in progress[-1]['errors']], [2, 3])
+
+        recipe = Recipe.objects.get(title='筑前煮')
+        self.assertEqual(recipe.author, self.admin)
+        self.assertEqual(list(recipe.ingredients.values_list('name', flat=True)), ['鶏肉'])
+        self.assertEqual(recipe.steps.get().description, '炒める')
+        self.assertEqual(Category.objects.filter(name='煮物').count(), 1)
+        self.assertEqual(Recipe.objects.get(title='きんぴら').category, recipe.category)
+
+    def test_commands_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/recipes.ndjson'
+            err = io.StringIO()
+            call_command('export_recipes', '--output', path, '--chunk-size', '1', stderr=err)
+            self.assertIn('3件のレシピをエクスポートしました', err.getvalue())
+            call_command('export_recipes', '--output', path, '--public-only', stderr=io.StringIO())
+
+            out = io.StringIO()
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('import_recipes', path, '--author', 'exporter', stdout=out, stderr=io.StringIO())
+            self.assertIn('1件のレシピをインポートしました（失敗: 0件）', out.getvalue())
+
+            with self.assertRaises(CommandError):
+                call_command('import_recipes', path, '--author', 'nobody')
+        imported = Recipe.objects.filter(title='他人の公開レシピ').order_by('id').last()
+        self.assertEqual(imported.author, self.user)
+
+
+class RecipeBulkCreateTests(APITestCase):
+    """配列でのレシピ一括作成を確認する"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('bulk', password='password')
+        self.client.force_authenticate(self.user)
+
+    def payload(self, count):
+        return [
+            {
+                'title': f'一括レシピ{i}',
+                'ingredients': [{'name': f'材料{i}-{j}', 'order': j} for j in range(2)],
+                'steps': [{'step_number': j + 1, 'description': f'手順{i}-{j}'} for j in range(2)],
+            }
+            for i in range(count)
+        ]
+
+    def post(self, data):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/recipes/', data, format='json')
+        return response, len(ctx.captured_queries)
+
+    def test_batch_create(self):
+        response, small = self.post(self.payload(2))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data[1]['ingredients'][1]['name'], '材料1-1')
+        self.assertEqual(response.data[1]['steps'][0]['description'], '手順1-0')
+
+        # レスポンスの材料・手順も含め、クエリ数はレシピ数によらない
+        response, large = self.post(self.payload(6))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(large, small)
+        self.assertEqual(Recipe.objects.filter(author=self.user).count(), 8)
+        self.assertEqual(Ingredient.objects.filter(recipe__author=self.user).count(), 16)
+
+    def test_invalid_item_rejects_batch(self):
+        data = self.payload(3)
+        data[1]['steps'][1]['step_number'] = 1
+        response, _ = self.post(data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Recipe.objects.count(), 0)
+
+    def test_failed_insert_rolls_back_batch(self):
+        serializer = RecipeCreateSerializer(data=self.payload(3), many=True)
+        serializer.is_valid(raise_exception=True)
+        # 検証後に一意制約に反する手順を混ぜ、途中の挿入で失敗させる
+        serializer.validated_data[2]['steps'].append({'step_number': 1, 'description': '重複'})
+        with self.assertRaises(IntegrityError):
+            serializer.save(author=self.user)
+        self.assertEqual(Recipe.objects.count(), 0)
+        self.assertEqual(Ingredient.objects.count(), 0)
+
+
+class RecipeCursorPaginationTests(APITestCase):
+    """カーソル方式のページ送りで行が重複・欠落しないことを確認する"""
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user('scroller', password='password')
+        Recipe.objects.bulk_create([Recipe(title=f'レシピ{i}', author=user) for i in range(45)])
+        # 作成日時が同じ行をページの境界（20件目・21件目）をまたいで含める
+        base = timezone.now()
+        for i, recipe in enumerate(Recipe.objects.order_by('id')):
+            Recipe.objects.filter(pk=recipe.pk).update(created_at=base - timedelta(minutes=i // 15))
+
+    def test_following_next_links(self):
+        seen = []
+        url = '/api/recipes/?cursor=&facets=false'
+        while url:
+            data = self.client.get(url).json()
+            self.assertNotIn('count', data)
+            self.assertIsNone(data['previous'])
+            seen += [item['id'] for item in data['results']]
+            url = data['next']
+        expected = list(Recipe.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_cursor_is_decoded_to_position(self):
+        data = self.client.get('/api/recipes/?cursor=&facets=false&count=true').json()
+        self.assertEqual(data['count'], 45)
+        last = Recipe.objects.get(pk=data['results'][-1]['id'])
+        request = APIRequestFactory().get('/api/recipes/', {'cursor': parse_qs(urlparse(data['next']).query)['cursor'][0]})
+        self.assertEqual(
+            RecipeFeedPagination().decode_cursor(Request(request)), (last.created_at, last.pk)
+        )
+        self.assertEqual(self.client.get('/api/recipes/?cursor=invalid').status_code, 404)
+
+
+class SampleDataTests(TestCase):
+    """大量サンプルデータの生成が決定的で、集計値が実データと一致することを確認する"""
+
+    def generate(self, prefix, chunk_size):
+        return SampleDataGenerator(
+            recipes=30, users=8, seed=1, prefix=prefix, chunk_size=chunk_size, menus_per_user=0
+        ).generate()
+
+    def snapshot(self, prefix):
+        recipes = (
+            Recipe.objects.filter(author__username__startswith=f'{prefix}_')
+            .select_related('author', 'category').prefetch_related('ingredients', 'steps')
+            .order_by('created_at', 'id')
+        )
+        favorites = (
+            RecipeFavorite.objects.filter(user__username__startswith=f'{prefix}_')
+            .order_by('created_at', 'user__username', 'recipe__created_at')
+            .values_list('user__username', 'recipe__created_at', 'created_at')
+        )
+        ratings = (
+            RecipeRating.objects.filter(user__username__startswith=f'{prefix}_')
+            .order_by('created_at', 'user__username', 'recipe__created_at')
+            .values_list('user__username', 'recipe__created_at', 'rating')
+        )
+        # ユーザー名の接頭辞・主キーの値は実行ごとに異なるため比べない
+        return {
+            'recipes': [
+                (
+                    recipe.title, recipe.author.username.removeprefix(prefix), recipe.category_id,
+                    recipe.created_at, recipe.updated_at, recipe.is_public, recipe.favorite_count,
+                    recipe.rating_avg, recipe.rating_histogram,
+                    [(i.name, i.amount, i.unit, i.order) for i in recipe.ingredients.all()],
+                    [(s.step_number, s.description) for s in recipe.steps.all()],
+                )
+                for recipe in recipes
+            ],
+            'favorites': [(user.removeprefix(prefix), *rest) for user, *rest in favorites],
+            'ratings': [(user.removeprefix(prefix), *rest) for user, *rest in ratings],
+        }
+
+    def test_same_seed_gives_same_data_regardless_of_chunk_size(self):
+        counts = self.generate('first', chunk_size=1000)
+        self.assertEqual(counts['recipes'], 30)
+        self.generate('second', chunk_size=7)
+        first, second = self.snapshot('first'), self.snapshot('second')
+        self.assertEqual(first, second)
+        self.assertTrue(first['favorites'] and first['ratings'])
+
+    def test_precomputed_aggregates_match_reconcile(self):
+        self.generate('sample', chunk_size=7)
+        for command, message in (
+            ('reconcile_favorite_counts', '30件中 0件のお気に入り数がずれています'),
+            ('reconcile_rating_aggregates', '30件中 0件の評価集計値がずれています'),
+        ):
+            out = io.StringIO()
+            call_command(command, '--dry-run', stdout=out)
+            self.assertIn(message, out.getvalue())
+
+
+class BenchmarkSummaryTests(SimpleTestCase):
+    """ベンチマーク結果の集計とベースラインとの比較を確認する"""
+
+    def result(self, p95=10.0, queries=3, status=None):
+        return {
+            'latency_ms': {'p95': p95},
+            'queries': {'max': queries},
+            'bytes': {'mean': 100.0},
+            'status': status or {'200': 10},
+        }
+
+    def test_percentile_interpolates_between_values(self):
+        values = [1.0, 2.0, 3.0, 4.0, 5.0]
+        self.assertEqual(percentile(values, 50), 3.0)
+        self.assertEqual(percentile(values, 95), 4.8)
+        self.assertEqual(percentile(values, 100), 5.0)
+        self.assertEqual(percentile([7.0], 99), 7.0)
+
+    def test_summarize(self):
+        summary = summarize({
+            'method': 'GET',
+            'route': '/api/recipes/',
+            'latencies': [4.0, 1.0, 3.0, 2.0],
+            'queries': [3, 5, 3, 3],
+            'bytes': [100, 300, 100, 100],
+            'statuses': {404: 1, 200: 3},
+        })
+        self.assertEqual(summary['iterations'], 4)
+        self.assertEqual(list(summary['status'].items()), [('200', 3), ('404', 1)])
+        self.assertEqual(summary['latency_ms']['p50'], 2.5)
+        self.assertEqual(summary['latency_ms']['max'], 4.0)
+        self.assertEqual(summary['latency_ms']['mean'], 2.5)
+        self.assertEqual(summary['queries'], {'min': 3, 'max': 5, 'mean': 3.5})
+        self.assertEqual(summary['bytes'], {'mean': 150.0, 'max': 300})
+
+    def test_compare_flags_slower_and_more_queries(self):
+        baseline = {'results': {'fast': self.result(), 'slow': self.result(), 'queries': self.result()}}
+        results = {'results': {
+            'fast': self.result(p95=11.0),
+            'slow': self.result(p95=13.0),
+            'queries': self.result(queries=4),
+            'added': self.result(),
+        }}
+        rows = {row['name']: row for row in compare(results, baseline, threshold=0.2)}
+        self.assertFalse(rows['fast']['regression'])
+        self.assertEqual(rows['fast']['p95_change'], 0.1)
+        self.assertTrue(rows['slow']['regression'])
+        self.assertTrue(rows['queries']['regression'])
+        self.assertTrue(rows['added']['new'])
+        self.assertFalse(rows['added']['regression'])
+
+    def test_compare_flags_status_change(self):
+        baseline = {'results': {'recipe_detail': self.result(status={'200': 10})}}
+        results = {'results': {'recipe_detail': self.result(status={'200': 8, '500': 2})}}
+        row, = compare(results, baseline)
+        self.assertTrue(row['status_changed'])
+        self.assertTrue(row['regression'])
+        self.assertEqual(row['baseline_status'], ['200'])
+        self.assertEqual(row['status'], ['200', '500'])
+
+        # 実行回数による件数の違いは回帰としない
+        results = {'results': {'recipe_detail': self.result(status={'200': 50})}}
+        row, = compare(results, baseline)
+        self.assertFalse(row['regression'])
+
+    def test_compare_flags_missing_endpoints(self):
+        baseline = {'results': {'recipe_list': self.result(), 'recipe_detail': self.result()}}
+        results = {'results': {'recipe_list': self.result()}}
+        rows = {row['name']: row for row in compare(results, baseline)}
+        self.assertTrue(rows['recipe_detail']['missing'])
+        self.assertTrue(rows['recipe_detail']['regression'])
+
+        # --only で対象外にしたエンドポイントは回帰としない
+        results['meta'] = {'only': ['recipe_list*']}
+        self.assertEqual([row['name'] for row in compare(results, baseline)], ['recipe_list'])
@@ -12,13 +12,18 @@ urlpatterns = [
     path('recipes/', views.RecipeListView.as_view(), name='recipe-list'),
     path('recipes/<int:pk>/', views.RecipeDetailView.as_view(), name='recipe-detail'),
     path('recipes/my/', views.MyRecipeListView.as_view(), name='my-recipe-list'),
+    path('recipes/export/', views.export_recipes, name='recipe-export'),
+    path('recipes/import/', views.import_recipes, name='recipe-import'),
+    path('recipes/cookable/', views.cookable_recipes, name='recipe-cookable'),
     
     # お気に入り関連
     path('favorites/', views.FavoriteRecipeListView.as_view(), name='favorite-list'),
+    path('favorites/batch/', views.batch_favorites, name='favorite-batch'),
     path('recipes/<int:recipe_id>/favorite/', views.toggle_favorite, name='toggle-favorite'),
     
     # 評価関連
     path('recipes/<int:recipe_id>/rating/', views.recipe_rating, name='recipe-rating'),
+    path('recipes/<int:recipe_id>/similar/', views.similar_recipes, name='recipe-similar'),
     
     # 統計
     path('stats/', views.recipe_stats, name='recipe-stats'),
@@ -2,16 +2,70 @@ from rest_framework import generics, permissions, status, filters
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.contrib.auth.models import User
-from django.db import models
-from .models import Category, Recipe, Ingredient, Step, RecipeFavorite, RecipeRating
+from django.db import models, transaction
+from django.db.models import F
+import json
+from .models import Category, Recipe, Ingredient, Step, RecipeFavorite, RecipeRating, RecipeSimilarity
+from .conditional import ConditionalGetMixin, recipe_version
+from .facets import FacetsMixin
+from .favorites import apply_favorite_operations, invalidate_favorite_ids, lock_favorites
+from .filters import RecipeFilter
+from .ndjson import export_ndjson, import_ndjson
+from .pagination import RecipeFeedPagination
+from .pantry import get_index, load_inventory, normalize_terms
+from .representations import RepresentationCacheMixin, invalidate_representations
+from .search import RecipeSearchFilter
+from .similarity import TOP_K, ingredient_term
+from .stats import get_recipe_stats
 from .serializers import (
     CategorySerializer, RecipeListSerializer, RecipeDetailSerializer,
-    RecipeCreateSerializer, RecipeFavoriteSerializer, RecipeRatingSerializer
+    RecipeCreateSerializer, RecipeFavoriteSerializer, RecipeRatingSerializer,
+    FavoriteBatchSerializer, RecipeSimilaritySerializer, CookableQuerySerializer, parse_field_list
 )
 
 
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+
+class EagerLoadingViewMixin:
+    """シリアライザーが宣言した関連をクエリセットに適用するビュー用Mixin
+
+    一覧・詳細の両方で通る filter_queryset() に差し込むため、
+    各ビューが get_queryset() を上書きしていても適用される。
+    defer_prefetch を立てると prefetch は行わず、後から prefetch_instances() で適用する。
+    ?fields= / ?expand= の指定はシリアライザーの context にも渡す。
+    """
+    defer_prefetch = False
+
+    def get_sparse_fields(self):
+        """?fields= / ?expand= の指定（未指定は None）"""
+        params = self.request.query_params
+        return parse_field_list(params.get('fields')), parse_field_list(params.get('expand'))
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'], context['expand'] = self.get_sparse_fields()
+        return context
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        serializer_class = self.get_serializer_class()
+        if hasattr(serializer_class, 'setup_eager_loading'):
+            fields, expand = self.get_sparse_fields()
+            queryset = serializer_class.setup_eager_loading(
+                queryset, prefetch=not self.defer_prefetch, fields=fields, expand=expand
+            )
+        return queryset
+
+    def prefetch_instances(self, instances):
+        serializer_class = self.get_serializer_class()
+        if hasattr(serializer_class, 'prefetch_instances'):
+            fields, expand = self.get_sparse_fields()
+            serializer_class.prefetch_instances(instances, fields=fields, expand=expand)
+
+
 class CategoryListView(generics.ListCreateAPIView):
     """カテゴリ一覧・作成API"""
     queryset = Category.objects.all()
@@ -26,15 +80,15 @@ class CategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
 
-class RecipeListView(generics.ListCreateAPIView):
-    """レシピ一覧・作成API"""
+class RecipeListView(FacetsMixin, RepresentationCacheMixin, ConditionalGetMixin, EagerLoadingViewMixin, generics.ListCreateAPIView):
+    """レシピ一覧・作成API（ページ付きの一覧には絞り込み条件ごとの件数 facets を含む）"""
     queryset = Recipe.objects.filter(is_public=True)
     serializer_class = RecipeListSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['category', 'difficulty', 'author']
-    search_fields = ['title', 'description']
-    ordering_fields = ['created_at', 'cooking_time', 'favorite_count']
+    pagination_class = RecipeFeedPagination
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, RecipeSearchFilter]
+    filterset_class = RecipeFilter
+    ordering_fields = ['created_at', 'cooking_time', 'favorite_count', 'rating_avg', 'rating_count']
     ordering = ['-created_at']
 
     def get_serializer_class(self):
@@ -42,11 +96,17 @@ class RecipeListView(generics.ListCreateAPIView):
             return RecipeCreateSerializer
         return RecipeListSerializer
 
+    def get_serializer(self, *args, **kwargs):
+        # 配列でPOSTされた場合は一括作成として扱う
+        if isinstance(kwargs.get('data'), list):
+            kwargs['many'] = True
+        return super().get_serializer(*args, **kwargs)
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
 
-class RecipeDetailView(generics.RetrieveUpdateDestroyAPIView):
+class RecipeDetailView(RepresentationCacheMixin, ConditionalGetMixin, EagerLoadingViewMixin, generics.RetrieveUpdateDestroyAPIView):
     """レシピ詳細・更新・削除API"""
     queryset = Recipe.objects.all()
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
@@ -65,23 +125,31 @@ class RecipeDetailView(generics.RetrieveUpdateDestroyAPIView):
         return Recipe.objects.filter(is_public=True)
 
 
-class MyRecipeListView(generics.ListAPIView):
+class MyRecipeListView(RepresentationCacheMixin, ConditionalGetMixin, EagerLoadingViewMixin, generics.ListAPIView):
     """自分のレシピ一覧API"""
     serializer_class = RecipeListSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = RecipeFeedPagination
 
     def get_queryset(self):
         return Recipe.objects.filter(author=self.request.user)
 
 
-class FavoriteRecipeListView(generics.ListAPIView):
+class FavoriteRecipeListView(ConditionalGetMixin, EagerLoadingViewMixin, generics.ListAPIView):
     """お気に入りレシピ一覧API"""
     serializer_class = RecipeFavoriteSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = RecipeFeedPagination
 
     def get_queryset(self):
         return RecipeFavorite.objects.filter(user=self.request.user)
 
+    def get_version(self, favorite):
+        return favorite.pk, favorite.created_at.isoformat(), recipe_version(favorite.recipe)
+
+    def get_last_modified(self, favorite):
+        return max(favorite.created_at, favorite.recipe.updated_at)
+
 
 @api_view(['POST', 'DELETE'])
 @permission_classes([permissions.IsAuthenticated])
@@ -90,42 +158,75 @@ def toggle_favorite(request, recipe_id):
     recipe = get_object_or_404(Recipe, id=recipe_id)
     
     if request.method == 'POST':
-        favorite, created = RecipeFavorite.objects.get_or_create(
-            user=request.user, recipe=recipe
-        )
+        with transaction.atomic():
+            lock_favorites(request.user)
+            favorite, created = RecipeFavorite.objects.get_or_create(
+                user=request.user, recipe=recipe
+            )
+            if created:
+                # お気に入り数をDB側で加算（同時更新でも取りこぼさない）
+                Recipe.objects.filter(id=recipe.id).update(
+                    favorite_count=F('favorite_count') + 1
+                )
+                invalidate_favorite_ids(request.user.id)
+                invalidate_representations(recipe.id)
         if created:
             return Response({'message': 'お気に入りに追加しました'}, status=status.HTTP_201_CREATED)
         else:
             return Response({'message': '既にお気に入りに登録済みです'}, status=status.HTTP_200_OK)
     
     elif request.method == 'DELETE':
-        try:
-            favorite = RecipeFavorite.objects.get(user=request.user, recipe=recipe)
-            favorite.delete()
+        with transaction.atomic():
+            lock_favorites(request.user)
+            deleted, _ = RecipeFavorite.objects.filter(user=request.user, recipe=recipe).delete()
+            if deleted:
+                Recipe.objects.filter(id=recipe.id, favorite_count__gt=0).update(
+                    favorite_count=F('favorite_count') - 1
+                )
+                invalidate_favorite_ids(request.user.id)
+                invalidate_representations(recipe.id)
+        if deleted:
             return Response({'message': 'お気に入りから削除しました'}, status=status.HTTP_200_OK)
-        except RecipeFavorite.DoesNotExist:
-            return Response({'message': 'お気に入りに登録されていません'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'message': 'お気に入りに登録されていません'}, status=status.HTTP_404_NOT_FOUND)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def batch_favorites(request):
+    """お気に入り一括追加・削除API（オフライン中の操作の再送用）"""
+    serializer = FavoriteBatchSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    results = apply_favorite_operations(request.user, serializer.validated_data['operations'])
+    return Response({'results': results}, status=status.HTTP_200_OK)
 
 
 @api_view(['POST', 'PUT', 'DELETE'])
 @permission_classes([permissions.IsAuthenticated])
+@transaction.atomic
 def recipe_rating(request, recipe_id):
-    """レシピ評価API"""
-    recipe = get_object_or_404(Recipe, id=recipe_id)
+    """レシピ評価API（評価の集計値も同じトランザクションで更新）"""
+    # 集計値を正しく更新するため、レシピ行をロックしてから評価を変更する
+    recipe = get_object_or_404(Recipe.objects.select_for_update(), id=recipe_id)
     
     if request.method == 'POST':
         serializer = RecipeRatingSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(user=request.user, recipe=recipe)
+            rating = serializer.save(user=request.user, recipe=recipe)
+            recipe.apply_rating_change(added=rating.rating)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     elif request.method == 'PUT':
         try:
             rating = RecipeRating.objects.get(user=request.user, recipe=recipe)
+            previous = rating.rating
             serializer = RecipeRatingSerializer(rating, data=request.data, partial=True)
             if serializer.is_valid():
                 serializer.save()
+                if rating.rating != previous:
+                    recipe.apply_rating_change(added=rating.rating, removed=previous)
                 return Response(serializer.data)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except RecipeRating.DoesNotExist:
@@ -135,22 +236,129 @@ def recipe_rating(request, recipe_id):
         try:
             rating = RecipeRating.objects.get(user=request.user, recipe=recipe)
             rating.delete()
+            recipe.apply_rating_change(removed=rating.rating)
             return Response({'message': '評価を削除しました'}, status=status.HTTP_200_OK)
         except RecipeRating.DoesNotExist:
             return Response({'message': '評価が見つかりません'}, status=status.HTTP_404_NOT_FOUND)
 
 
 @api_view(['GET'])
-def recipe_stats(request):
-    """レシピ統計API"""
-    stats = {
-        'total_recipes': Recipe.objects.filter(is_public=True).count(),
-        'total_categories': Category.objects.count(),
-        'total_users': User.objects.count(),
-        'recent_recipes': RecipeListSerializer(
-            Recipe.objects.filter(is_public=True)[:5], 
-            many=True, 
-            context={'request': request}
-        ).data
+@permission_classes([permissions.IsAuthenticated])
+def export_recipes(request):
+    """レシピ一括エクスポートAPI（NDJSONをストリーミングで返す）"""
+    queryset = Recipe.objects.filter(
+        models.Q(author=request.user) | models.Q(is_public=True)
+    )
+    response = StreamingHttpResponse(export_ndjson(queryset), content_type=NDJSON_CONTENT_TYPE)
+    response['Content-Disposition'] = 'attachment; filename="recipes.ndjson"'
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAdminUser])
+def import_recipes(request):
+    """レシピ一括インポートAPI
+
+    リクエストボディのNDJSONを1行ずつ読み込んでチャンクごとに登録し、
+    進捗をNDJSONでストリーミングして返す。書き込みはチャンクごとのトランザクションで
+    コミットしてから進捗を返すため、途中で失敗しても報告済みのチャンクは登録済みになる。
+    """
+    def progress_lines():
+        for progress in import_ndjson(request.stream or [], request.user):
+            yield (json.dumps(progress, ensure_ascii=False) + '\n').encode('utf-8')
+
+    return StreamingHttpResponse(progress_lines(), content_type=NDJSON_CONTENT_TYPE)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticatedOrReadOnly])
+def similar_recipes(request, recipe_id):
+    """類似レシピAPI（材料の重なりから事前計算した上位k件）"""
+    visible = models.Q(is_public=True)
+    if request.user.is_authenticated:
+        visible |= models.Q(author=request.user)
+    recipe = get_object_or_404(Recipe.objects.filter(visible), id=recipe_id)
+
+    try:
+        limit = min(int(request.query_params.get('limit', TOP_K)), TOP_K)
+    except ValueError:
+        return Response({'message': 'limit は整数で指定してください'}, status=status.HTTP_400_BAD_REQUEST)
+
+    similarities = RecipeSimilaritySerializer.setup_eager_loading(
+        RecipeSimilarity.objects.filter(recipe=recipe, similar_recipe__is_public=True)
+    )[:max(limit, 0)]
+    serializer = RecipeSimilaritySerializer(similarities, many=True, context={'request': request})
+    return Response({'results': serializer.data})
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticatedOrReadOnly])
+def cookable_recipes(request):
+    """手持ちの材料で作れるレシピAPI
+
+    ?ingredients=玉ねぎ,卵（複数指定・繰り返し可）と、?use_inventory=true で
+    在庫（apps.ingredients）の材料を手持ちとし、足りない材料が少ない順に返す。
+    ?max_missing= で足りない材料の数の上限、?limit= で件数を指定できる。
+    """
+    params = request.query_params
+    data = {
+        key: params[key] for key in ('use_inventory', 'limit', 'max_missing') if key in params
+    }
+    data['ingredients'] = [
+        name.strip() for value in params.getlist('ingredients') for name in value.split(',')
+        if name.strip()
+    ]
+    serializer = CookableQuerySerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+    query = serializer.validated_data
+
+    names = list(query['ingredients'])
+    if query['use_inventory']:
+        if not request.user.is_authenticated:
+            return Response({'message': '在庫を使うにはログインが必要です'}, status=status.HTTP_401_UNAUTHORIZED)
+        inventory = load_inventory(request.user)
+        if inventory is None:
+            return Response({'message': '在庫機能は利用できません'}, status=status.HTTP_400_BAD_REQUEST)
+        names += inventory
+    terms = normalize_terms(names)
+    if not terms:
+        return Response({'message': '材料を指定してください'}, status=status.HTTP_400_BAD_REQUEST)
+
+    matches = get_index().search(terms, query['limit'], query.get('max_missing'))
+    recipe_ids = [recipe_id for recipe_id, _, _ in matches]
+    recipes = {
+        recipe.id: recipe for recipe in RecipeListSerializer.setup_eager_loading(
+            Recipe.objects.filter(id__in=recipe_ids, is_public=True)
+        )
     }
-    return Response(stats)
+    # インデックスの更新前に非公開・削除になったレシピは除く
+    matches = [match for match in matches if match[0] in recipes]
+
+    # 足りない材料の名前（表記揺れで同じ材料が複数行ある場合は最初の行の名前）
+    missing = {recipe_id: {} for recipe_id, _, _ in matches}
+    rows = Ingredient.objects.filter(recipe_id__in=list(missing)).order_by('recipe_id', 'order', 'id')
+    for recipe_id, name in rows.values_list('recipe_id', 'name'):
+        term = ingredient_term(name)
+        if term and term not in terms:
+            missing[recipe_id].setdefault(term, name)
+
+    serialized = RecipeListSerializer(
+        [recipes[recipe_id] for recipe_id, _, _ in matches], many=True, context={'request': request}
+    ).data
+    results = [
+        {
+            'recipe': item,
+            'matched_count': matched,
+            'missing_count': missing_count,
+            'coverage': round(matched / (matched + missing_count), 3),
+            'missing_ingredients': list(missing[recipe_id].values()),
+        }
+        for item, (recipe_id, matched, missing_count) in zip(serialized, matches)
+    ]
+    return Response({'ingredients': sorted(set(names)), 'results': results})
+
+
+@api_view(['GET'])
+def recipe_stats(request):
+    """レシピ統計API（件数・最近のレシピはキャッシュから返す）"""
+    return Response(get_recipe_stats(request))
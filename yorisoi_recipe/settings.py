@@ -60,7 +60,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'accounts.middleware.SessionRefreshMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -148,6 +148,20 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# レシピ画像の派生ファイル（サムネイル）生成
+# False にするとコミット直後にリクエスト内で生成する（テスト・コマンド向け）
+RECIPE_IMAGE_BACKGROUND = True
+# 元画像の長辺の上限（px）。超える画像は派生ファイル生成時に縮小して上書きする（None で無効）
+RECIPE_IMAGE_ORIGINAL_MAX_SIZE = 2048
+
+# 類似レシピ（材料の重なり）の類似度: 'cosine' または 'jaccard'
+RECIPE_SIMILARITY_METRIC = 'cosine'
+# False にするとコミット直後にリクエスト内で更新する（テスト・コマンド向け）
+RECIPE_SIMILARITY_BACKGROUND = True
+
+# テスト中はバックグラウンドでの更新を無効にする（yorisoi_recipe/test_runner.py）
+TEST_RUNNER = 'yorisoi_recipe.test_runner.TestRunner'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -156,6 +170,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'accounts.authentication.AccessTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -169,6 +184,23 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20,
 }
 
+# キャッシュ設定（REDIS_URL を指定すると複数プロセスで共有できるRedisを使う）
+REDIS_URL = os.getenv('REDIS_URL', '')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'yorisoi-recipe',
+        }
+    }
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -193,7 +225,30 @@ LOGOUT_REDIRECT_URL = '/'
 
 # セッション設定
 SESSION_COOKIE_AGE = 86400  # 24時間
-SESSION_SAVE_EVERY_REQUEST = True
+# 共有キャッシュがあればキャッシュ優先・DBフォールバック、なければDBのセッション
+# （プロセスごとのキャッシュでは、ログアウトが他のプロセスに反映されないため）
+SESSION_ENGINE = 'accounts.sessions.cached_db' if REDIS_URL else 'accounts.sessions.db'
+# リクエストごとには保存せず、残りの有効期限がこの秒数を下回ったときだけ延長する
+# （書き込みは最大で1時間に1回。スライド式の有効期限は1時間以内の誤差で保たれる）
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_REFRESH_THRESHOLD = SESSION_COOKIE_AGE - 60 * 60
+
+# モバイルAPI向けトークンの有効期限（秒）
+ACCESS_TOKEN_LIFETIME = 60 * 15  # 15分
+REFRESH_TOKEN_LIFETIME = 60 * 60 * 24 * 14  # 14日
+
+# トークンの失効の記録・ログイン試行の件数を共有キャッシュに置くことを必須にする（accounts.E002）
+ACCOUNTS_REQUIRE_SHARED_CACHE = not DEBUG
+
+# ログイン試行の上限（ip: IPアドレスごとの試行、username: ユーザー名ごとの失敗）
+# 件数はキャッシュで数えるため、共有キャッシュでない場合はプロセスごとの上限になる
+LOGIN_THROTTLE_RATES = {
+    'ip': '20/min',
+    'username': '5/min',
+}
+# ログイン試行のIPアドレスに X-Forwarded-For を使う場合の、信頼するリバースプロキシの段数
+# （0 なら REMOTE_ADDR を使う。プロキシを通さない構成で指定するとIPごとの上限を回避される）
+LOGIN_THROTTLE_NUM_PROXIES = int(os.getenv('LOGIN_THROTTLE_NUM_PROXIES', '0'))
 
 # 通知設定（Firebase Cloud Messaging等）
 FCM_SERVER_KEY = os.getenv('FCM_SERVER_KEY', '')
@@ -0,0 +1,23 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """テスト用のランナー
+
+    類似レシピ・画像の派生ファイルをバックグラウンドのスレッドで更新すると、
+    他のテストの実行中にテスト用DBへ書き込んでしまうため、テスト全体を通して
+    コミット直後にその場で更新する。
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._background_override = override_settings(
+            RECIPE_SIMILARITY_BACKGROUND=False,
+            RECIPE_IMAGE_BACKGROUND=False,
+        )
+        self._background_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._background_override.disable()
+        super().teardown_test_environment(**kwargs)